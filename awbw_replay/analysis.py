@@ -0,0 +1,117 @@
+"""
+Pluggable analyses of replays, run together in a single pass over the actions.
+
+Each Analyzer declares what it needs:
+- Needs.ACTIONS: only the AWBWGameAction
+- Needs.STATE: also the game state after the action
+- Needs.DELTAS: also the StateDelta of the changes made by the action
+
+Game states are only built if at least one analyzer needs them, so analyses of
+actions alone don't pay for applying the actions, and use constant memory.
+
+Usage:
+
+class FireCount(Analyzer):
+    NEEDS = Needs.ACTIONS
+
+    def __init__(self):
+        self.fires = 0
+
+    def on_action(self, action, state, delta):
+        if action.type == AWBWGameAction.Type.FIRE:
+            self.fires += 1
+
+    def merge(self, other):
+        self.fires += other.fires
+
+fire_count = FireCount()
+with AWBWReplay("52963.zip") as replay:
+    run_analyzers(replay, [fire_count])
+"""
+
+import enum
+
+from awbw_replay.awbw import AWBWGameAction, AWBWReplayCursor
+
+class Needs(enum.IntEnum):
+    """What an Analyzer needs for each action, from cheapest to most expensive"""
+    ACTIONS = 0
+    STATE = 1
+    DELTAS = 2
+
+class Analyzer():
+    """
+    Base class of an analysis. The results of one or more replays are kept on
+    the analyzer, and merge() combines analyzers that ran on other replays,
+    e.g. in other processes, so analyzers should be picklable.
+    """
+
+    NEEDS = Needs.ACTIONS
+
+    def start(self, game_info):
+        """
+        Called before the first action of each replay.
+
+        Arguments:
+        - game_info: The replay's game_info()
+        """
+
+    def on_action(self, action, state, delta):
+        """
+        Called for each action of the replay, in order.
+
+        Arguments:
+        - action: The AWBWGameAction
+        - state: The game state after the action, or None for Needs.ACTIONS.
+          It is modified in place by the next action, so use
+          AWBWGameState.apply_deltas or copy what needs to be kept.
+        - delta: The StateDelta of the action, or None unless Needs.DELTAS
+        """
+        raise NotImplementedError
+
+    def finish(self):
+        """Called after the last action of each replay"""
+
+    def merge(self, other):
+        """Adds the results of another analyzer of the same type into this one"""
+        raise NotImplementedError
+
+def run_analyzers(replay, analyzers):
+    """
+    Runs analyzers over every action of a replay in one pass.
+
+    If an action fails to apply, the exception is raised, and the analyzers
+    keep the results of the earlier actions. finish() is not called.
+
+    Arguments:
+    - replay: An open AWBWReplay
+    - analyzers: List of Analyzer
+
+    Returns:
+    - The number of actions analyzed
+    """
+    needs = max((analyzer.NEEDS for analyzer in analyzers), default=Needs.ACTIONS)
+    game_info = replay.game_info()
+    for analyzer in analyzers:
+        analyzer.start(game_info)
+
+    cursor = AWBWReplayCursor(replay_initial=game_info) if needs > Needs.ACTIONS else None
+    state = None
+    delta = None
+    num_actions = 0
+    for replay_action in replay.actions():
+        action = AWBWGameAction(replay_action)
+        if cursor is not None:
+            delta = cursor.apply_action(action)
+            state = cursor.state
+        for analyzer in analyzers:
+            # Only hand over what the analyzer declared, so a missing NEEDS
+            # fails the same whatever the other analyzers are
+            analyzer.on_action(action,
+                               state if analyzer.NEEDS >= Needs.STATE else None,
+                               delta if analyzer.NEEDS >= Needs.DELTAS else None)
+        num_actions += 1
+
+    for analyzer in analyzers:
+        analyzer.finish()
+    return num_actions
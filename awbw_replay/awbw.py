@@ -1,14 +1,18 @@
 """Classes specific to AWBW Game States and Actions"""
 
 import logging
+import math
+import typing
 from enum import Enum
-from copy import deepcopy
+from copy import copy, deepcopy
 
-from awbw_replay import game
+from awbw_replay import game, profiling
 
-class GameInfo(game.DefaultDict):
+class GameInfo(game.Record):
     """Stores general information about the game"""
 
+    __slots__ = ()
+
     ALLOWED_DATA = {
         "games_id": 0,
         "active_player_id": 0,
@@ -16,11 +20,15 @@ class GameInfo(game.DefaultDict):
         "turn": 0,
         "day": 0,
         "game_over": False,
+        # Funds each owned property earns at the start of a turn
+        "funds_per_property": 1000,
     }
 
-class Player(game.DefaultDict):
+class Player(game.Record):
     """Stores per player information."""
 
+    __slots__ = ()
+
     ALLOWED_DATA = {
         "id": 0,
         "team": "",
@@ -36,9 +44,11 @@ class Player(game.DefaultDict):
         "funds": 0,
     }
 
-class Unit(game.DefaultDict):
+class Unit(game.Record):
     """Stores per unit information."""
 
+    __slots__ = ()
+
     ALLOWED_DATA = {
         "id": 0,
         "players_id": 0,
@@ -66,16 +76,17 @@ class Unit(game.DefaultDict):
         "carried": False,
     }
 
-class Building(game.DefaultDict):
+class Building(game.Record):
     """Stores per building information."""
 
+    __slots__ = ()
+
     ALLOWED_DATA = {
         "id": 0,
         "last_capture": 20,
         "capture": 20,
         # Corresponds to a terrain type, which includes the information about which
-        # country owns the building.
-        # TODO": Reverse lookup the terrain ID to determine which player owns the property
+        # country owns the building (see _TERRAIN_COUNTRY_IDS).
         # TODO": Reverse lookup the terrain ID to determine what type of property this is
         "terrain_id": 0,
         "x": 0,
@@ -85,6 +96,61 @@ class Building(game.DefaultDict):
         "team": "",
     }
 
+class PlayerStats(game.Record):
+    """Stores running per player totals, kept up to date as actions are applied."""
+
+    __slots__ = ()
+
+    ALLOWED_DATA = {
+        "units": 0,
+        "unit_value": 0,
+        # Unit value scaled by hit points, so a unit at 5/10 counts for half its cost
+        "hp_value": 0.0,
+        "properties": 0,
+        "income": 0,
+    }
+
+# AWBW country ID -> terrain IDs of the country's City, Base, Airport, Port and HQ,
+# which give funds every turn
+_COUNTRY_FUNDS_TERRAIN_IDS = {
+    1: range(38, 43), # Orange Star
+    2: range(43, 48), # Blue Moon
+    3: range(48, 53), # Green Earth
+    4: range(53, 58), # Yellow Comet
+    5: range(91, 96), # Black Hole
+    6: range(81, 86), # Red Fire
+    7: range(86, 91), # Grey Sky
+    8: range(96, 101), # Brown Desert
+    9: range(117, 122), # Amber Blaze
+    10: range(122, 127), # Jade Sun
+}
+
+# AWBW country ID -> terrain IDs of the country's Com Tower and Lab, which don't give funds
+_COUNTRY_OTHER_TERRAIN_IDS = {
+    1: (134, 146),
+    2: (129, 140),
+    3: (131, 142),
+    4: (136, 148),
+    5: (128, 139),
+    6: (135, 147),
+    7: (137, 143),
+    8: (130, 141),
+    9: (127, 138),
+    10: (132, 144),
+}
+
+# Terrain ID -> AWBW country ID of the owner, for the owned properties above. Buildings of
+# other countries' terrain are treated as neutral until they're captured, with a warning.
+_TERRAIN_COUNTRY_IDS = {
+    terrain_id: country_id
+    for country_terrain_ids in (_COUNTRY_FUNDS_TERRAIN_IDS, _COUNTRY_OTHER_TERRAIN_IDS)
+    for country_id, terrain_ids in country_terrain_ids.items()
+    for terrain_id in terrain_ids
+}
+
+_NO_FUNDS_TERRAIN_IDS = frozenset(
+    terrain_id for terrain_ids in _COUNTRY_OTHER_TERRAIN_IDS.values() for terrain_id in terrain_ids)
+
 # Derived classes for AWBW
 
 class AWBWGameAction(game.GameAction):
@@ -119,11 +185,228 @@ class AWBWGameAction(game.GameAction):
         self.type = self.Type(replay_action["action"])
         self.info = replay_action
 
+class StateDelta(typing.NamedTuple):
+    """
+    The changes a single action made to an AWBWGameState.
+
+    Changed entries only contain the fields whose values changed, mapped to
+    their new values.
+    """
+    # Unit ID -> dict of every field of the new unit
+    units_created: typing.Dict[int, typing.Dict]
+    # Unit ID -> dict of changed fields
+    units_changed: typing.Dict[int, typing.Dict]
+    units_removed: typing.List[int]
+    # Player ID -> dict of changed fields
+    players_changed: typing.Dict[int, typing.Dict]
+    # Building ID -> dict of changed fields
+    buildings_changed: typing.Dict[int, typing.Dict]
+    # dict of changed GameInfo fields
+    game_info_changed: typing.Dict
+
+def _changed_fields(before, after):
+    """Returns the fields of after which are missing from or different in before"""
+    return {k: v for k, v in after.items() if k not in before or before[k] != v}
+
+def _add_unit_stats(player_stats, unit, sign):
+    """Adds (sign=1) or removes (sign=-1) a unit's contribution to player_stats"""
+    # Destroyed and joined units are kept with 0 hit points, but no longer count
+    if unit["hit_points"] <= 0:
+        return
+    stats = player_stats.get(unit["players_id"])
+    if stats is None:
+        stats = player_stats[unit["players_id"]] = PlayerStats()
+    stats["units"] += sign
+    stats["unit_value"] += sign * unit["cost"]
+    stats["hp_value"] += sign * unit["cost"] * unit["hit_points"] / 10
+
+def _add_building_stats(player_stats, building, sign, funds_per_property):
+    """Adds (sign=1) or removes (sign=-1) a building's contribution to player_stats"""
+    if not building["players_id"]:
+        return
+    stats = player_stats.get(building["players_id"])
+    if stats is None:
+        stats = player_stats[building["players_id"]] = PlayerStats()
+    stats["properties"] += sign
+    if building["terrain_id"] not in _NO_FUNDS_TERRAIN_IDS:
+        stats["income"] += sign * funds_per_property
+
+class _Transition():
+    """
+    A copy-on-write view of an AWBWGameState, used by the apply functions to
+    build the next state.
+
+    The players, units and buildings dicts are only copied the first time one
+    of their entries changes, and each entry is only copied the first time it is
+    written to through player(), unit() or building(). Everything else is shared
+    with the previous state, which is left untouched.
+
+    In place transitions modify the state directly instead, keeping a copy of
+    each entry before it is first written to so the changes can be reported
+    with delta().
+    """
+
+    _COLLECTIONS = ("players", "units", "buildings")
+
+    def __init__(self, state, in_place=False):
+        self._state = state
+        self._in_place = in_place
+        self.game_map = state.game_map
+        self.game_info = state.game_info
+        self.players = state.players
+        self.units = state.units
+        self.buildings = state.buildings
+        # Collection name -> key -> the entry before it was first written to,
+        # or None if it didn't exist
+        self._before = {name: {} for name in self._COLLECTIONS}
+        self._copied = set()
+        self._game_info_before = None
+        self._player_stats_before = state.player_stats
+
+    def _collection(self, name):
+        """Returns the named collection, copying it on first use"""
+        if not self._in_place and name not in self._copied:
+            setattr(self, name, dict(getattr(self, name)))
+            self._copied.add(name)
+        return getattr(self, name)
+
+    def _entry(self, name, key):
+        """Returns a writable entry of the named collection, copying it on first use"""
+        collection = self._collection(name)
+        before = self._before[name]
+        if key not in before:
+            if self._in_place:
+                before[key] = copy(collection[key])
+            else:
+                before[key] = collection[key]
+                collection[key] = copy(collection[key])
+        return collection[key]
+
+    def player(self, p_id):
+        """Returns the writable Player for p_id"""
+        return self._entry("players", p_id)
+
+    def unit(self, u_id):
+        """Returns the writable Unit for u_id"""
+        return self._entry("units", u_id)
+
+    def building(self, b_id):
+        """Returns the writable Building for b_id"""
+        return self._entry("buildings", b_id)
+
+    def set_unit(self, u_id, unit):
+        """Adds or replaces the unit for u_id"""
+        units = self._collection("units")
+        if u_id not in self._before["units"]:
+            self._before["units"][u_id] = units.get(u_id)
+        units[u_id] = unit
+
+    def remove_unit(self, u_id):
+        """Removes the unit for u_id"""
+        units = self._collection("units")
+        if u_id not in self._before["units"]:
+            self._before["units"][u_id] = units[u_id]
+        del units[u_id]
+
+    def writable_game_info(self):
+        """Returns the writable GameInfo"""
+        if self._game_info_before is None:
+            if self._in_place:
+                self._game_info_before = copy(self.game_info)
+            else:
+                self._game_info_before = self.game_info
+                self.game_info = copy(self.game_info)
+        return self.game_info
+
+    def _player_stats(self):
+        """
+        Returns the player stats after the changes of this transition, by only
+        updating the totals for the entries that were written to.
+
+        The stats are always rebuilt from the ones before the transition, so
+        committing more than once doesn't count changes twice.
+        """
+        player_stats = {p_id: copy(stats) for p_id, stats in self._player_stats_before.items()}
+        for u_id, before in self._before["units"].items():
+            after = self.units.get(u_id)
+            if before is not None:
+                _add_unit_stats(player_stats, before, -1)
+            if after is not None:
+                _add_unit_stats(player_stats, after, 1)
+        funds_per_property = self.game_info["funds_per_property"]
+        for b_id, before in self._before["buildings"].items():
+            _add_building_stats(player_stats, before, -1, funds_per_property)
+            _add_building_stats(player_stats, self.buildings[b_id], 1, funds_per_property)
+        return player_stats
+
+    def commit(self):
+        """Returns the new AWBWGameState, or the modified state for in place transitions"""
+        player_stats = self._player_stats()
+        if self._in_place:
+            state = self._state
+            state.player_stats = player_stats
+        else:
+            state = AWBWGameState._from_components( # pylint: disable=protected-access
+                    game_map=self.game_map,
+                    players=self.players,
+                    units=self.units,
+                    buildings=self.buildings,
+                    game_info=self.game_info,
+                    player_stats=player_stats)
+        if AWBWGameState.CHECK_PLAYER_STATS:
+            state.check_player_stats()
+        return state
+
+    def delta(self):
+        """Returns the StateDelta of every change made through this transition"""
+        units_created = {}
+        units_changed = {}
+        units_removed = []
+        for u_id, before in self._before["units"].items():
+            after = self.units.get(u_id)
+            if after is None:
+                if before is not None:
+                    units_removed.append(u_id)
+            elif before is None:
+                units_created[u_id] = dict(after)
+            else:
+                changes = _changed_fields(before, after)
+                if changes:
+                    units_changed[u_id] = changes
+
+        changed = {}
+        for name in ("players", "buildings"):
+            collection = getattr(self, name)
+            changed[name] = {}
+            for key, before in self._before[name].items():
+                changes = _changed_fields(before, collection[key])
+                if changes:
+                    changed[name][key] = changes
+
+        game_info_changed = {}
+        if self._game_info_before is not None:
+            game_info_changed = _changed_fields(self._game_info_before, self.game_info)
+
+        return StateDelta(
+                units_created=units_created,
+                units_changed=units_changed,
+                units_removed=units_removed,
+                players_changed=changed["players"],
+                buildings_changed=changed["buildings"],
+                game_info_changed=game_info_changed)
+
 class AWBWGameState(game.GameState):
     """
     Represents a single state in the AWBW game.
+
+    player_stats maps each player id to a PlayerStats of running totals over
+    their units and properties, updated from only the entries each action
+    changes. Set CHECK_PLAYER_STATS to True to check them against a full
+    recompute after every action.
     """
 
+    CHECK_PLAYER_STATS = False
+
     def __init__(self,
             game_map=None,
             players=None,
@@ -152,6 +435,55 @@ class AWBWGameState(game.GameState):
             # Overwrite passed in values with info from the replay
             self._construct_from_replay_initial(replay_initial)
 
+        self.player_stats = self.compute_player_stats()
+
+    @classmethod
+    def _from_components(cls, game_map, players, units, buildings, game_info, player_stats):
+        """
+        Constructs a state which shares the given components instead of copying them.
+
+        Only used for states built by a _Transition, where the components are
+        never modified after the state is built.
+        """
+        state = cls.__new__(cls)
+        game.GameState.__init__(state)
+        state.game_map = game_map
+        state.players = players
+        state.units = units
+        state.buildings = buildings
+        state.game_info = game_info
+        state.player_stats = player_stats
+        return state
+
+    def compute_player_stats(self):
+        """
+        Computes the per player totals by scanning every unit and building.
+
+        Returns:
+        - dict of player id -> PlayerStats
+        """
+        player_stats = {p_id: PlayerStats() for p_id in self.players or {}}
+        for unit in (self.units or {}).values():
+            _add_unit_stats(player_stats, unit, 1)
+        funds_per_property = self.game_info["funds_per_property"] if self.game_info else 0
+        for building in (self.buildings or {}).values():
+            _add_building_stats(player_stats, building, 1, funds_per_property)
+        return player_stats
+
+    def check_player_stats(self):
+        """Asserts that the running player_stats match a full recompute"""
+        expected = self.compute_player_stats()
+        actual = self.player_stats
+        assert expected.keys() == actual.keys(), f"Players {set(actual)} != {set(expected)}"
+        for p_id, stats in expected.items():
+            for key, value in stats.items():
+                assert math.isclose(actual[p_id][key], value, abs_tol=1e-6), \
+                    f"Player {p_id} {key} is {actual[p_id][key]}, expected {value}"
+
+    def _transition(self):
+        """Returns the _Transition the apply functions use to build the next state"""
+        return _Transition(self)
+
     def _construct_initial_players(self, replay_initial_players):
         """Helper for just the players info"""
         self.players = {}
@@ -174,7 +506,7 @@ class AWBWGameState(game.GameState):
 
             player_keys_bool = ["co_power_on", "eliminated"]
             for k in player_keys_bool:
-                player_info[k] = (player[k] == "Y")
+                player_info[k] = player[k] == "Y"
             player_info["team"] = player["team"]
             if "A" in player_info["team"] or "B" in player_info["team"]:
                 is_team = True
@@ -225,6 +557,19 @@ class AWBWGameState(game.GameState):
                 building_info[k] = int(building[k])
             self.buildings[building_info["id"]] = Building(**building_info)
 
+    def _assign_initial_building_owners(self):
+        """Helper to set the owner of the buildings owned at the start of the game"""
+        country_players = {player["countries_id"]: p_id for p_id, player in self.players.items()}
+        for player in self.players.values():
+            if player["countries_id"] not in _COUNTRY_FUNDS_TERRAIN_IDS:
+                # TODO: Add the terrain IDs of the later countries
+                logging.warning("Buildings of country %d aren't known, player %d starts without "
+                                "properties", player["countries_id"], player["id"])
+        for building in self.buildings.values():
+            country_id = _TERRAIN_COUNTRY_IDS.get(building["terrain_id"])
+            if country_id in country_players:
+                building["players_id"] = country_players[country_id]
+
     def _construct_initial_game_info(self, replay_initial):
         """Helper for the global game info"""
         game_info_info = {}
@@ -233,6 +578,7 @@ class AWBWGameState(game.GameState):
         game_info_info["active_player_id"] = replay_initial["players"][0]["id"]
         game_info_info["turn"] = 0
         game_info_info["day"] = 1
+        game_info_info["funds_per_property"] = int(replay_initial.get("funds", 1000))
         self.game_info = GameInfo(**game_info_info)
 
     def _construct_from_replay_initial(self, replay_initial):
@@ -240,31 +586,30 @@ class AWBWGameState(game.GameState):
         self._construct_initial_players(replay_initial["players"])
         self._construct_initial_units(replay_initial["units"])
         self._construct_initial_buildings(replay_initial["buildings"])
+        self._assign_initial_building_owners()
         self._construct_initial_game_info(replay_initial)
 
     def _apply_fire_action(self, action_data):
         """
         Helper for fire actions
         """
-        logging.debug("Fire action")
 
         # Unit info
         # - position change
-        move_state = self
+        txn = self._transition()
         if "Move" in action_data and isinstance(action_data["Move"], dict):
-            move_state = self._apply_move_action(action_data["Move"])
+            self._apply_move_action_units(action_data["Move"], txn)
 
         fire_action = action_data["Fire"]
         assert isinstance(fire_action, dict)
 
         # Player info
         # - power meters
-        new_player_info = deepcopy(move_state.players)
         for values in fire_action["copValues"].values():
             p_id = int(values["playerId"])
             # For some reason, the replay data has the co power meter multiplied
             # by a magnitude of 10.
-            new_player_info[p_id]["co_power"] = int(values["copValue"]) / 10
+            txn.player(p_id)["co_power"] = int(values["copValue"]) / 10
 
         # Handle funds change in the case of Sasha's power
         gained_funds = {}
@@ -272,7 +617,6 @@ class AWBWGameState(game.GameState):
         # Unit info
         # - ammo change
         # - health change
-        new_unit_info = deepcopy(move_state.units)
         for combatinfo in fire_action["combatInfoVision"].values():
             if not isinstance(combatinfo, dict) or not isinstance(combatinfo["combatInfo"], dict):
                 continue
@@ -283,16 +627,13 @@ class AWBWGameState(game.GameState):
                         # Indicates a unseen attacker
                         continue
                     u_id = int(unit["units_id"])
-                    assert u_id in new_unit_info
+                    assert u_id in txn.units
                     updated_unit_data = {
                         "hit_points": unit["units_hit_points"],
                         "ammo": unit["units_ammo"],
                         "fired": role == "attacker",
                     }
-                    new_unit_info[u_id] = {
-                        **new_unit_info[u_id],
-                        **updated_unit_data,
-                    }
+                    txn.unit(u_id).update(updated_unit_data)
             if "gainedFunds" in combatinfo["combatInfo"]:
                 fundsinfo = combatinfo["combatInfo"]["gainedFunds"]
                 for p_id, funds in fundsinfo.items():
@@ -301,23 +642,18 @@ class AWBWGameState(game.GameState):
                         gained_funds[p_id] = funds
 
         for p_id, funds in gained_funds.items():
-            new_player_info[p_id]["funds"] += funds
+            txn.player(p_id)["funds"] += funds
 
-        return AWBWGameState(
-                game_map=self.game_map,
-                players=new_player_info,
-                units=new_unit_info,
-                buildings=self.buildings,
-                game_info=self.game_info)
+        return txn.commit()
 
     def _apply_join_action(self, action_data):
         """
         Helper for join actions
         """
-        logging.debug("Join action")
         # To join two units, one must be moved
         assert "Move" in action_data
-        move_state = self._apply_move_action(action_data["Move"])
+        txn = self._transition()
+        self._apply_move_action_units(action_data["Move"], txn)
 
         join_action = action_data["Join"]
         # The unit that now has 0 health due to joining
@@ -327,18 +663,16 @@ class AWBWGameState(game.GameState):
                 joined_u_id = u_id
                 break
         assert joined_u_id is not None
-        assert joined_u_id in move_state.units
-        new_unit_info = deepcopy(move_state.units)
+        assert joined_u_id in txn.units
         # Set hit points of old unit to 0 to indicate it no longer exists
-        new_unit_info[joined_u_id]["hit_points"] = 0
-        p_id = new_unit_info[joined_u_id]["players_id"]
+        txn.unit(joined_u_id)["hit_points"] = 0
+        p_id = txn.units[joined_u_id]["players_id"]
 
         # Player info
         # - funds change
-        new_player_info = deepcopy(move_state.players)
         for funds in join_action["newFunds"].values():
             if isinstance(funds, int):
-                new_player_info[p_id]["funds"] = funds
+                txn.player(p_id)["funds"] = funds
                 break
 
         # Unit info
@@ -354,51 +688,63 @@ class AWBWGameState(game.GameState):
                 # in the case where the unit moves back into the fog.
                 continue
             u_id = unit["units_id"]
-            assert u_id in new_unit_info
+            assert u_id in txn.units
             # Overwrite every value for the unit, to be detail oriented.
             # I don't know what the answer is if two APCs carrying units try to join...
-            for k in new_unit_info[u_id]:
-                new_unit_info[u_id][k] = unit["units_" + k]
+            joined_unit = txn.unit(u_id)
+            for k in joined_unit:
+                joined_unit[k] = unit["units_" + k]
 
-        return AWBWGameState(
-                game_map=move_state.game_map,
-                players=new_player_info,
-                units=new_unit_info,
-                buildings=move_state.buildings,
-                game_info=move_state.game_info)
+        return txn.commit()
 
     def _apply_resign_action(self, action_data):
         """
         Helper for resign actions
         """
-        logging.debug("Resign action")
-        new_game_info = self.game_info
+        txn = self._transition()
         if "GameOver" in action_data:
-            new_game_info = deepcopy(self.game_info)
-            new_game_info["game_over"] = True
+            self._apply_game_over(action_data["GameOver"], txn)
 
-        new_player_info = deepcopy(self.players)
         p_id = action_data["Resign"]["playerId"]
-        new_player_info[p_id]["eliminated"] = True
+        txn.player(p_id)["eliminated"] = True
 
         # TODO: The GameOver / Resign messages actual contain usernames.
 
-        return AWBWGameState(
-                game_map=self.game_map,
-                players=new_player_info,
-                units=self.units,
-                buildings=self.buildings,
-                game_info=new_game_info)
+        return txn.commit()
+
+    def _apply_game_over(self, game_over_info, txn):
+        """
+        Helper for the GameOver info of resign and end actions.
+
+        Modifies the game info and players of txn in place.
+        """
+        # pylint: disable=no-self-use
+        txn.writable_game_info()["game_over"] = True
+        for p_id in game_over_info.get("losers") or []:
+            if p_id in txn.players:
+                txn.player(p_id)["eliminated"] = True
 
     def _apply_move_action(self, action_data):
         """
         Helper for move actions
         """
-        logging.debug("Move action")
         # Sometimes move action_data is empty. e.g. during "Hide" actions
         if len(action_data) == 0:
             return self
-        new_unit_info = deepcopy(self.units)
+        txn = self._transition()
+        self._apply_move_action_units(action_data, txn)
+        return txn.commit()
+
+    def _apply_move_action_units(self, action_data, txn):
+        """
+        Helper for the move part of move and composite actions, such as a
+        unit moving and then firing.
+
+        Modifies the units of txn in place.
+        """
+        # pylint: disable=no-self-use
+        if len(action_data) == 0:
+            return
         # Unit info
         # - position change
         # - fuel change
@@ -411,7 +757,7 @@ class AWBWGameState(game.GameState):
                 # in the case where the unit moves back into the fog.
                 continue
             u_id = unit["units_id"]
-            if u_id not in new_unit_info:
+            if u_id not in txn.units:
                 logging.warning("Unknown unit id %d in move info", u_id)
                 logging.debug("Creating new unit %d from move info", u_id)
                 unit_info = {}
@@ -432,7 +778,7 @@ class AWBWGameState(game.GameState):
                     unit_info[k] = int(unit[prefix + k])
                 for k in unit_keys_str:
                     unit_info[k] = unit[prefix + k]
-                new_unit_info[u_id] = Unit(**unit_info)
+                txn.set_unit(u_id, Unit(**unit_info))
 
             updated_unit_data = {
                 "x" : unit["units_x"],
@@ -440,26 +786,17 @@ class AWBWGameState(game.GameState):
                 "moved": True,
                 "fuel": unit["units_fuel"]
             }
-            new_unit_info[u_id] = {**new_unit_info[u_id], **updated_unit_data}
-
-        return AWBWGameState(
-                game_map=self.game_map,
-                players=self.players,
-                units=new_unit_info,
-                buildings=self.buildings,
-                game_info=self.game_info)
+            txn.unit(u_id).update(updated_unit_data)
 
     def _apply_build_action(self, action_data):
         """
         Helper for build actions
         """
-        logging.debug("Build action")
 
         info = action_data["newUnit"]
         # Unit info
         # - new unit
         built_unit = {}
-        new_unit_info = deepcopy(self.units)
         unit_info = None
 
         # Figure out what information is the true info for the unit
@@ -501,43 +838,38 @@ class AWBWGameState(game.GameState):
             built_unit[k] = int(unit_info[prefix + k])
         for k in unit_keys_str:
             built_unit[k] = unit_info[prefix + k]
-        new_unit_info[built_unit["id"]] = Unit(**built_unit)
+        txn = self._transition()
+        txn.set_unit(built_unit["id"], Unit(**built_unit))
 
         # Player info
         # - funds change
-        new_player_info = deepcopy(self.players)
         p_id = built_unit["players_id"]
         if not p_id == self.game_info["active_player_id"]:
             logging.warning("Build action for non-active player %d", p_id)
-        new_player_info[p_id]["funds"] -= built_unit["cost"]
+        txn.player(p_id)["funds"] -= built_unit["cost"]
 
-        return AWBWGameState(
-                game_map=self.game_map,
-                players=new_player_info,
-                units=new_unit_info,
-                buildings=self.buildings,
-                game_info=self.game_info)
+        return txn.commit()
 
     def _apply_end_action(self, action_data):
         """
         Helper for end actions
         """
-        logging.debug("End action")
         info = action_data["updatedInfo"]
+        txn = self._transition()
         if info["event"] == "GameOver":
-            # The game is over, there's nothing to update
-            return
+            # e.g. an HQ capture or a rout. There's no next turn to update
+            self._apply_game_over(info, txn)
+            return txn.commit()
         # GameInfo Info - new active player, turn, and day
         updated_game_info = {
             "active_player_id": int(info["nextPId"]),
             "turn": self.game_info["turn"] + 1,
             "day": int(info["day"]),
         }
-        new_global_info = {**self.game_info, **updated_game_info}
+        txn.writable_game_info().update(updated_game_info)
 
         # Player info
         # - funds change
-        new_player_info = deepcopy(self.players)
         funds_info = info["nextFunds"]
         p_id = info["nextPId"]
         for value in funds_info.values():
@@ -545,44 +877,41 @@ class AWBWGameState(game.GameState):
             # matches, funds are hidden from some players, and therefore there
             # is a view on the newFunds variable, with the hidden values being ''
             if isinstance(value, int):
-                new_player_info[p_id]["funds"] = value
+                txn.player(p_id)["funds"] = value
                 break
-        new_player_info[p_id]["co_power_on"] = False
-        new_player_info[p_id]["super_co_power_on"] = False
+        txn.player(p_id)["co_power_on"] = False
+        txn.player(p_id)["super_co_power_on"] = False
 
         # Unit info
         # - TODO resupply
         # - fuel cost
         # - sank / crashed units
-        new_unit_info = deepcopy(self.units)
         repaired_info = info["repaired"]
         if repaired_info and isinstance(repaired_info, dict):
             for value in repaired_info.values():
                 assert isinstance(value, list)
                 for unit in value:
                     u_id = int(unit["units_id"])
-                    if u_id not in new_unit_info:
+                    if u_id not in txn.units:
                         logging.warning("Unknown unit id %d in repair info", u_id)
                         continue
-                    new_unit_info[u_id]["hit_points"] = unit["units_hit_points"]
-        # Unmark moved, captured, fired flags
-        for u_id, unit in new_unit_info.items():
-            unit["moved"] = False
-            unit["capture"] = False
-            unit["fired"] = False
-
-        return AWBWGameState(
-                game_map=self.game_map,
-                players=new_player_info,
-                units=new_unit_info,
-                buildings=self.buildings,
-                game_info=new_global_info)
-
-    def _apply_power_action_unit_add(self, action_data, new_unit_info):
+                    txn.unit(u_id)["hit_points"] = unit["units_hit_points"]
+        # Unmark moved, captured, fired flags. Units without any flags set are
+        # left as they are, so they're shared with the previous state.
+        for u_id, unit in list(txn.units.items()):
+            if unit["moved"] or unit["capture"] or unit["fired"]:
+                unit = txn.unit(u_id)
+                unit["moved"] = False
+                unit["capture"] = False
+                unit["fired"] = False
+
+        return txn.commit()
+
+    def _apply_power_action_unit_add(self, action_data, txn):
         """
         Helper for power actions unitAdd actions.
 
-        Modifies new_unit_info in place. Also returns another reference to new_unit_info.
+        Modifies the units of txn in place.
         """
         # pylint: disable=no-self-use
         if "unitAdd" in action_data:
@@ -619,15 +948,13 @@ class AWBWGameState(game.GameState):
                     "x": unit["units_x"],
                     "y": unit["units_y"],
                 }
-                new_unit_info[u_id] = Unit(new_unit_template, **unit_info)
-
-        return new_unit_info
+                txn.set_unit(u_id, Unit(new_unit_template, **unit_info))
 
-    def _apply_power_action_hp_change(self, action_data, new_unit_info):
+    def _apply_power_action_hp_change(self, action_data, txn):
         """
         Helper for power actions hpChange actions.
 
-        Modifies new_unit_info in place. Also returns another reference to new_unit_info.
+        Modifies the units of txn in place.
         """
         # pylint: disable=no-self-use
         if "hpChange" in action_data:
@@ -637,19 +964,18 @@ class AWBWGameState(game.GameState):
                     hp_gain_info = action_data["hpChange"][hp_type]
                     hit_points = hp_gain_info["hp"]
                     # TODO: Handle units_fuel
-                    for u_id, unit in new_unit_info.items():
+                    for u_id, unit in list(txn.units.items()):
                         if unit["players_id"] in hp_gain_info:
-                            new_hp = new_unit_info[u_id]["hit_points"] + hit_points
-                            new_unit_info[u_id]["hit_points"] += max(1, min(10, new_hp))
+                            unit = txn.unit(u_id)
+                            new_hp = unit["hit_points"] + hit_points
+                            unit["hit_points"] = max(1, min(10, new_hp))
 
-        return new_unit_info
 
-
-    def _apply_power_action_unit_replace(self, action_data, new_unit_info):
+    def _apply_power_action_unit_replace(self, action_data, txn):
         """
         Helper for power actions unitReplace actions.
 
-        Modifies new_unit_info in place. Also returns another reference to new_unit_info.
+        Modifies the units of txn in place.
         """
         # pylint: disable=no-self-use
         if "unitReplace" in action_data:
@@ -664,18 +990,16 @@ class AWBWGameState(game.GameState):
                     u_id = unit["units_id"]
                     if "units_hit_points" in unit:
                         hit_points = unit["units_hit_points"]
-                        new_unit_info[u_id]["hit_points"] = hit_points
+                        txn.unit(u_id)["hit_points"] = hit_points
                     if "units_moved" in unit:
-                        new_unit_info[u_id]["moved"] = True
-
-        return new_unit_info
+                        txn.unit(u_id)["moved"] = True
 
 
     def _apply_power_action(self, action_data):
         """
         Helper for power actions
         """
-        logging.debug("Power action")
+        txn = self._transition()
 
         # Player info
         # - power status
@@ -683,40 +1007,33 @@ class AWBWGameState(game.GameState):
         # - power meter change
         p_id = action_data["playerID"]
         co_meter = action_data["playersCOP"]
-        new_player_info = deepcopy(self.players)
-        new_player_info[p_id]["co_power"] = co_meter
-        new_player_info[p_id]["co_power_on"] = (action_data["coPower"] == "Y")
-        new_player_info[p_id]["super_co_power_on"] = (action_data["coPower"] == "S")
+        player = txn.player(p_id)
+        player["co_power"] = co_meter
+        player["co_power_on"] = action_data["coPower"] == "Y"
+        player["super_co_power_on"] = action_data["coPower"] == "S"
 
         # Unit info
         # - health change
         # - ammo change
         # - fuel change
         # - new unit(s)
-        new_unit_info = deepcopy(self.units)
         # Sensei's powers add units...
-        new_unit_info = self._apply_power_action_unit_add(action_data, new_unit_info)
+        self._apply_power_action_unit_add(action_data, txn)
         # Hawke, Drake, Olaf, Andy, etc... affect global health of units
-        new_unit_info = self._apply_power_action_hp_change(action_data, new_unit_info)
+        self._apply_power_action_hp_change(action_data, txn)
         # Von Bolt, Rachel, Sturm, Kindle...
         # And movement affecting abilities...
-        new_unit_info = self._apply_power_action_unit_replace(action_data, new_unit_info)
+        self._apply_power_action_unit_replace(action_data, txn)
 
-        return AWBWGameState(
-                game_map=self.game_map,
-                players=new_player_info,
-                units=new_unit_info,
-                buildings=self.buildings,
-                game_info=self.game_info)
+        return txn.commit()
 
     def _apply_capt_action(self, action_data):
         """
         Helper for capt actions
         """
-        logging.debug("Capt action")
-        move_state = self
+        txn = self._transition()
         if "Move" in action_data and isinstance(action_data["Move"], dict):
-            move_state = self._apply_move_action(action_data["Move"])
+            self._apply_move_action_units(action_data["Move"], txn)
         # Unit info
         # - position change
         # - fuel change
@@ -727,66 +1044,56 @@ class AWBWGameState(game.GameState):
         capt_action = action_data["Capt"]
         building = capt_action["buildingInfo"]
         b_id = int(building["buildings_id"])
-        assert b_id in move_state.buildings
-        new_building_info = deepcopy(move_state.buildings)
-        new_building_info[b_id]["capture"] = building["buildings_capture"]
-        new_building_info[b_id]["team"] = building["buildings_team"]
+        assert b_id in txn.buildings
+        txn.building(b_id)["capture"] = building["buildings_capture"]
+        txn.building(b_id)["team"] = building["buildings_team"]
+        # Completed captures also report the new owner
+        if "buildings_players_id" in building:
+            txn.building(b_id)["players_id"] = building["buildings_players_id"]
+        if "terrain_id" in building:
+            txn.building(b_id)["terrain_id"] = building["terrain_id"]
 
-        return AWBWGameState(
-                game_map=move_state.game_map,
-                players=move_state.players,
-                units=move_state.units,
-                buildings=new_building_info,
-                game_info=move_state.game_info)
+        return txn.commit()
 
     def _apply_repair_action(self, action_data):
         """
         Helper for repair actions
         """
-        logging.debug("Repair action")
-        move_state = self
+        txn = self._transition()
         if "Move" in action_data and isinstance(action_data["Move"], dict):
-            move_state = self._apply_move_action(action_data["Move"])
+            self._apply_move_action_units(action_data["Move"], txn)
         # Unit info
         # - fuel change
         # - hitpoint change
-        new_unit_info = deepcopy(move_state.units)
-
         repair_info = action_data["Repair"]
         p_id = None
         for value in repair_info["repaired"].values():
             if isinstance(value, dict):
-                new_unit_info[value["units_id"]]["hit_points"] = value["units_hit_points"]
-                p_id = new_unit_info[value["units_id"]]["players_id"]
+                unit = txn.unit(value["units_id"])
+                unit["hit_points"] = value["units_hit_points"]
+                p_id = unit["players_id"]
                 break
         assert p_id is not None
 
         # Player info
         # - funds change
-        new_player_info = deepcopy(move_state.players)
-        assert p_id in new_player_info
+        assert p_id in txn.players
         funds = None
         for value in repair_info["funds"].values():
             if isinstance(value, int):
                 funds = value
                 break
-        new_player_info[p_id]["funds"] = funds
+        txn.player(p_id)["funds"] = funds
 
-        return AWBWGameState(
-                game_map=move_state.game_map,
-                players=new_player_info,
-                units=new_unit_info,
-                buildings=move_state.buildings,
-                game_info=move_state.game_info)
+        return txn.commit()
 
     def _apply_supply_action(self, action_data):
         """
         Helper for supply actions
         """
-        logging.debug("Supply action")
-        move_state = self
+        txn = self._transition()
         if "Move" in action_data and isinstance(action_data["Move"], dict):
-            move_state = self._apply_move_action(action_data["Move"])
+            self._apply_move_action_units(action_data["Move"], txn)
 
         # No funds change on supply.
 
@@ -795,22 +1102,17 @@ class AWBWGameState(game.GameState):
         # The supply data doesn't actually include the new fuel values,
         # so for now we'll only handle the move part.
 
-        return AWBWGameState(
-                game_map=move_state.game_map,
-                players=move_state.players,
-                units=move_state.units,
-                buildings=move_state.buildings,
-                game_info=move_state.game_info)
+        return txn.commit()
 
     def _apply_load_action(self, action_data):
         """
         Helper for load actions
         """
-        logging.debug("Load action")
 
         # To load a unit into a transport, one must be moved
         assert "Move" in action_data
-        move_state = self._apply_move_action(action_data["Move"])
+        txn = self._transition()
+        self._apply_move_action_units(action_data["Move"], txn)
 
         # Mark transport as carrying a unit, and the loaded unit as being carried
         load_action = action_data["Load"]
@@ -825,29 +1127,23 @@ class AWBWGameState(game.GameState):
                 transport_id = u_id
                 break
 
-        new_unit_info = deepcopy(move_state.units)
         # Units must already exist to be loaded / moved
-        assert (loaded_id in new_unit_info) and (transport_id in new_unit_info)
-        new_unit_info[loaded_id]["carried"] = True
-        if new_unit_info[transport_id]["cargo1_units_id"] == 0:
-            new_unit_info[transport_id]["cargo1_units_id"] = loaded_id
+        assert (loaded_id in txn.units) and (transport_id in txn.units)
+        txn.unit(loaded_id)["carried"] = True
+        transport = txn.unit(transport_id)
+        if transport["cargo1_units_id"] == 0:
+            transport["cargo1_units_id"] = loaded_id
         else:
-            new_unit_info[transport_id]["cargo2_units_id"] = loaded_id
+            transport["cargo2_units_id"] = loaded_id
 
-        return AWBWGameState(
-                game_map=move_state.game_map,
-                players=move_state.players,
-                units=new_unit_info,
-                buildings=move_state.buildings,
-                game_info=move_state.game_info)
+        return txn.commit()
 
     def _apply_unload_action(self, action_data):
         """
         Helper for unload actions
         """
-        logging.debug("Unload action")
 
-        new_unit_info = deepcopy(self.units)
+        txn = self._transition()
         transport_id = action_data["transportID"]
         unit = None
         for value in action_data["unit"].values():
@@ -856,10 +1152,11 @@ class AWBWGameState(game.GameState):
                 break
         assert unit is not None
         loaded_id = unit["units_id"]
-        if new_unit_info[transport_id]["cargo1_units_id"] == loaded_id:
-            new_unit_info[transport_id]["cargo1_units_id"] = 0
+        transport = txn.unit(transport_id)
+        if transport["cargo1_units_id"] == loaded_id:
+            transport["cargo1_units_id"] = 0
         else:
-            new_unit_info[transport_id]["cargo2_units_id"] = 0
+            transport["cargo2_units_id"] = 0
 
         unit_keys = [
                 "id",
@@ -876,143 +1173,106 @@ class AWBWGameState(game.GameState):
             "movement_type"
         ]
         prefix = "units_"
-        unit_keys_str = []
+        loaded_unit = txn.unit(loaded_id)
         for k in unit_keys:
             # In FoW, we may not know the values
             if isinstance(unit[prefix + k], int):
-                new_unit_info[loaded_id][k] = int(unit[prefix + k])
+                loaded_unit[k] = int(unit[prefix + k])
             else:
-                new_unit_info[loaded_id][k] = unit[prefix + k]
-        new_unit_info[loaded_id]["carried"] = False
+                loaded_unit[k] = unit[prefix + k]
+        loaded_unit["carried"] = False
 
-        return AWBWGameState(
-                game_map=self.game_map,
-                players=self.players,
-                units=new_unit_info,
-                buildings=self.buildings,
-                game_info=self.game_info)
+        return txn.commit()
 
     def _apply_delete_action(self, action_data):
         """
         Helper for delete actions
         """
-        logging.debug("Delete action")
 
-        new_unit_info = deepcopy(self.units)
+        txn = self._transition()
         for u_id in action_data["Delete"]["unitId"].values():
             if isinstance(u_id, int):
                 # Set the unit's hp to zero to treat it as deleted
-                new_unit_info[u_id]["hit_points"] = 0
+                txn.unit(u_id)["hit_points"] = 0
 
-        return AWBWGameState(
-                game_map=self.game_map,
-                players=self.players,
-                units=new_unit_info,
-                buildings=self.buildings,
-                game_info=self.game_info)
+        return txn.commit()
 
     def _apply_hide_action(self, action_data):
         """
         Helper for hide actions
         """
-        logging.debug("Hide action")
 
-        move_state = self
+        txn = self._transition()
         if "Move" in action_data:
-            move_state = self._apply_move_action(action_data["Move"])
+            self._apply_move_action_units(action_data["Move"], txn)
 
         hide_info = action_data["Hide"]
-        new_unit_info = deepcopy(move_state.units)
         for u_id in hide_info["unit"].values():
             if isinstance(u_id, int):
-                new_unit_info[u_id]["sub_dive"] = True
+                txn.unit(u_id)["sub_dive"] = True
 
-        return AWBWGameState(
-                game_map=move_state.game_map,
-                players=move_state.players,
-                units=new_unit_info,
-                buildings=move_state.buildings,
-                game_info=move_state.game_info)
+        return txn.commit()
 
     def _apply_unhide_action(self, action_data):
         """
         Helper for unhide actions
         """
-        logging.debug("Unhide action")
 
-        move_state = self
+        txn = self._transition()
         if "Move" in action_data:
-            move_state = self._apply_move_action(action_data["Move"])
+            self._apply_move_action_units(action_data["Move"], txn)
 
         unhide_info = action_data["Unhide"]
-        new_unit_info = deepcopy(move_state.units)
         for unit in unhide_info["unit"].values():
             if isinstance(unit, dict) and "units_x" in unit and "units_y" in unit:
                 u_id = unit["units_id"]
-                new_unit_info[u_id]["sub_dive"] = False
+                txn.unit(u_id)["sub_dive"] = False
 
-        return AWBWGameState(
-                game_map=move_state.game_map,
-                players=move_state.players,
-                units=new_unit_info,
-                buildings=move_state.buildings,
-                game_info=move_state.game_info)
+        return txn.commit()
 
     def _apply_attackseam_action(self, action_data):
         """
         Helper for fire actions
         """
-        logging.debug("Attack Seam action")
 
         # Unit info
         # - position change
-        move_state = self
+        txn = self._transition()
         if "Move" in action_data and isinstance(action_data["Move"], dict):
-            move_state = self._apply_move_action(action_data["Move"])
+            self._apply_move_action_units(action_data["Move"], txn)
 
         attack_seam_action = action_data["AttackSeam"]
         assert isinstance(attack_seam_action, dict)
 
-        # Player info
+        # TODO: Player info
         # - power meters
-        new_player_info = deepcopy(move_state.players)
+        # - funds change in the case of Sasha's power
 
-        # Handle funds change in the case of Sasha's power
-        gained_funds = {}
-
-        # Unit info
+        # TODO: Unit info
         # - ammo change
         # - health change
-        new_unit_info = deepcopy(move_state.units)
 
-        return AWBWGameState(
-            game_map=self.game_map,
-            players=new_player_info,
-            units=new_unit_info,
-            buildings=self.buildings,
-            game_info=self.game_info)
+        return txn.commit()
 
     def _apply_explode_action(self, action_data):
         """
         Helper Explode actions
         """
-        logging.debug("Explode action")
 
         # Unit info
         # - position change
-        move_state = self
+        txn = self._transition()
         if "Move" in action_data and isinstance(action_data["Move"], dict):
-            move_state = self._apply_move_action(action_data["Move"])
+            self._apply_move_action_units(action_data["Move"], txn)
 
         explode_action = action_data["Explode"]
         assert isinstance(explode_action, dict)
 
         # Unit info
         # - health change
-        new_unit_info = deepcopy(move_state.units)
-        exploding_unit = new_unit_info[explode_action["unitId"]]
+        exploding_unit = txn.units[explode_action["unitId"]]
         # Remove Black Bomb, error if black bomb unit doesn't exist
-        del new_unit_info[exploding_unit["id"]]
+        txn.remove_unit(exploding_unit["id"])
         # deal damage
         # find all units within 3 spaces
         exploded_coords = set()
@@ -1023,19 +1283,14 @@ class AWBWGameState(game.GameState):
                     exploded_coords.add((
                         exploding_unit["x"] + x_delta,
                         exploding_unit["y"] + y_delta))
-        for (unit_id, data) in new_unit_info.items():
+        for (unit_id, data) in list(txn.units.items()):
             if (data["x"], data["y"]) in exploded_coords and \
-                    isinstance(new_unit_info[unit_id]["hit_points"], int) and \
-                    int(new_unit_info[unit_id]["hit_points"]) > 0:
+                    isinstance(data["hit_points"], int) and \
+                    int(data["hit_points"]) > 0:
                 # Black Bombs deal 5 HP, but always leave units with at least 1 HP
-                new_unit_info[unit_id]["hit_points"] = max(1, int(new_unit_info[unit_id]["hit_points"]) - 5)
+                txn.unit(unit_id)["hit_points"] = max(1, int(data["hit_points"]) - 5)
 
-        return AWBWGameState(
-            game_map=self.game_map,
-            players=self.players,
-            units=new_unit_info,
-            buildings=self.buildings,
-            game_info=self.game_info)
+        return txn.commit()
 
     def _apply_tag_action(self, action_data):
         return self
@@ -1063,8 +1318,129 @@ class AWBWGameState(game.GameState):
             }
 
     def apply_action(self, action):
+        if profiling.ENABLED:
+            with profiling.stage("apply." + action.type.value):
+                return self._ACTION_TYPE_TO_APPLY_FUNC[action.type](self, action.info)
         return self._ACTION_TYPE_TO_APPLY_FUNC[action.type](self, action.info)
 
+    def apply_deltas(self, deltas):
+        """
+        Applies a sequence of StateDeltas (e.g. recorded by an AWBWReplayCursor)
+        to this game state, producing a new game state.
+
+        Arguments:
+        - deltas: Iterable of StateDelta, in the order the actions were applied
+
+        Returns:
+        - A new AWBWGameState, sharing every unchanged entry with this one
+        """
+        txn = self._transition()
+        for delta in deltas:
+            for u_id, unit in delta.units_created.items():
+                txn.set_unit(u_id, Unit(unit))
+            for u_id, changes in delta.units_changed.items():
+                txn.unit(u_id).update(changes)
+            for u_id in delta.units_removed:
+                txn.remove_unit(u_id)
+            for p_id, changes in delta.players_changed.items():
+                txn.player(p_id).update(changes)
+            for b_id, changes in delta.buildings_changed.items():
+                txn.building(b_id).update(changes)
+            if delta.game_info_changed:
+                txn.writable_game_info().update(delta.game_info_changed)
+        return txn.commit()
+
+class _CursorState(AWBWGameState):
+    """
+    An AWBWGameState which the apply functions modify in place, through the
+    transition of the action currently being applied.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.active_transition = None
+
+    def _transition(self):
+        if self.active_transition is None:
+            # Not applied through the cursor, so leave this state untouched
+            return super()._transition()
+        return self.active_transition
+
+class AWBWReplayCursor():
+    """
+    Steps through a replay with a single mutable game state, instead of
+    building a new AWBWGameState for every action.
+
+    Each action is applied in place by the same apply functions as
+    AWBWGameState.apply_action, and returns a StateDelta of what it changed.
+
+    Usage:
+
+    with AWBWReplay("52963.zip") as replay:
+        cursor = AWBWReplayCursor(replay_initial=replay.game_info())
+        for action in replay.actions():
+            delta = cursor.apply_action(AWBWGameAction(action))
+    """
+
+    def __init__(self, replay_initial=None, state=None):
+        """
+        Arguments:
+        - replay_initial: The replay's game_info() to start from
+        - state: Alternatively, an AWBWGameState to start from. It is copied, and
+          not modified by the cursor.
+        """
+        if state is None:
+            self._state = _CursorState(replay_initial=replay_initial)
+        else:
+            self._state = _CursorState(
+                    game_map=state.game_map,
+                    players=state.players,
+                    units=state.units,
+                    buildings=state.buildings,
+                    game_info=state.game_info)
+
+    @property
+    def state(self):
+        """
+        The current game state. It is modified by every apply_action call, use
+        snapshot() to keep a state around.
+        """
+        return self._state
+
+    def snapshot(self):
+        """Returns an AWBWGameState copy of the current state"""
+        return AWBWGameState(
+                game_map=self._state.game_map,
+                players=self._state.players,
+                units=self._state.units,
+                buildings=self._state.buildings,
+                game_info=self._state.game_info)
+
+    def apply_action(self, action):
+        """
+        Applies an AWBWGameAction to the current state.
+
+        Returns:
+        - The StateDelta of the changes made by the action
+        """
+        if profiling.ENABLED:
+            with profiling.stage("apply." + action.type.value):
+                return self._apply_action(action)
+        return self._apply_action(action)
+
+    def _apply_action(self, action):
+        """Helper for apply_action"""
+        transition = _Transition(self._state, in_place=True)
+        self._state.active_transition = transition
+        try:
+            AWBWGameState._ACTION_TYPE_TO_APPLY_FUNC[action.type]( # pylint: disable=protected-access
+                    self._state, action.info)
+            # Not every apply function commits, e.g. on an empty Move
+            transition.commit()
+        finally:
+            self._state.active_transition = None
+        return transition.delta()
+
 if __name__ == "__main__":
     import sys
     from awbw_replay.replay import AWBWReplay
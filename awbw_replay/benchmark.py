@@ -0,0 +1,302 @@
+"""
+Offline performance benchmarks of replay parsing and game state generation.
+
+For each replay, measures:
+- open/parse throughput of AWBWReplay, in actions/s and MB/s of archive
+- state generation throughput of the README states loop, in actions/s
+- the mean cost of applying each action type, in microseconds
+- the peak memory of opening the replay and generating every state
+
+Results are written as JSON, and can be compared against a stored baseline.
+
+Usage:
+
+python -m awbw_replay.benchmark --replays replays --scale 10 --synthetic large --output results.json
+python -m awbw_replay.benchmark --baseline results.json --threshold 0.2
+"""
+
+import argparse
+import gzip
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import zipfile
+
+from awbw_replay import profiling, synthetic
+from awbw_replay.awbw import AWBWGameAction, AWBWGameState
+from awbw_replay.replay import AWBWReplay
+
+EXIT_SUCCESS = 0
+EXIT_FAILURE = 1
+
+# Metrics where a larger value is an improvement. Every other metric is a cost.
+HIGHER_IS_BETTER = {"open_actions_per_s", "open_mb_per_s", "states_actions_per_s"}
+
+# Name -> synthetic.generate_replay arguments of the generated replays to benchmark
+SYNTHETIC_PRESETS = {
+    "small": {"players": 2, "days": 15, "initial_units": 4, "max_units": 60},
+    "fog": {"players": 4, "days": 30, "initial_units": 6, "max_units": 150, "fog": True},
+    "large": {
+        "players": 8,
+        "days": 60,
+        "initial_units": 10,
+        "max_units": 400,
+        "actions_per_turn": 30,
+        "starting_funds": 20000,
+        "action_mix": {"Build": 3, "Move": 8, "Fire": 1, "Capt": 2},
+        "fog": True,
+    },
+}
+
+def scaled_replay(source, factor):
+    """
+    Builds a larger replay by repeating the action lines of an existing one.
+
+    The result is only meant for open/parse benchmarks: the repeated actions
+    don't form a consistent game, so they can't be applied to a game state.
+
+    Arguments:
+    - source: Path of the replay archive
+    - factor: The number of times to repeat the action lines
+
+    Returns:
+    - The bytes of the new replay archive
+    """
+    output = io.BytesIO()
+    with zipfile.ZipFile(source) as original, zipfile.ZipFile(output, "w") as scaled:
+        for name in original.namelist():
+            data = original.read(name)
+            if "a" in name:
+                lines = [line for line in gzip.decompress(data).split(b"\n") if line.strip()]
+                data = gzip.compress(b"\n".join(lines * factor))
+            scaled.writestr(name, data)
+    return output.getvalue()
+
+def _best_time(func, repeat):
+    """Returns the fastest of repeat runs of func, in seconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def _generate_states(replay):
+    """The README loop, building the list of every game state"""
+    states = [AWBWGameState(replay_initial=replay.game_info())]
+    for action in replay.actions():
+        states.append(states[-1].apply_action(AWBWGameAction(action)))
+    return states
+
+def benchmark_replay(source, repeat=3, apply_actions=True):
+    """
+    Benchmarks a single replay. The per action type costs are measured with
+    the profiling module, whose results are reset.
+
+    Arguments:
+    - source: Path or bytes of the replay archive
+    - repeat: Timings are the best of this many runs
+    - apply_actions: If False, only measure opening the replay, e.g. for
+      replays built by scaled_replay
+
+    Returns:
+    - dict with the replay's "size_bytes", "actions" and "metrics"
+    """
+    size = len(source) if isinstance(source, bytes) else os.path.getsize(source)
+    with AWBWReplay(source) as replay:
+        num_actions = sum(len(turn.actions) for turn in replay.turns())
+
+    def open_replay():
+        # Opening a replay decodes every action
+        with AWBWReplay(source):
+            pass
+
+    open_s = _best_time(open_replay, repeat)
+    metrics = {
+        "open_s": open_s,
+        "open_actions_per_s": num_actions / open_s,
+        "open_mb_per_s": size / 1e6 / open_s,
+    }
+
+    if apply_actions:
+        with AWBWReplay(source) as replay:
+            states_s = _best_time(lambda: _generate_states(replay), repeat)
+            metrics["states_s"] = states_s
+            metrics["states_actions_per_s"] = num_actions / states_s
+
+            was_enabled = profiling.ENABLED
+            profiling.enable()
+            try:
+                # Some action types only appear a few times, so take the best
+                # mean over the runs
+                for _ in range(repeat):
+                    profiling.reset()
+                    _generate_states(replay)
+                    for name, stats in profiling.report()["stages"].items():
+                        if name.startswith("apply."):
+                            metric = "apply_us." + name[len("apply."):]
+                            metrics[metric] = min(metrics.get(metric, stats["mean_us"]),
+                                                  stats["mean_us"])
+            finally:
+                if not was_enabled:
+                    profiling.disable()
+                profiling.reset()
+
+    tracemalloc.start()
+    try:
+        with AWBWReplay(source) as replay:
+            if apply_actions:
+                _generate_states(replay)
+        metrics["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {"size_bytes": size, "actions": num_actions, "metrics": metrics}
+
+def run_suite(replay_dir="replays", scales=(1,), repeat=3, synthetic_presets=()):
+    """
+    Benchmarks every replay in a directory.
+
+    Arguments:
+    - replay_dir: Directory of .zip replays
+    - scales: Repetition factors of the action lines. 1 benchmarks the replays
+      as they are, larger factors only benchmark opening scaled_replay copies.
+    - repeat: Timings are the best of this many runs
+    - synthetic_presets: Names of SYNTHETIC_PRESETS replays to also generate
+      and benchmark
+
+    Returns:
+    - JSON serializable dict of the environment and the results per replay name
+    """
+    results = {}
+    for filename in sorted(os.listdir(replay_dir)):
+        if not filename.lower().endswith(".zip"):
+            continue
+        path = os.path.join(replay_dir, filename)
+        name = os.path.splitext(filename)[0]
+        for scale in scales:
+            if scale == 1:
+                results[name] = benchmark_replay(path, repeat=repeat)
+            else:
+                results[f"{name}_x{scale}"] = benchmark_replay(
+                        scaled_replay(path, scale), repeat=repeat, apply_actions=False)
+    for preset in synthetic_presets:
+        results[f"synthetic_{preset}"] = benchmark_replay(
+                synthetic.generate_replay(**SYNTHETIC_PRESETS[preset]), repeat=repeat)
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+def compare(results, baseline, threshold=0.2, thresholds=None):
+    """
+    Compares benchmark results against a baseline.
+
+    Arguments:
+    - results: The output of run_suite
+    - baseline: A previous output of run_suite
+    - threshold: The relative change that counts as a regression, e.g. 0.2 if
+      a metric may be up to 20% worse than the baseline
+    - thresholds: Optional dict of metric name -> threshold overriding threshold
+
+    Returns:
+    - List of messages describing each regression, empty if there are none
+    """
+    thresholds = thresholds or {}
+    regressions = []
+    for name, result in results["results"].items():
+        baseline_result = baseline["results"].get(name)
+        if baseline_result is None:
+            continue
+        for metric, value in result["metrics"].items():
+            expected = baseline_result["metrics"].get(metric)
+            if not expected:
+                continue
+            limit = thresholds.get(metric, threshold)
+            if metric in HIGHER_IS_BETTER:
+                change = (expected - value) / expected
+            else:
+                change = (value - expected) / expected
+            if change > limit:
+                regressions.append(
+                        f"{name} {metric}: {value:.6g} vs baseline {expected:.6g} "
+                        f"({change:.0%} worse, threshold {limit:.0%})")
+    return regressions
+
+def get_args(argv=None):
+    """
+    Handles argument parsing for the benchmark CLI
+
+    Arguments:
+    - argv: List of string arguments, or None to use sys.argv (default)
+
+    Returns:
+    - namespace containing parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="AWBW Replay Parser benchmarks")
+    parser.add_argument("--replays", help="Directory of replays to benchmark", default="replays")
+    parser.add_argument(
+            "--scale",
+            help=("Also benchmark opening replays with their actions repeated this many times. "
+                  "The replays as they are (a scale of 1) are always benchmarked"),
+            type=int,
+            action="append")
+    parser.add_argument(
+            "--synthetic",
+            help="Also benchmark a generated replay",
+            choices=list(SYNTHETIC_PRESETS),
+            action="append",
+            default=[])
+    parser.add_argument(
+            "--repeat",
+            help="Timings are the best of this many runs",
+            type=int,
+            default=3)
+    parser.add_argument("--output", help="Path to write the JSON results to")
+    parser.add_argument("--baseline", help="Path of JSON results to compare against")
+    parser.add_argument(
+            "--threshold",
+            help="Relative change of a metric counted as a regression",
+            type=float,
+            default=0.2)
+    parser.add_argument(
+            "--metric-threshold",
+            help="Threshold for a single metric, as METRIC=VALUE",
+            action="append",
+            default=[])
+    return parser.parse_args(argv)
+
+def main(args):
+    """Runs the benchmarks, returning EXIT_FAILURE if a regression was found"""
+    scales = [1] + [scale for scale in dict.fromkeys(args.scale or []) if scale != 1]
+    results = run_suite(args.replays, scales=scales, repeat=args.repeat,
+                        synthetic_presets=args.synthetic)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        thresholds = {}
+        for item in args.metric_threshold:
+            metric, value = item.split("=", 1)
+            thresholds[metric] = float(value)
+        regressions = compare(results, baseline, args.threshold, thresholds)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return EXIT_FAILURE
+    return EXIT_SUCCESS
+
+if __name__ == "__main__":
+    sys.exit(main(get_args()))
@@ -0,0 +1,26 @@
+"""
+Base class for objects which hold a resource, e.g. a file or connections,
+until they are closed.
+
+Usage:
+
+class Database(Closeable):
+    def close(self):
+        ...
+
+with Database() as database:
+    ...
+"""
+
+class Closeable():
+    """Context manager which closes the object on exit"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """Releases the resource held by the object"""
+        raise NotImplementedError
@@ -0,0 +1,355 @@
+"""Fast decoders for the contents of an AWBW replay archive."""
+
+import collections.abc
+import json
+import re
+
+from awbw_replay import profiling
+
+# Action lines in the a{game_id} file look like:
+# p:{playerId};d:{day};a:a:3:{i:0;i:{playerId};i:1;i:{day};i:2;a:{n}:{i:0;s:{len}:"{json}";...}}
+# where each of the n strings is a JSON serialized action.
+
+_JSON_DECODER = json.JSONDecoder()
+
+# Every action starts with its type, e.g. {"action":"Fire","Move":{...
+_ACTION_TYPE_RE = re.compile(r'\s*\{\s*"action"\s*:\s*"(\w+)"')
+
+class DecodeError(ValueError):
+    """Raised when data doesn't follow the grammar expected by a decoder."""
+
+class RawAction(collections.abc.Mapping):
+    """
+    A read-only action which keeps the raw JSON document around, and only
+    decodes it the first time a field other than "action" is accessed.
+
+    The action type is read straight out of the JSON text, so scans which only
+    look at action["action"] never decode the rest of the action.
+    """
+
+    __slots__ = ("_raw", "_data", "_type")
+
+    def __init__(self, raw):
+        """
+        Arguments:
+        - raw: The JSON serialized action, as str or bytes
+        """
+        self._raw = raw
+        self._data = None
+        self._type = None
+
+    @property
+    def action_type(self):
+        """The "action" field, without decoding the whole action if possible."""
+        if self._type is None:
+            if self._data is not None:
+                self._type = self._data["action"]
+            else:
+                raw = self._raw.decode() if isinstance(self._raw, bytes) else self._raw
+                match = _ACTION_TYPE_RE.match(raw)
+                self._type = match.group(1) if match else self.data["action"]
+        return self._type
+
+    @property
+    def decoded(self):
+        """True if the JSON document has been decoded."""
+        return self._data is not None
+
+    @property
+    def data(self):
+        """The decoded action dict."""
+        if self._data is None:
+            if profiling.ENABLED:
+                with profiling.stage("json_decode"):
+                    self._data = json.loads(self._raw)
+            else:
+                self._data = json.loads(self._raw)
+            # The raw text is no longer needed
+            self._raw = None
+        return self._data
+
+    def __getitem__(self, key):
+        if key == "action" and self._data is None:
+            return self.action_type
+        return self.data[key]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        if self._data is None:
+            return f"<RawAction {self.action_type!r} (not decoded)>"
+        return f"<RawAction {self._data!r}>"
+
+    def __getstate__(self):
+        return (self._raw, self._data, self._type)
+
+    def __setstate__(self, state):
+        self._raw, self._data, self._type = state
+
+def _read_int(data, pos, terminator):
+    """
+    Reads an integer starting at pos up to the terminator byte(s).
+
+    Returns:
+    - (value, position after the terminator)
+    """
+    end = data.find(terminator, pos)
+    if end == -1:
+        raise DecodeError(f"Expected {terminator!r} after position {pos}")
+    try:
+        return int(data[pos:end]), end + len(terminator)
+    except ValueError as err:
+        raise DecodeError(f"Expected an integer at position {pos}") from err
+
+def _expect(data, pos, token):
+    """Checks that token appears at pos, and returns the position after it."""
+    if not data.startswith(token, pos):
+        raise DecodeError(f"Expected {token!r} at position {pos}")
+    return pos + len(token)
+
+def _read_action_strings(line, text, pos, raw):
+    """
+    Reads the PHP array of JSON action strings starting at pos.
+
+    Arguments:
+    - line: The whole action line as bytes
+    - text: The whole action line as str if it is pure ASCII (so string offsets
+      match byte offsets), otherwise None
+    - pos: The position of the "a:" introducing the array
+    - raw: If True, return RawActions instead of decoding the JSON
+
+    Returns:
+    - (list of decoded actions, position after the closing brace)
+    """
+    pos = _expect(line, pos, b"a:")
+    count, pos = _read_int(line, pos, b":{")
+    actions = []
+    for _ in range(count):
+        pos = _expect(line, pos, b"i:")
+        _, pos = _read_int(line, pos, b";")
+        pos = _expect(line, pos, b"s:")
+        length, pos = _read_int(line, pos, b':"')
+        end = pos + length
+        if not line.startswith(b'";', end):
+            raise DecodeError(f"String at position {pos} is not {length} bytes long")
+        if line.find(b"action", pos, end) != -1:
+            if raw:
+                actions.append(RawAction(text[pos:end] if text is not None else line[pos:end]))
+            elif profiling.ENABLED:
+                with profiling.stage("json_decode"):
+                    actions.append(_decode_json(line, text, pos, end))
+            else:
+                actions.append(_decode_json(line, text, pos, end))
+        pos = end + 2
+    return actions, _expect(line, pos, b"}")
+
+def _decode_json(line, text, start, end):
+    """Decodes the JSON document in line[start:end], without copying it if possible."""
+    if text is not None:
+        try:
+            value, value_end = _JSON_DECODER.raw_decode(text, start)
+            if value_end == end:
+                return value
+        except json.JSONDecodeError:
+            pass
+    # Leading or trailing whitespace, or non ASCII content.
+    return json.loads(line[start:end])
+
+def decode_action_line(line, raw=False):
+    """
+    Decodes a single line of the a{game_id} file in one pass.
+
+    Arguments:
+    - line: bytes of the form p:{playerId};d:{day};a:{php array}
+    - raw: If True, the actions are returned as RawActions which are decoded on
+      first use, instead of dicts
+
+    Returns:
+    - (player id, day, list of actions)
+
+    Raises:
+    - DecodeError if the line doesn't follow the expected grammar
+    """
+    text = line.decode("ascii") if line.isascii() else None
+
+    pos = _expect(line, 0, b"p:")
+    player_id, pos = _read_int(line, pos, b";d:")
+    day, pos = _read_int(line, pos, b";a:")
+
+    # The PHP array is [playerId, day, [action strings]]. Only the actions
+    # are used, the player and day are repeated in the line prefix.
+    pos = _expect(line, pos, b"a:")
+    count, pos = _read_int(line, pos, b":{")
+    actions = None
+    for _ in range(count):
+        pos = _expect(line, pos, b"i:")
+        key, pos = _read_int(line, pos, b";")
+        if key == 2:
+            actions, pos = _read_action_strings(line, text, pos, raw)
+        else:
+            pos = _expect(line, pos, b"i:")
+            _, pos = _read_int(line, pos, b";")
+    pos = _expect(line, pos, b"}")
+    if actions is None:
+        raise DecodeError("No actions array found")
+    if line[pos:].strip():
+        raise DecodeError(f"Unexpected trailing data at position {pos}")
+
+    return player_id, day, actions
+
+def _member_name(name):
+    """Converts a PHP object member name to a plain identifier, like phpobject._asdict()"""
+    if isinstance(name, str) and name[:1] == " ":
+        return name.split(None, 2)[-1]
+    return name
+
+def _load_php_value(data, pos, found_types):
+    """
+    Reads one PHP serialized value starting at pos.
+
+    Arguments:
+    - data: The serialized bytes
+    - pos: The position of the value's type character
+    - found_types: A set to add object class names to, or None
+
+    Returns:
+    - (value, position after the value)
+    """
+    # pylint: disable=too-many-return-statements
+    type_ = data[pos:pos + 2].lower()
+    if type_ == b"i:":
+        return _read_int(data, pos + 2, b";")
+    if type_ == b"s:":
+        length, pos = _read_int(data, pos + 2, b':"')
+        end = pos + length
+        if data[end:end + 2] != b'";':
+            raise DecodeError(f"String at position {pos} is not {length} bytes long")
+        return data[pos:end].decode("utf-8"), end + 2
+    if type_ == b"a:":
+        count, pos = _read_int(data, pos + 2, b":{")
+        result = {}
+        for _ in range(count):
+            key, pos = _load_php_value(data, pos, found_types)
+            result[key], pos = _load_php_value(data, pos, found_types)
+        return result, _expect(data, pos, b"}")
+    if type_ == b"o:":
+        length, pos = _read_int(data, pos + 2, b':"')
+        end = pos + length
+        if found_types is not None:
+            found_types.add(data[pos:end].decode("utf-8"))
+        count, pos = _read_int(data, _expect(data, end, b'":'), b":{")
+        result = {}
+        for _ in range(count):
+            key, pos = _load_php_value(data, pos, found_types)
+            result[_member_name(key)], pos = _load_php_value(data, pos, found_types)
+        return result, _expect(data, pos, b"}")
+    if type_ == b"n;":
+        return None, pos + 2
+    if type_ == b"d:":
+        end = data.find(b";", pos)
+        if end == -1:
+            raise DecodeError(f"Expected ';' after position {pos}")
+        return float(data[pos + 2:end]), end + 1
+    if type_ == b"b:":
+        value, pos = _read_int(data, pos + 2, b";")
+        return value != 0, pos
+    raise DecodeError(f"Unexpected type {type_!r} at position {pos}")
+
+def _skip_php_value(data, pos):
+    """
+    Skips over one PHP serialized value starting at pos, without building it.
+
+    Returns:
+    - The position after the value
+    """
+    type_ = data[pos:pos + 2].lower()
+    if type_ == b"s:":
+        length, pos = _read_int(data, pos + 2, b':"')
+        end = pos + length
+        if data[end:end + 2] != b'";':
+            raise DecodeError(f"String at position {pos} is not {length} bytes long")
+        return end + 2
+    if type_ in (b"a:", b"o:"):
+        pos += 2
+        if type_ == b"o:":
+            length, pos = _read_int(data, pos, b':"')
+            pos = _expect(data, pos + length, b'":')
+        count, pos = _read_int(data, pos, b":{")
+        for _ in range(2 * count):
+            pos = _skip_php_value(data, pos)
+        return _expect(data, pos, b"}")
+    if type_ == b"n;":
+        return pos + 2
+    if type_ in (b"i:", b"d:", b"b:"):
+        end = data.find(b";", pos)
+        if end == -1:
+            raise DecodeError(f"Expected ';' after position {pos}")
+        return end + 1
+    raise DecodeError(f"Unexpected type {type_!r} at position {pos}")
+
+def loads_php_fields(data, fields):
+    """
+    Unserializes only some of the top level fields of a PHP serialized object
+    or array, such as the {game_id} file.
+
+    Every other field is skipped over without being built, and decoding stops
+    as soon as all the fields have been found. data may be truncated after the
+    last of the fields.
+
+    Arguments:
+    - data: The PHP serialized bytes
+    - fields: Collection of the top level keys to decode
+
+    Returns:
+    - dict of the fields found
+
+    Raises:
+    - DecodeError if data doesn't follow the grammar, or ends before all the
+      fields were found
+    """
+    fields = set(fields)
+    type_ = data[:2].lower()
+    if type_ == b"o:":
+        length, pos = _read_int(data, 2, b':"')
+        pos = _expect(data, pos + length, b'":')
+    elif type_ == b"a:":
+        pos = 2
+    else:
+        raise DecodeError(f"Expected an object or array, not {type_!r}")
+    count, pos = _read_int(data, pos, b":{")
+
+    result = {}
+    for _ in range(count):
+        if len(result) == len(fields):
+            break
+        key, pos = _load_php_value(data, pos, None)
+        key = _member_name(key)
+        if key in fields and key not in result:
+            result[key], pos = _load_php_value(data, pos, None)
+        else:
+            pos = _skip_php_value(data, pos)
+    return result
+
+def loads_php(data, collect_types=False):
+    """
+    Unserializes PHP serialized data, such as the {game_id} file, in one pass.
+
+    PHP arrays and objects are both returned as dicts, giving the same result as
+    phpserialize.loads followed by replay.sanitize_phpobject.
+
+    Arguments:
+    - data: The PHP serialized bytes
+    - collect_types: If True, also return the set of object class names found
+
+    Returns:
+    - The unserialized value, or (value, set of class names) if collect_types is True
+    """
+    found_types = set() if collect_types else None
+    value, _ = _load_php_value(data, 0, found_types)
+    if collect_types:
+        return value, found_types
+    return value
@@ -0,0 +1,295 @@
+"""
+Concurrent downloading of replay archives.
+
+Downloads run on a bounded thread pool, with one keep-alive connection per
+host and thread, a shared rate limit, and retries with exponential backoff.
+Each file is written to {name}.part and renamed once complete, so a file only
+exists under its final name if it was fully downloaded. An interrupted
+download resumes from the end of its .part file. A Retry-After header on a
+429 or 503 response is waited out instead of the backoff.
+
+Usage:
+
+downloader = Downloader(jobs=4, requests_per_second=2)
+for url, result in downloader.download_all(urls, "maps/1234"):
+    if isinstance(result, Exception):
+        ...
+"""
+
+import concurrent.futures
+import email.utils
+import http.client
+import logging
+import os
+import re
+import threading
+import time
+import urllib.parse
+
+from awbw_replay.closeable import Closeable
+
+PART_SUFFIX = ".part"
+
+# Statuses worth retrying, besides connection errors
+_RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+_REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+_MAX_REDIRECTS = 5
+_CHUNK_SIZE = 64 * 1024
+
+_CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+# The Content-Range of a 416 response, with the full size of the file
+_UNSATISFIED_RANGE_RE = re.compile(r"bytes \*/(\d+)")
+
+class DownloadError(Exception):
+    """Raised when a download fails"""
+
+    def __init__(self, message, retryable=False, retry_after=None):
+        super().__init__(message)
+        self.retryable = retryable
+        # Seconds the server asked to wait before retrying, if it did
+        self.retry_after = retry_after
+
+class RateLimiter():
+    """Spaces out events shared between threads to at most a given rate"""
+
+    def __init__(self, per_second):
+        """
+        Arguments:
+        - per_second: The maximum events per second, or None for no limit
+        """
+        self._interval = 1 / per_second if per_second else 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """Blocks until the next event is allowed"""
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self._interval
+        if start > now:
+            time.sleep(start - now)
+
+def _retry_after(response):
+    """
+    Returns the seconds to wait from the Retry-After header of a response, or
+    None if there isn't a valid one.
+    """
+    value = response.getheader("Retry-After")
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0, date.timestamp() - time.time())
+
+def filename_for(url):
+    """Returns the file name a URL is downloaded to"""
+    return os.path.basename(urllib.parse.urlparse(url).path)
+
+class Downloader(Closeable):
+    """Downloads files concurrently, see the module documentation"""
+    # pylint: disable=too-many-instance-attributes
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, jobs=4, requests_per_second=2.0, retries=3, backoff=1.0, timeout=30,
+                 headers=None):
+        """
+        Arguments:
+        - jobs: The number of downloads running at once
+        - requests_per_second: The maximum requests per second over all jobs,
+          or None for no limit
+        - retries: How many times to retry a download after a failure
+        - backoff: Seconds to wait before the first retry, doubling for each
+          following retry
+        - timeout: Socket timeout in seconds
+        - headers: Optional dict of extra request headers, e.g. cookies
+        """
+        self.jobs = jobs
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.headers = dict(headers or {})
+        self._rate_limiter = RateLimiter(requests_per_second)
+        self._local = threading.local()
+        # Every connection opened by any thread, so close() can close them all
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    def close(self):
+        """Closes every open connection"""
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+
+    def _connection(self, scheme, netloc):
+        """Returns this thread's connection to a host, opening it if needed"""
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        key = (scheme, netloc)
+        connection = connections.get(key)
+        if connection is None:
+            if scheme == "https":
+                connection = http.client.HTTPSConnection(netloc, timeout=self.timeout)
+            elif scheme == "http":
+                connection = http.client.HTTPConnection(netloc, timeout=self.timeout)
+            else:
+                raise DownloadError(f"Unsupported URL scheme {scheme!r}")
+            connections[key] = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def _drop_connection(self, scheme, netloc):
+        """Closes this thread's connection to a host, so the next request reconnects"""
+        connection = getattr(self._local, "connections", {}).pop((scheme, netloc), None)
+        if connection is not None:
+            connection.close()
+            with self._connections_lock:
+                if connection in self._connections:
+                    self._connections.remove(connection)
+
+    def download(self, url, directory):
+        """
+        Downloads a URL into a directory, unless it was already downloaded.
+
+        Arguments:
+        - url: The http(s) URL of the file
+        - directory: The directory to write the file to, created if needed
+
+        Returns:
+        - The path of the downloaded file
+
+        Raises:
+        - DownloadError once every retry failed
+        """
+        dest = os.path.join(directory, filename_for(url))
+        if os.path.exists(dest):
+            logging.debug("Already downloaded %s", dest)
+            return dest
+        os.makedirs(directory, exist_ok=True)
+
+        attempt = 0
+        while True:
+            try:
+                self._fetch(url, dest)
+                return dest
+            except (DownloadError, OSError, http.client.HTTPException) as err:
+                retryable = getattr(err, "retryable", True)
+                if not retryable or attempt >= self.retries:
+                    if isinstance(err, DownloadError):
+                        raise
+                    raise DownloadError(f"Downloading {url} failed: {err}") from err
+                delay = getattr(err, "retry_after", None)
+                if delay is None:
+                    delay = self.backoff * 2 ** attempt
+                attempt += 1
+                logging.warning("Downloading %s failed (%s), retry %d in %.1fs",
+                                url, err, attempt, delay)
+                time.sleep(delay)
+
+    def _fetch(self, url, dest):
+        """Makes one attempt at downloading url to dest, resuming a .part file"""
+        part = dest + PART_SUFFIX
+        for _ in range(_MAX_REDIRECTS + 1):
+            parsed = urllib.parse.urlparse(url)
+            path = parsed.path or "/"
+            if parsed.query:
+                path += "?" + parsed.query
+            offset = os.path.getsize(part) if os.path.exists(part) else 0
+            headers = dict(self.headers)
+            if offset:
+                headers["Range"] = f"bytes={offset}-"
+
+            self._rate_limiter.wait()
+            connection = self._connection(parsed.scheme, parsed.netloc)
+            try:
+                connection.request("GET", path, headers=headers)
+                response = connection.getresponse()
+                if response.status in _REDIRECT_STATUSES:
+                    response.read()
+                    location = response.getheader("Location")
+                    if not location:
+                        raise DownloadError(f"HTTP {response.status} without a Location from {url}")
+                    url = urllib.parse.urljoin(url, location)
+                    continue
+                if response.status == 416 and offset:
+                    response.read()
+                    match = _UNSATISFIED_RANGE_RE.match(response.getheader("Content-Range", ""))
+                    if match is None or int(match.group(1)) != offset:
+                        # The .part file doesn't match the file on the server, start over
+                        logging.warning("Discarding %s, which doesn't match %s", part, url)
+                        os.remove(part)
+                        continue
+                    # Otherwise the .part file already has every byte
+                else:
+                    self._save(url, response, part, offset)
+            except BaseException:
+                # The connection's state is unknown, start over on a new one
+                self._drop_connection(parsed.scheme, parsed.netloc)
+                raise
+            os.replace(part, dest)
+            return
+        raise DownloadError(f"Too many redirects downloading {url}")
+
+    def _save(self, url, response, part, offset):
+        """Writes the response body to the .part file, checking it's complete"""
+        # pylint: disable=no-self-use
+        if response.status == 206:
+            match = _CONTENT_RANGE_RE.match(response.getheader("Content-Range", ""))
+            if match is None or int(match.group(1)) != offset:
+                response.read()
+                raise DownloadError(f"Unexpected Content-Range from {url}", retryable=True)
+            total = None if match.group(3) == "*" else int(match.group(3))
+            mode = "ab"
+        elif response.status == 200:
+            # Either a new download, or the server ignored the Range header
+            length = response.getheader("Content-Length")
+            if length is not None and not length.strip().isdigit():
+                response.close()
+                raise DownloadError(f"Invalid Content-Length {length!r} from {url}", retryable=True)
+            total = int(length) if length is not None else None
+            mode = "wb"
+        else:
+            response.read()
+            retry_after = _retry_after(response) if response.status in (429, 503) else None
+            raise DownloadError(f"HTTP {response.status} {response.reason} from {url}",
+                                retryable=response.status in _RETRY_STATUSES,
+                                retry_after=retry_after)
+
+        with open(part, mode) as stream:
+            while True:
+                chunk = response.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                stream.write(chunk)
+            size = stream.tell()
+        if total is not None and size != total:
+            # The .part file is kept, so the retry resumes from here
+            raise DownloadError(f"Connection closed after {size} of {total} bytes of {url}",
+                                retryable=True)
+
+    def download_all(self, urls, directory):
+        """
+        Downloads every URL into a directory, jobs at a time.
+
+        Returns:
+        - List of (url, path or the exception raised), in the order of urls. A
+          failed URL doesn't stop the others from being downloaded.
+        """
+        def download(url):
+            try:
+                return self.download(url, directory)
+            except Exception as err: # pylint: disable=broad-except
+                return err
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            return list(zip(urls, executor.map(download, urls)))
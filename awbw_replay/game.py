@@ -1,6 +1,7 @@
 """Classes and code to manage game state."""
 
 import collections
+import collections.abc
 
 # Base classes
 
@@ -54,3 +55,131 @@ class DefaultDict(collections.UserDict):
                 raise KeyError(f"{key} is not supported for {self.__class__.__name__}")
 
         super().__init__({**self.ALLOWED_DATA, **data})
+
+class Record(collections.abc.MutableMapping):
+    """
+    A compact, fixed-field alternative to DefaultDict. Subclasses list their
+    fields and defaults in ALLOWED_DATA, and must declare __slots__ = ().
+
+    The field layout is worked out once when the subclass is created, and each
+    instance only stores a list of values in field order. Records behave like
+    dicts whose keys are always exactly the ALLOWED_DATA keys: unknown keys
+    raise a KeyError, and fields can be changed but not deleted.
+
+    Field values are expected to be immutable (numbers, strings, booleans), so
+    copying a record only copies its list of values.
+    """
+
+    __slots__ = ("_values",)
+
+    ALLOWED_DATA = {}
+
+    # Computed from ALLOWED_DATA by __init_subclass__
+    _FIELDS = ()
+    _INDEX = {}
+    _DEFAULTS = []
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._FIELDS = tuple(cls.ALLOWED_DATA)
+        cls._INDEX = {key: i for i, key in enumerate(cls._FIELDS)}
+        cls._DEFAULTS = list(cls.ALLOWED_DATA.values())
+
+    def __init__(self, data=None, **kwargs):
+        values = self._DEFAULTS.copy()
+        index = self._INDEX
+        for source in (data, kwargs):
+            if not source:
+                continue
+            for key, value in source.items():
+                try:
+                    values[index[key]] = value
+                except KeyError:
+                    raise KeyError(
+                            f"{key} is not supported for {self.__class__.__name__}") from None
+        self._values = values
+
+    def __getitem__(self, key):
+        return self._values[self._INDEX[key]]
+
+    def __setitem__(self, key, value):
+        try:
+            self._values[self._INDEX[key]] = value
+        except KeyError:
+            raise KeyError(f"{key} is not supported for {self.__class__.__name__}") from None
+
+    def __delitem__(self, key):
+        raise TypeError(f"Fields of {self.__class__.__name__} cannot be deleted")
+
+    def __contains__(self, key):
+        return key in self._INDEX
+
+    def __iter__(self):
+        return iter(self._FIELDS)
+
+    def __len__(self):
+        return len(self._FIELDS)
+
+    def get(self, key, default=None):
+        i = self._INDEX.get(key)
+        return default if i is None else self._values[i]
+
+    def items(self):
+        return _RecordItemsView(self)
+
+    def values(self):
+        return _RecordValuesView(self)
+
+    def __eq__(self, other):
+        if type(other) is type(self):
+            return self._values == other._values
+        return super().__eq__(other)
+
+    __hash__ = None
+
+    def __copy__(self):
+        record = self.__class__.__new__(self.__class__)
+        record._values = self._values.copy()
+        return record
+
+    def __deepcopy__(self, memo):
+        # Field values are immutable, so there's nothing deeper to copy
+        return self.__copy__()
+
+    copy = __copy__
+
+    def __getstate__(self):
+        return dict(self.items())
+
+    def __setstate__(self, state):
+        self._values = self._DEFAULTS.copy()
+        for key, value in state.items():
+            self[key] = value
+
+    def __or__(self, other):
+        if not isinstance(other, collections.abc.Mapping):
+            return NotImplemented
+        record = self.__copy__()
+        record.update(other)
+        return record
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({dict(self.items())!r})"
+
+class _RecordItemsView(collections.abc.ItemsView):
+    """ItemsView which iterates a Record's values directly"""
+
+    def __iter__(self):
+        # pylint: disable=protected-access
+        return zip(self._mapping._FIELDS, self._mapping._values)
+
+class _RecordValuesView(collections.abc.ValuesView):
+    """ValuesView which iterates a Record's values directly"""
+
+    def __iter__(self):
+        # pylint: disable=protected-access
+        return iter(self._mapping._values)
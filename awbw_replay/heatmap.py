@@ -0,0 +1,253 @@
+"""
+Dense accumulation of (x, y) coordinate counts, e.g. where units moved or fought.
+
+Requires numpy, which is an optional dependency of this package.
+"""
+
+import json
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# The number of buffered coordinates which triggers adding them to the counts
+_FLUSH_SIZE = 1 << 16
+
+class Heatmap():
+    """
+    Counts of (x, y) coordinates, stored as a dense 2D integer array indexed
+    [x, y]. The array grows to fit the largest coordinates added, or can be
+    sized from the map bounds up front.
+
+    Coordinates are buffered and added to the array in bulk, so adding the
+    tiles of a path costs a list extend rather than a numpy call.
+
+    Usage:
+
+    heatmap = Heatmap()
+    heatmap.add([1, 1, 2], [15, 14, 14])
+    heatmap.add_point(4, 9)
+    print(heatmap.to_text())
+    """
+
+    def __init__(self, width=0, height=0):
+        """
+        Arguments:
+        - width, height: The initial size of the array, e.g. the map size
+        """
+        if np is None:
+            raise ImportError("Heatmap requires numpy")
+        self._counts = np.zeros((width, height), dtype=np.int64)
+        self._xs = []
+        self._ys = []
+
+    def __getstate__(self):
+        return {"counts": self.counts}
+
+    def __setstate__(self, state):
+        self._counts = np.array(state["counts"], dtype=np.int64)
+        self._xs = []
+        self._ys = []
+
+    def __eq__(self, other):
+        if not isinstance(other, Heatmap):
+            return NotImplemented
+        return self.items() == other.items()
+
+    __hash__ = None
+
+    def add(self, xs, ys):
+        """Counts each (xs[i], ys[i]) coordinate once"""
+        self._xs.extend(xs)
+        self._ys.extend(ys)
+        if len(self._xs) >= _FLUSH_SIZE:
+            self._flush()
+
+    def add_point(self, x, y):
+        """Counts a single coordinate once"""
+        self._xs.append(x)
+        self._ys.append(y)
+        if len(self._xs) >= _FLUSH_SIZE:
+            self._flush()
+
+    def reserve(self, width, height):
+        """Grows the array to at least width by height, e.g. once the map size is known"""
+        self._fit(width, height)
+
+    def _fit(self, width, height):
+        """Grows the array to at least width by height"""
+        old_width, old_height = self._counts.shape
+        if width <= old_width and height <= old_height:
+            return
+        counts = np.zeros((max(width, old_width), max(height, old_height)), dtype=np.int64)
+        counts[:old_width, :old_height] = self._counts
+        self._counts = counts
+
+    def _flush(self):
+        """Adds the buffered coordinates to the array"""
+        if not self._xs:
+            return
+        xs = np.array(self._xs, dtype=np.intp)
+        ys = np.array(self._ys, dtype=np.intp)
+        self._xs = []
+        self._ys = []
+        if xs.min() < 0 or ys.min() < 0:
+            raise ValueError("Heatmap coordinates can't be negative")
+        self._fit(int(xs.max()) + 1, int(ys.max()) + 1)
+        np.add.at(self._counts, (xs, ys), 1)
+
+    @property
+    def counts(self):
+        """A read-only view of the counts array, indexed [x, y]"""
+        self._flush()
+        view = self._counts.view()
+        view.flags.writeable = False
+        return view
+
+    def merge(self, other):
+        """Adds the counts of another Heatmap into this one"""
+        other_counts = other.counts
+        self._flush()
+        self._fit(*other_counts.shape)
+        width, height = other_counts.shape
+        self._counts[:width, :height] += other_counts
+
+    def items(self):
+        """
+        Returns:
+        - List of ((x, y), count) of every counted coordinate, most frequent
+          first, then ordered by x and y
+        """
+        counts = self.counts
+        xs, ys = np.nonzero(counts)
+        values = counts[xs, ys]
+        order = np.lexsort((ys, xs, -values))
+        return [((x, y), count) for x, y, count
+                in zip(xs[order].tolist(), ys[order].tolist(), values[order].tolist())]
+
+    def to_text(self):
+        """
+        Returns the counts in the "(x, y) count;" format read by
+        awbw_coordinate_heatmap.userscript.js, most frequent first
+        """
+        return "".join(f"({x}, {y}) {count};" for (x, y), count in self.items())
+
+    def to_json(self):
+        """Returns the counts as a JSON serializable list of [x, y, count], see from_json"""
+        return [[x, y, count] for (x, y), count in self.items()]
+
+    @classmethod
+    def from_json(cls, data):
+        """Returns a Heatmap of the counts returned by to_json"""
+        if not data:
+            return cls()
+        xs, ys, values = (np.array(column, dtype=np.intp) for column in zip(*data))
+        counts = np.zeros((int(xs.max()) + 1, int(ys.max()) + 1), dtype=np.int64)
+        np.add.at(counts, (xs, ys), values)
+        return cls.from_counts(counts)
+
+    def save(self, file):
+        """Writes the counts array to a .npy file (path or file object)"""
+        np.save(file, self.counts)
+
+    @classmethod
+    def from_counts(cls, counts):
+        """Returns a Heatmap of a copy of a 2D counts array, indexed [x, y]"""
+        heatmap = cls()
+        heatmap._counts = np.array(counts, dtype=np.int64) # pylint: disable=protected-access
+        return heatmap
+
+    @classmethod
+    def load(cls, file):
+        """Returns a Heatmap of a counts array written by save"""
+        return cls.from_counts(np.load(file))
+
+class HeatmapSet():
+    """
+    A Heatmap per name, e.g. per unit type, created the first time a name is
+    used. Names keep the order they were first used in.
+
+    Usage:
+
+    moves = HeatmapSet()
+    moves["Infantry"].add([1, 1], [15, 14])
+    """
+
+    def __init__(self, width=0, height=0):
+        """
+        Arguments:
+        - width, height: The initial size of each Heatmap, e.g. the map size
+        """
+        if np is None:
+            raise ImportError("HeatmapSet requires numpy")
+        self._width = width
+        self._height = height
+        self._heatmaps = {}
+
+    def __getitem__(self, name):
+        heatmap = self._heatmaps.get(name)
+        if heatmap is None:
+            heatmap = self._heatmaps[name] = Heatmap(self._width, self._height)
+        return heatmap
+
+    def __contains__(self, name):
+        return name in self._heatmaps
+
+    def __iter__(self):
+        return iter(self._heatmaps)
+
+    def __len__(self):
+        return len(self._heatmaps)
+
+    def __eq__(self, other):
+        if not isinstance(other, HeatmapSet):
+            return NotImplemented
+        return self._heatmaps == other._heatmaps # pylint: disable=protected-access
+
+    __hash__ = None
+
+    def reserve(self, width, height):
+        """Grows every Heatmap, and the ones created later, to at least width by height"""
+        self._width = max(self._width, width)
+        self._height = max(self._height, height)
+        for heatmap in self._heatmaps.values():
+            heatmap.reserve(width, height)
+
+    def items(self):
+        """Returns a list of (name, Heatmap)"""
+        return list(self._heatmaps.items())
+
+    def merge(self, other):
+        """Adds the counts of every Heatmap of another HeatmapSet into this one"""
+        for name, heatmap in other.items():
+            self[name].merge(heatmap)
+
+    def to_json(self):
+        """Returns the counts as a JSON serializable dict of name -> Heatmap.to_json()"""
+        return {name: heatmap.to_json() for name, heatmap in self._heatmaps.items()}
+
+    @classmethod
+    def from_json(cls, data):
+        """Returns a HeatmapSet of the counts returned by to_json"""
+        heatmaps = cls()
+        for name, heatmap in data.items():
+            heatmaps._heatmaps[name] = Heatmap.from_json(heatmap) # pylint: disable=protected-access
+        return heatmaps
+
+    def dump(self, file):
+        """Writes to_json() to a text file object"""
+        json.dump(self.to_json(), file)
+
+    def save(self, file):
+        """Writes the counts array of each Heatmap to a .npz file, keyed by name"""
+        np.savez(file, **{name: heatmap.counts for name, heatmap in self._heatmaps.items()})
+
+    @classmethod
+    def load(cls, file):
+        """Returns a HeatmapSet of the arrays written by save"""
+        heatmaps = cls()
+        with np.load(file) as arrays:
+            for name in arrays.files:
+                heatmaps._heatmaps[name] = Heatmap.from_counts(arrays[name]) # pylint: disable=protected-access
+        return heatmaps
@@ -0,0 +1,417 @@
+"""
+A SQLite index of a corpus of replays, for querying games and their per-day
+statistics without opening the replays again.
+
+Each replay is parsed once, in a single pass, into these tables:
+- files: Path, size, modification time and ReplayCache.key of each replay
+  archive, and the error if it couldn't be indexed
+- games: games_id, maps_id, name, fog, days, number of actions and winner
+- players: Each player of a game, with their CO, team and whether they were
+  eliminated by the end of the replay
+- day_stats: Each player's funds and awbw.PlayerStats at the end of each day
+
+Usage:
+
+python -m awbw_replay.index build maps/1234 --db corpus.sqlite
+python -m awbw_replay.index query --db corpus.sqlite --map-id 1234 --co Sensei --co Hawke \
+    --min-days 20
+
+with CorpusIndex("corpus.sqlite") as index:
+    index.add_directory("maps/1234")
+    for path in index.find_replays(maps_id=1234, cos=["Sensei", "Hawke"], min_days=20):
+        ...
+    funds = index.day_series(games_id, "funds")
+"""
+
+import argparse
+import collections
+import logging
+import os
+import sqlite3
+import sys
+
+from awbw_replay.analysis import Analyzer, Needs, run_analyzers
+from awbw_replay.closeable import Closeable
+from awbw_replay.replay import AWBWReplay, ReplayCache
+
+EXIT_SUCCESS = 0
+EXIT_FAILURE = 1
+
+# Bump whenever the schema or the indexed values change, to rebuild existing indexes
+INDEX_VERSION = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    key TEXT NOT NULL,
+    games_id INTEGER,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS games (
+    games_id INTEGER PRIMARY KEY,
+    maps_id INTEGER,
+    name TEXT,
+    fog INTEGER,
+    days INTEGER,
+    actions INTEGER,
+    winner_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS players (
+    games_id INTEGER NOT NULL,
+    players_id INTEGER NOT NULL,
+    users_id INTEGER,
+    player_order INTEGER,
+    team TEXT,
+    co_id INTEGER,
+    co_name TEXT COLLATE NOCASE,
+    eliminated INTEGER,
+    PRIMARY KEY (games_id, players_id)
+);
+CREATE TABLE IF NOT EXISTS day_stats (
+    games_id INTEGER NOT NULL,
+    players_id INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    funds INTEGER,
+    units INTEGER,
+    unit_value INTEGER,
+    hp_value REAL,
+    properties INTEGER,
+    income INTEGER,
+    PRIMARY KEY (games_id, players_id, day)
+);
+CREATE INDEX IF NOT EXISTS games_maps_id ON games (maps_id);
+CREATE INDEX IF NOT EXISTS players_co_name ON players (co_name);
+CREATE INDEX IF NOT EXISTS files_games_id ON files (games_id);
+"""
+
+# The day_stats columns a time series can be read for
+DAY_STAT_FIELDS = ("funds", "units", "unit_value", "hp_value", "properties", "income")
+
+# CO image names which aren't simply the capitalized CO name
+_CO_IMAGE_NAMES = {
+    "vonbolt": "Von Bolt",
+}
+
+def co_name(co_image):
+    """
+    Returns the name of a CO from the co_image of a replay's player, e.g.
+    "Sensei" for "sensei.png", or None if there isn't one.
+    """
+    if not co_image:
+        return None
+    stem = os.path.splitext(os.path.basename(co_image))[0].lower()
+    return _CO_IMAGE_NAMES.get(stem, stem.capitalize())
+
+class _GameIndexer(Analyzer):
+    """Collects the rows of a single replay"""
+
+    NEEDS = Needs.STATE
+
+    def __init__(self):
+        self.days = 0
+        self.actions = 0
+        self.final_state = None
+        # Day -> player ID -> the day_stats values at the end of that day
+        self.day_stats = collections.defaultdict(dict)
+
+    def start(self, game_info):
+        self.days = game_info["day"]
+
+    def on_action(self, action, state, delta):
+        self.actions += 1
+        day = state.game_info["day"]
+        self.days = max(self.days, day)
+        # Overwritten by every action, so each day keeps its last values
+        stats = self.day_stats[day]
+        for p_id, player in state.players.items():
+            player_stats = state.player_stats.get(p_id)
+            if player_stats is None:
+                stats[p_id] = (player["funds"], 0, 0, 0.0, 0, 0)
+            else:
+                stats[p_id] = (player["funds"], player_stats["units"], player_stats["unit_value"],
+                               player_stats["hp_value"], player_stats["properties"],
+                               player_stats["income"])
+        self.final_state = state
+
+    def merge(self, other):
+        raise TypeError("Indexers of separate replays can't be merged")
+
+def _winner(players):
+    """Returns the ID of the only player who wasn't eliminated, or None"""
+    remaining = [p_id for p_id, player in players.items() if not player["eliminated"]]
+    if len(players) > 1 and len(remaining) == 1:
+        return remaining[0]
+    return None
+
+class CorpusIndex(Closeable):
+    """See the module documentation"""
+
+    def __init__(self, path):
+        """
+        Arguments:
+        - path: The SQLite database file, created if it doesn't exist
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version != INDEX_VERSION:
+            if version:
+                logging.info("Rebuilding index %s of version %d", path, version)
+            with self.connection:
+                for table in ["files", "games", "players", "day_stats"]:
+                    self.connection.execute(f"DROP TABLE IF EXISTS {table}")
+                self.connection.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        self.connection.executescript(_SCHEMA)
+
+    def close(self):
+        """Closes the database"""
+        self.connection.close()
+
+    def _file_row(self, path):
+        return self.connection.execute(
+                "SELECT size, mtime_ns, key FROM files WHERE path = ?", (path,)).fetchone()
+
+    def add_replay(self, path):
+        """
+        Indexes a replay archive, unless it's already indexed and unchanged.
+
+        Arguments:
+        - path: The replay archive
+
+        Returns:
+        - True if the replay was (re)indexed
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        row = self._file_row(path)
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return False
+        key = ReplayCache.key(path)
+        if row is not None and row[2] == key:
+            with self.connection:
+                self.connection.execute("UPDATE files SET size = ?, mtime_ns = ? WHERE path = ?",
+                                        (stat.st_size, stat.st_mtime_ns, path))
+            return False
+
+        games_id = None
+        error = None
+        indexer = _GameIndexer()
+        try:
+            with AWBWReplay(path) as replay:
+                game_info = replay.game_info()
+                games_id = game_info["id"]
+                run_analyzers(replay, [indexer])
+        except Exception as err: # pylint: disable=broad-except
+            logging.error("Failed to index %s: %s", path, err)
+            error = f"{type(err).__name__}: {err}"
+
+        # Each replay is a transaction, so an interrupted build keeps the
+        # replays indexed so far
+        with self.connection:
+            self._remove_game_of(path)
+            if error is None:
+                self._insert_game(game_info, indexer)
+            self.connection.execute(
+                    "INSERT OR REPLACE INTO files (path, size, mtime_ns, key, games_id, error)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (path, stat.st_size, stat.st_mtime_ns, key,
+                     games_id if error is None else None, error))
+        return True
+
+    def _remove_game_of(self, path):
+        """Deletes the rows of the game previously indexed from a file, unless another has it"""
+        row = self.connection.execute(
+                "SELECT games_id FROM files WHERE path = ?", (path,)).fetchone()
+        if row is None or row[0] is None:
+            return
+        others = self.connection.execute(
+                "SELECT COUNT(*) FROM files WHERE games_id = ? AND path != ?",
+                (row[0], path)).fetchone()[0]
+        if not others:
+            for table in ["games", "players", "day_stats"]:
+                self.connection.execute(f"DELETE FROM {table} WHERE games_id = ?", (row[0],))
+
+    def _insert_game(self, game_info, indexer):
+        """Inserts the rows collected by a _GameIndexer"""
+        games_id = game_info["id"]
+        # Another file may hold the same game
+        for table in ["games", "players", "day_stats"]:
+            self.connection.execute(f"DELETE FROM {table} WHERE games_id = ?", (games_id,))
+        final_players = indexer.final_state.players if indexer.final_state is not None else {}
+        self.connection.execute(
+                "INSERT INTO games (games_id, maps_id, name, fog, days, actions, winner_id)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (games_id, game_info["maps_id"], game_info.get("name"), game_info.get("fog") == "Y",
+                 indexer.days, indexer.actions, _winner(final_players)))
+        self.connection.executemany(
+                "INSERT INTO players (games_id, players_id, users_id, player_order, team, co_id,"
+                " co_name, eliminated) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(games_id, player["id"], player.get("users_id"), player.get("order"),
+                  player.get("team"), player.get("co_id"), co_name(player.get("co_image")),
+                  final_players[player["id"]]["eliminated"] if player["id"] in final_players
+                  else player.get("eliminated") == "Y")
+                 for player in game_info["players"].values()])
+        self.connection.executemany(
+                "INSERT INTO day_stats (games_id, players_id, day, funds, units, unit_value,"
+                " hp_value, properties, income) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(games_id, p_id, day) + values
+                 for day, stats in sorted(indexer.day_stats.items())
+                 for p_id, values in stats.items()])
+
+    def add_directory(self, directory):
+        """
+        Indexes every .zip replay in a directory, skipping unchanged replays,
+        and drops replays of the directory which were deleted.
+
+        Returns:
+        - The number of replays (re)indexed
+        """
+        directory = os.path.abspath(directory)
+        paths = sorted(os.path.join(directory, filename) for filename in os.listdir(directory)
+                       if filename.lower().endswith(".zip"))
+        indexed = 0
+        for path in paths:
+            logging.info("Indexing %s", path)
+            indexed += self.add_replay(path)
+
+        existing = set(paths)
+        with self.connection:
+            for (path,) in self.connection.execute("SELECT path FROM files").fetchall():
+                if os.path.dirname(path) == directory and path not in existing:
+                    self._remove_game_of(path)
+                    self.connection.execute("DELETE FROM files WHERE path = ?", (path,))
+        return indexed
+
+    def find_games(self, maps_id=None, cos=None, min_days=None, max_days=None, winner_co=None):
+        """
+        Returns the IDs of the indexed games matching every given condition.
+
+        Arguments:
+        - maps_id: The map played
+        - cos: List of CO names which must all be played, by separate players,
+          e.g. ["Sensei", "Hawke"]. Case insensitive.
+        - min_days, max_days: Bounds on the days the replay lasted, inclusive
+        - winner_co: The name of the winning player's CO
+        """
+        conditions = []
+        params = []
+        if maps_id is not None:
+            conditions.append("games.maps_id = ?")
+            params.append(maps_id)
+        if min_days is not None:
+            conditions.append("games.days >= ?")
+            params.append(min_days)
+        if max_days is not None:
+            conditions.append("games.days <= ?")
+            params.append(max_days)
+        if winner_co is not None:
+            conditions.append("EXISTS (SELECT 1 FROM players"
+                              " WHERE players.games_id = games.games_id"
+                              " AND players.players_id = games.winner_id AND players.co_name = ?)")
+            params.append(winner_co)
+        for name, count in collections.Counter(co.lower() for co in cos or []).items():
+            conditions.append("(SELECT COUNT(*) FROM players"
+                              " WHERE players.games_id = games.games_id"
+                              " AND players.co_name = ?) >= ?")
+            params.extend([name, count])
+        query = "SELECT games_id FROM games"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY games_id"
+        return [games_id for (games_id,) in self.connection.execute(query, params)]
+
+    def find_replays(self, **conditions):
+        """Returns the paths of the replay archives of the games matching find_games()"""
+        games_ids = self.find_games(**conditions)
+        paths = []
+        for games_id in games_ids:
+            paths.extend(path for (path,) in self.connection.execute(
+                    "SELECT path FROM files WHERE games_id = ? ORDER BY path", (games_id,)))
+        return paths
+
+    def game(self, games_id):
+        """
+        Returns a dict of the games row of a game, with a "players" list of its
+        players rows as dicts, or None if it isn't indexed.
+        """
+        cursor = self.connection.execute("SELECT * FROM games WHERE games_id = ?", (games_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        game = dict(zip([column[0] for column in cursor.description], row))
+        cursor = self.connection.execute(
+                "SELECT * FROM players WHERE games_id = ? ORDER BY player_order, players_id",
+                (games_id,))
+        columns = [column[0] for column in cursor.description]
+        game["players"] = [dict(zip(columns, row)) for row in cursor]
+        return game
+
+    def day_series(self, games_id, field="funds"):
+        """
+        Returns a time series of a player statistic over a game.
+
+        Arguments:
+        - games_id: The game
+        - field: One of DAY_STAT_FIELDS
+
+        Returns:
+        - dict of player ID -> list of (day, value at the end of that day)
+        """
+        if field not in DAY_STAT_FIELDS:
+            raise ValueError(f"field must be one of {DAY_STAT_FIELDS}, not {field!r}")
+        series = collections.defaultdict(list)
+        for p_id, day, value in self.connection.execute(
+                f"SELECT players_id, day, {field} FROM day_stats WHERE games_id = ?"
+                " ORDER BY players_id, day", (games_id,)):
+            series[p_id].append((day, value))
+        return dict(series)
+
+def get_args(argv=None):
+    """
+    Handles argument parsing for the index CLI
+
+    Arguments:
+    - argv: List of string arguments, or None to use sys.argv (default)
+
+    Returns:
+    - namespace containing parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="AWBW Replay corpus index")
+    parser.add_argument("--db", help="The index database file", default="corpus.sqlite")
+    parser.add_argument(
+            "--verbose",
+            "-v",
+            help="Set the logging verbosity",
+            default="WARNING",
+            choices=["CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG", "NOTSET"])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Index the replays of directories")
+    build.add_argument("directories", help="Directories of .zip replays", nargs="+")
+
+    query = subparsers.add_parser("query", help="Print the paths of matching replays")
+    query.add_argument("--map-id", help="The maps_id played", type=int)
+    query.add_argument("--co", help="A CO played in the game, may be repeated", action="append")
+    query.add_argument("--min-days", help="The minimum days the game lasted", type=int)
+    query.add_argument("--max-days", help="The maximum days the game lasted", type=int)
+    query.add_argument("--winner-co", help="The CO of the winner")
+    return parser.parse_args(argv)
+
+def main(args):
+    """Builds or queries the index"""
+    logging.basicConfig(level=args.verbose)
+    with CorpusIndex(args.db) as index:
+        if args.command == "build":
+            for directory in args.directories:
+                indexed = index.add_directory(directory)
+                print(f"Indexed {indexed} replays of {directory}")
+        else:
+            for path in index.find_replays(maps_id=args.map_id, cos=args.co, min_days=args.min_days,
+                                           max_days=args.max_days, winner_co=args.winner_co):
+                print(path)
+    return EXIT_SUCCESS
+
+if __name__ == "__main__":
+    sys.exit(main(get_args()))
@@ -0,0 +1,165 @@
+"""
+A persistent record of per-replay analysis results, for incremental re-analysis.
+
+Results are keyed by ReplayCache.key, i.e. the contents of the replay archive
+and PARSER_VERSION, plus a version of the analysis chosen by the caller. A
+replay whose archive, the parser and the analysis are all unchanged is looked
+up instead of analyzed again.
+
+The manifest is a JSON lines file, and each result is appended and flushed as
+soon as it is recorded, so an interrupted run keeps the results so far and the
+next run resumes from there.
+
+Usage:
+
+with ResultsManifest("maps/1234/manifest.jsonl", version=1) as manifest:
+    for path in paths:
+        result = manifest.lookup(path)
+        if result is None:
+            result = analyze(path)
+            manifest.record(path, result)
+    manifest.compact(keep=paths)
+"""
+
+import json
+import logging
+import os
+import tempfile
+
+from awbw_replay.closeable import Closeable
+from awbw_replay.replay import ReplayCache
+
+class ResultsManifest(Closeable):
+    """See the module documentation"""
+
+    def __init__(self, path, version=0):
+        """
+        Arguments:
+        - path: The JSON lines file to keep results in. Created if it doesn't exist.
+        - version: JSON serializable version of the analysis. Bump it whenever
+          the analysis changes, to invalidate results recorded by older versions.
+        """
+        self.path = path
+        self.version = version
+        # Key -> entry, for the results
+        self._entries = {}
+        # File name -> entry, so unchanged files aren't hashed again
+        self._files = {}
+        self._load()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._open()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def close(self):
+        """Closes the manifest file"""
+        self._stream.close()
+
+    def _open(self):
+        """Opens the manifest file for appending entries"""
+        # pylint: disable=consider-using-with
+        self._stream = open(self.path, "a+b")
+        if self._stream.tell():
+            self._stream.seek(-1, os.SEEK_END)
+            if self._stream.read(1) != b"\n":
+                # End the partial line of an interrupted run, so it doesn't
+                # swallow the next entry
+                self._stream.write(b"\n")
+
+    def _load(self):
+        """Reads the existing entries. Later lines override earlier ones."""
+        try:
+            stream = open(self.path, "r", encoding="utf-8") # pylint: disable=consider-using-with
+        except FileNotFoundError:
+            return
+        with stream:
+            for line_number, line in enumerate(stream, start=1):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Most likely the last line of an interrupted run
+                    logging.warning("Ignoring unreadable line %d of %s", line_number, self.path)
+                    continue
+                if entry.get("version") != self.version:
+                    continue
+                self._add(entry)
+
+    def _add(self, entry):
+        self._entries[entry["key"]] = entry
+        self._files[entry["name"]] = entry
+
+    def _key(self, path, stat=None):
+        """Returns the key of a replay, reusing the recorded key if the file is unchanged"""
+        stat = stat or os.stat(path)
+        entry = self._files.get(os.path.basename(path))
+        if (entry is not None and entry["size"] == stat.st_size
+                and entry["mtime_ns"] == stat.st_mtime_ns):
+            return entry["key"]
+        return ReplayCache.key(path)
+
+    def lookup(self, path):
+        """
+        Returns the result recorded for a replay archive, or None if the
+        archive, parser or analysis changed since (or it was never recorded).
+        """
+        stat = os.stat(path)
+        key = self._key(path, stat)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        name = os.path.basename(path)
+        if entry["name"] != name or entry["mtime_ns"] != stat.st_mtime_ns:
+            # Same contents under another name or time, so remember the file
+            # to skip hashing it next time
+            self._write(dict(entry, name=name, size=stat.st_size, mtime_ns=stat.st_mtime_ns))
+        return entry["result"]
+
+    def record(self, path, result):
+        """
+        Records the result of a replay archive.
+
+        Arguments:
+        - path: The replay archive
+        - result: JSON serializable result of analyzing it
+        """
+        stat = os.stat(path)
+        self._write({
+            "key": self._key(path, stat),
+            "version": self.version,
+            "name": os.path.basename(path),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "result": result,
+        })
+
+    def _write(self, entry):
+        """Appends an entry to the manifest file"""
+        self._add(entry)
+        self._stream.write(json.dumps(entry, separators=(",", ":")).encode("utf-8") + b"\n")
+        self._stream.flush()
+
+    def compact(self, keep=None):
+        """
+        Rewrites the manifest with only the latest entry of each file, dropping
+        entries of older versions.
+
+        Arguments:
+        - keep: Optional list of paths (or names) of replay archives. Entries of
+          other files are dropped.
+        """
+        if keep is not None:
+            names = {os.path.basename(path) for path in keep}
+            self._files = {name: entry for name, entry in self._files.items() if name in names}
+        self._entries = {entry["key"]: entry for entry in self._files.values()}
+
+        self._stream.close()
+        directory = os.path.dirname(self.path) or "."
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=directory, suffix=".tmp",
+                                         delete=False) as stream:
+            for entry in self._files.values():
+                stream.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        os.replace(stream.name, self.path)
+        self._open()
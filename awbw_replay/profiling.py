@@ -0,0 +1,203 @@
+"""
+Instrumentation of the replay parsing and game state hot paths.
+
+Profiling is off by default, and every instrumented call site first checks
+ENABLED, so it costs a global lookup when disabled. Once enabled, each stage
+records how many times it ran, the total and a histogram of its latencies, and
+optionally the net change in memory traced by tracemalloc over each run. Memory
+freed within a stage counts against it, so this is what a stage kept rather
+than everything it allocated, and can be negative.
+
+Stages:
+- zip_read: Reading a file's compressed bytes out of the replay archive
+- decompress: gzip decompressing an archive file
+- line_tokenize: Splitting the actions file into lines
+- php_decode: Unserializing the game info file
+- action_line_decode: Decoding a line of the actions file, including json_decode
+- json_decode: Decoding the JSON of a single action
+- apply.{action type}: Applying an action to a game state, e.g. apply.Fire
+
+Usage:
+
+profiling.enable(track_memory=True)
+with AWBWReplay("52963.zip") as replay:
+    ...
+profiling.disable()
+print(profiling.format_report())
+"""
+
+import contextlib
+import json
+import time
+import tracemalloc
+
+ENABLED = False
+
+# Stage name -> _StageStats
+_stages = {}
+# Counter name -> value
+_counters = {}
+_TRACK_MEMORY = False
+_STARTED_TRACEMALLOC = False
+
+_NULL_STAGE = contextlib.nullcontext()
+
+class _StageStats():
+    """Accumulated measurements of a single stage"""
+
+    __slots__ = ("count", "total_ns", "max_ns", "histogram", "net_traced_bytes")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        # Bucket k counts latencies in [2^(k-1), 2^k) nanoseconds
+        self.histogram = {}
+        self.net_traced_bytes = 0
+
+    def as_dict(self):
+        """Returns the stats as a JSON serializable dict"""
+        return {
+            "count": self.count,
+            "total_ms": self.total_ns / 1e6,
+            "mean_us": self.total_ns / self.count / 1e3 if self.count else 0,
+            "max_us": self.max_ns / 1e3,
+            # Upper bound of each bucket in microseconds -> count
+            "histogram_us": {f"{2**bucket / 1e3:g}": count
+                             for bucket, count in sorted(self.histogram.items())},
+            "net_traced_bytes": self.net_traced_bytes,
+        }
+
+class _Stage():
+    """Context manager timing one run of a stage"""
+
+    __slots__ = ("name", "start", "memory")
+
+    def __init__(self, name):
+        self.name = name
+        self.start = 0
+        self.memory = 0
+
+    def __enter__(self):
+        if _TRACK_MEMORY:
+            self.memory = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        elapsed = time.perf_counter_ns() - self.start
+        net_traced = 0
+        if _TRACK_MEMORY:
+            net_traced = tracemalloc.get_traced_memory()[0] - self.memory
+        record(self.name, elapsed, net_traced)
+
+def enable(track_memory=False):
+    """
+    Starts recording.
+
+    Arguments:
+    - track_memory: If True, also record the net change in memory traced by
+      tracemalloc over each stage. This slows everything down considerably.
+    """
+    # pylint: disable=global-statement
+    global ENABLED, _TRACK_MEMORY, _STARTED_TRACEMALLOC
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _STARTED_TRACEMALLOC = True
+    _TRACK_MEMORY = track_memory
+    ENABLED = True
+
+def disable():
+    """Stops recording. The results so far are kept until reset()."""
+    # pylint: disable=global-statement
+    global ENABLED, _TRACK_MEMORY, _STARTED_TRACEMALLOC
+    ENABLED = False
+    _TRACK_MEMORY = False
+    if _STARTED_TRACEMALLOC:
+        tracemalloc.stop()
+        _STARTED_TRACEMALLOC = False
+
+def reset():
+    """Clears every recorded result"""
+    _stages.clear()
+    _counters.clear()
+
+def stage(name):
+    """
+    Returns a context manager which records the time spent in it under the
+    given stage name, or one that does nothing when profiling is disabled.
+    """
+    if not ENABLED:
+        return _NULL_STAGE
+    return _Stage(name)
+
+def record(name, elapsed_ns, net_traced_bytes=0):
+    """Records one run of a stage, for callers doing their own timing"""
+    stats = _stages.get(name)
+    if stats is None:
+        stats = _stages[name] = _StageStats()
+    stats.count += 1
+    stats.total_ns += elapsed_ns
+    stats.max_ns = max(stats.max_ns, elapsed_ns)
+    bucket = elapsed_ns.bit_length()
+    stats.histogram[bucket] = stats.histogram.get(bucket, 0) + 1
+    stats.net_traced_bytes += net_traced_bytes
+
+def count(name, value=1):
+    """Adds value to the named counter, e.g. the number of bytes read"""
+    if ENABLED:
+        _counters[name] = _counters.get(name, 0) + value
+
+def report():
+    """
+    Returns:
+    - A JSON serializable dict of the stages and counters recorded so far
+    """
+    return {
+        "stages": {name: stats.as_dict() for name, stats in sorted(_stages.items())},
+        "counters": dict(sorted(_counters.items())),
+    }
+
+def snapshot():
+    """
+    Returns the raw measurements recorded so far, which merge() adds to the
+    measurements of another process, e.g. of a worker process.
+    """
+    return {
+        "stages": {name: (stats.count, stats.total_ns, stats.max_ns, dict(stats.histogram),
+                          stats.net_traced_bytes)
+                   for name, stats in _stages.items()},
+        "counters": dict(_counters),
+    }
+
+def merge(other):
+    """Adds the measurements of a snapshot() into the ones recorded so far"""
+    for name, (runs, total_ns, max_ns, histogram, net_traced_bytes) in other["stages"].items():
+        stats = _stages.get(name)
+        if stats is None:
+            stats = _stages[name] = _StageStats()
+        stats.count += runs
+        stats.total_ns += total_ns
+        stats.max_ns = max(stats.max_ns, max_ns)
+        for bucket, bucket_count in histogram.items():
+            stats.histogram[bucket] = stats.histogram.get(bucket, 0) + bucket_count
+        stats.net_traced_bytes += net_traced_bytes
+    for name, value in other["counters"].items():
+        _counters[name] = _counters.get(name, 0) + value
+
+def dump(file):
+    """Writes report() as JSON to a file object"""
+    json.dump(report(), file, indent=2)
+
+def format_report():
+    """Returns report() as a human readable table, slowest stages first"""
+    lines = [f"{'stage':<24}{'count':>10}{'total ms':>12}{'mean us':>12}{'max us':>12}"
+             f"{'net KiB':>12}"]
+    for name, stats in sorted(_stages.items(), key=lambda item: item[1].total_ns, reverse=True):
+        values = stats.as_dict()
+        lines.append(f"{name:<24}{values['count']:>10}{values['total_ms']:>12.2f}"
+                     f"{values['mean_us']:>12.1f}{values['max_us']:>12.1f}"
+                     f"{values['net_traced_bytes'] / 1024:>12.1f}")
+    for name, value in sorted(_counters.items()):
+        lines.append(f"{name:<24}{value:>10}")
+    return "\n".join(lines)
@@ -1,9 +1,18 @@
 """Module for opening an AWBW replay file."""
 
+import collections
+import collections.abc
 import gzip
+import hashlib
+import heapq
+import io
 import json
 import logging
+import mmap
+import os
+import pickle
 import sys
+import tempfile
 import typing
 import zipfile
 
@@ -12,6 +21,9 @@ import phpserialize
 
 from typing import List, Union
 
+from awbw_replay import decode, profiling
+from awbw_replay.awbw import AWBWGameAction
+
 # Replay files are .zip files, each of which are gzip compressed.
 # Filenames are a{game_id} and {game_id}.
 # a{game_id} file contains all the actions as csv style objects with JSON serialized
@@ -19,6 +31,9 @@ from typing import List, Union
 # {game_id} file contains all the remaining metadata, including the initial player funds,
 # initial buildings and units.
 
+# Bump whenever the parsed output of AWBWReplay changes, to invalidate ReplayCache entries
+PARSER_VERSION = 1
+
 class RawTurn(typing.NamedTuple):
     """
     Contains all actions in a turn. The actual turn number is given by the
@@ -32,30 +47,288 @@ def sanitize_phpobject(phpobj):
     """
     Recursively convert phpobj to a dict
 
-    Also returns a list of all the phpobject class types found
+    Also returns a set of all the phpobject class types found
     """
+    found_types = set()
+    return _sanitize_phpobject(phpobj, found_types), found_types
 
-    found_types = []
-
+def _sanitize_phpobject(phpobj, found_types):
+    """Helper for sanitize_phpobject, adding class types to found_types in place"""
     if isinstance(phpobj, phpserialize.phpobject):
-        found_types.append(phpobj.__name__)
-        phpobj, types = sanitize_phpobject(phpobj._asdict())
-        found_types += types
+        found_types.add(phpobj.__name__)
+        phpobj = _sanitize_phpobject(phpobj._asdict(), found_types)
 
     elif isinstance(phpobj, dict):
         for key, value in phpobj.items():
-            phpobj[key], types = sanitize_phpobject(value)
-            found_types += types
+            phpobj[key] = _sanitize_phpobject(value, found_types)
 
     elif isinstance(phpobj, list):
         for i, value in enumerate(phpobj):
-            phpobj[i], types = sanitize_phpobject(value)
-            found_types += types
+            phpobj[i] = _sanitize_phpobject(value, found_types)
 
     else: # primitive type
         pass
 
-    return phpobj, set(found_types)
+    return phpobj
+
+class LazyTurns(collections.abc.Sequence):
+    """
+    A read-only sequence of RawTurns which are decoded from the a{game_id} file
+    the first time they are accessed.
+
+    Only the line offsets are computed up front. Decoded turns are kept in a
+    bounded least recently used cache, so walking over every turn of a long
+    replay doesn't keep all of them in memory at once.
+    """
+
+    def __init__(self, data, decode_line, cache_size=64, scan_line=None):
+        """
+        Arguments:
+        - data: The decompressed contents of the a{game_id} gzip file
+        - decode_line: Function converting a single line (bytes) into a RawTurn
+        - cache_size: The maximum number of decoded turns to keep around
+        - scan_line: Function returning the list of action types in a single line
+          (bytes), without decoding the actions. Defaults to decoding the line.
+        """
+        self._data = data
+        self._decode_line = decode_line
+        self._scan_line = scan_line
+        self._cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        if profiling.ENABLED:
+            with profiling.stage("line_tokenize"):
+                self._offsets = self._index_lines(data)
+        else:
+            self._offsets = self._index_lines(data)
+
+    @staticmethod
+    def _index_lines(data):
+        """Returns a list of (start, end) offsets of each non-empty line in data"""
+        offsets = []
+        end = len(data.rstrip())
+        start = len(data) - len(data.lstrip())
+        while start < end:
+            newline = data.find(b"\n", start, end)
+            if newline == -1:
+                newline = end
+            offsets.append((start, newline))
+            start = newline + 1
+        return offsets
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("turn index out of range")
+
+        turn = self._cache.get(index)
+        if turn is not None:
+            self._cache.move_to_end(index)
+            return turn
+
+        start, end = self._offsets[index]
+        turn = self._decode_line(self._data[start:end])
+        if self._cache_size > 0:
+            self._cache[index] = turn
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return turn
+
+    def action_types(self):
+        """Generator over the list of action types in each turn, decoding as little as possible."""
+        for index, (start, end) in enumerate(self._offsets):
+            turn = self._cache.get(index)
+            if turn is not None:
+                yield [action["action"] for action in turn.actions]
+            elif self._scan_line is not None:
+                yield self._scan_line(self._data[start:end])
+            else:
+                yield [action["action"] for action in self[index].actions]
+
+# Sources which are read in place through a _BufferReader
+_BUFFER_TYPES = (bytes, bytearray, memoryview, mmap.mmap)
+
+class _BufferReader(io.RawIOBase):
+    """
+    A read-only, seekable file object over a buffer.
+
+    Unlike io.BytesIO, this never copies the whole buffer (e.g. for memoryviews
+    and mmaps), only the chunks which are actually read.
+    """
+
+    def __init__(self, buffer):
+        super().__init__()
+        self._view = memoryview(buffer).cast("B")
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = len(self._view) + offset
+        else:
+            raise ValueError(f"Invalid whence {whence}")
+        if pos < 0:
+            raise ValueError(f"Negative seek position {pos}")
+        self._pos = pos
+        return pos
+
+    def read(self, size=-1):
+        end = len(self._view)
+        if size is not None and size >= 0:
+            end = min(end, self._pos + size)
+        data = self._view[self._pos:end].tobytes()
+        self._pos = max(self._pos, end)
+        return data
+
+    def readinto(self, buffer):
+        end = min(len(self._view), self._pos + len(buffer))
+        size = max(0, end - self._pos)
+        memoryview(buffer).cast("B")[:size] = self._view[self._pos:self._pos + size]
+        self._pos += size
+        return size
+
+    def close(self):
+        if not self.closed:
+            # Release the buffer, so mmaps can be closed
+            self._view.release()
+        super().close()
+
+class ReplayCache():
+    """
+    An on-disk cache of parsed replays, keyed by the contents of the replay
+    archive and PARSER_VERSION.
+
+    Entries are pickled, so only point this at a directory you trust.
+
+    Usage:
+
+    cache = ReplayCache("replay_cache", max_bytes=256 * 1024 * 1024)
+    with AWBWReplay("52963.zip", cache=cache) as replay:
+        ...
+    """
+
+    _SUFFIX = ".pickle"
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024):
+        """
+        Arguments:
+        - directory: str or Path object of the directory to store entries in.
+          Created if it doesn't exist.
+        - max_bytes: The total size of entries to keep. The least recently used
+          entries are removed once the cache grows past it.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        # Running total size of the entries, from a single scan of the directory
+        self._total_bytes = None
+
+    @staticmethod
+    def key(file):
+        """
+        Returns the cache key for a replay archive.
+
+        Arguments:
+        - file: The replay archive, as any source accepted by AWBWReplay
+        """
+        digest = hashlib.sha256()
+        if isinstance(file, _BUFFER_TYPES):
+            digest.update(file)
+        elif isinstance(file, (str, os.PathLike)):
+            with open(file, "rb") as stream:
+                for chunk in iter(lambda: stream.read(1024 * 1024), b""):
+                    digest.update(chunk)
+        else:
+            position = file.tell()
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(chunk)
+            file.seek(position)
+        return f"{digest.hexdigest()}-v{PARSER_VERSION}"
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key + self._SUFFIX)
+
+    def load(self, key):
+        """
+        Returns the (game info, turns) stored for key, or None if there isn't an entry.
+        """
+        path = self._entry_path(key)
+        try:
+            with open(path, "rb") as stream:
+                entry = pickle.load(stream)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, pickle.UnpicklingError) as err:
+            logging.warning("Ignoring unreadable cache entry %s: %s", path, err)
+            return None
+        # Mark the entry as recently used
+        os.utime(path)
+        return entry
+
+    def store(self, key, game, turns):
+        """
+        Stores the parsed game info and list of turns for key.
+
+        Entries are only evicted once the store pushes the cache past max_bytes.
+        """
+        if self._total_bytes is None:
+            self._total_bytes = self._scan()[1]
+        path = self._entry_path(key)
+        with tempfile.NamedTemporaryFile(dir=self.directory, suffix=".tmp", delete=False) as stream:
+            pickle.dump((game, turns), stream, protocol=pickle.HIGHEST_PROTOCOL)
+        try:
+            # The entry being replaced no longer counts towards the total
+            self._total_bytes -= os.path.getsize(path)
+        except FileNotFoundError:
+            pass
+        os.replace(stream.name, path)
+        self._total_bytes += os.path.getsize(path)
+        if self._total_bytes > self.max_bytes:
+            self.evict()
+
+    def _scan(self):
+        """
+        Returns:
+        - list of (mtime, size, path) of every entry in the cache directory
+        - The total size of these entries
+        """
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if entry.name.endswith(self._SUFFIX):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        return entries, total
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in max_bytes."""
+        entries, total = self._scan()
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+        self._total_bytes = total
 
 class AWBWReplay():
     """
@@ -67,41 +340,229 @@ class AWBWReplay():
 
     _ACTION_PARSE_STR = "p:{playerId:d};d:{day:d};a:{phpobj}"
 
-    def __init__(self, file):
+    def __init__(self, file, lazy=False, turn_cache_size=64, native=True, keep_raw=False,
+            cache=None, raw_actions=False, use_mmap=False):
         """
         Arguments:
-        - file: str or Path object to open read-only to extract the replay.
+        - file: The replay archive to open read-only. Either a str or Path object,
+          bytes, bytearray, memoryview, mmap, or a seekable binary file object.
+          Buffers are read in place without being copied.
+        - lazy: If True, only index the turns when opening the replay, and decode
+          each turn the first time it is accessed.
+        - turn_cache_size: The number of decoded turns kept around in lazy mode.
+        - native: If True, decode the replay with the single pass decoders in
+          awbw_replay.decode. Otherwise use the parse/phpserialize based decoders.
+        - keep_raw: If True, keep the decompressed contents of each archive file
+          in filedata. Otherwise the files are decompressed as they are parsed.
+        - cache: A ReplayCache to load the parsed replay from. The archive is only
+          decompressed and parsed when there is no entry for it, and the result
+          is then stored in the cache (unless opened in lazy mode).
+        - raw_actions: If True, actions are decode.RawAction handles which keep the
+          JSON text and only decode it when a field other than "action" is used.
+        - use_mmap: If True and file is a path, memory map the file instead of
+          reading it through a file handle.
         """
-        self._path = file
+        self._source = file
+        self._path = file if isinstance(file, (str, os.PathLike)) else None
+        self._use_mmap = use_mmap
+        self._mmap = None
+        self._reader = None
+        self._lazy = lazy
+        self._turn_cache_size = turn_cache_size
+        self._native = native
+        self._keep_raw = keep_raw
+        self._cache = cache
+        self._raw_actions = raw_actions
         self.file = None
         # Replay archive name list
         self.namelist = []
+        # Decompressed archive files, only filled in when keep_raw is set
         self.filedata = []
 
         self._turns : Union[List, None] = None
         self._game_data = None
         self._game = None
+        # AWBWGameAction.Type -> list of (turn index, action index in the turn)
+        self._action_index = None
 
     def __enter__(self):
-        logging.debug("Opening %s", self._path)
-        self.file = zipfile.ZipFile(self._path)
+        cache_key = None
+        if self._cache is not None:
+            cache_key = self._cache.key(self._source)
+            if self._raw_actions:
+                # RawActions are stored undecoded, so keep them apart from decoded entries
+                cache_key += "-raw"
+            cached = self._cache.load(cache_key)
+            if cached is not None:
+                logging.debug("Loaded %s from the replay cache", self._path)
+                self._game, self._turns = cached
+                return self
+
+        logging.debug("Opening %s", self._path or type(self._source).__name__)
+        self.file = zipfile.ZipFile(self._open_source())
         self.namelist = self.file.namelist()
         for name in self.namelist:
-            self.filedata.append(gzip.decompress(self.file.read(name)))
             if "a" in name:
                 # actions is a csv (sep = ;) of playerId, day, and php array of the actions made
-                self._turns = self._parse_actions(self.filedata[-1])
+                self._turns = self._open_actions(name)
             else:
-                self._game_data = self._parse_game(self.filedata[-1])
-                self._game, _ = sanitize_phpobject(self._game_data)
+                data = self._read_member(name)
+                if profiling.ENABLED:
+                    with profiling.stage("php_decode"):
+                        self._decode_game(data)
+                else:
+                    self._decode_game(data)
         if self._turns is None:
             logging.warning("No actions file found in %s. Individual actions will be unavailable", self.namelist)
         if self._game is None:
             logging.warning("No turn file found in %s. Turn data will be unavailable", self.namelist)
 
+        if cache_key is not None and isinstance(self._turns, list) and self._game is not None:
+            self._cache.store(cache_key, self._game, self._turns)
 
         return self
 
+    @classmethod
+    def peek(cls, file, fields=None):
+        """
+        Returns the game info of a replay without opening its actions file.
+
+        Usage:
+
+        if AWBWReplay.peek("52963.zip", fields=["maps_id"])["maps_id"] == map_id:
+            ...
+
+        Arguments:
+        - file: The replay archive, as any source accepted by AWBWReplay
+        - fields: Optional collection of top level game info keys, e.g. "id",
+          "maps_id" and "players". If given, only these keys are decoded, and the
+          game info is only decompressed up to the last of them.
+
+        Returns:
+        - The game info dictionary, or None if there isn't a game info file
+        """
+        replay = cls(file)
+        try:
+            replay.file = zipfile.ZipFile(replay._open_source()) # pylint: disable=protected-access
+            for name in replay.file.namelist():
+                if "a" in name:
+                    continue
+                if fields is None:
+                    return decode.loads_php(replay._read_member(name)) # pylint: disable=protected-access
+                return replay._peek_member(name, fields) # pylint: disable=protected-access
+            logging.warning("No turn file found in %s", replay.file.namelist())
+            return None
+        finally:
+            replay.__exit__(None, None, None)
+
+    def _peek_member(self, name, fields):
+        """
+        Decodes some top level fields of an archive file, only decompressing as
+        much of the file as needed.
+        """
+        with self.file.open(name) as member, gzip.GzipFile(fileobj=member) as stream:
+            data = b""
+            chunk_size = 16 * 1024
+            while True:
+                chunk = stream.read(chunk_size)
+                data += chunk
+                try:
+                    return decode.loads_php_fields(data, fields)
+                except decode.DecodeError:
+                    if not chunk:
+                        raise
+                chunk_size *= 2
+
+    def _open_source(self):
+        """Returns a path or file object for zipfile.ZipFile to read the archive from."""
+        source = self._source
+        if self._path is not None:
+            if not self._use_mmap:
+                return source
+            with open(source, "rb") as stream:
+                # The mapping stays valid after the file is closed
+                self._mmap = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+            source = self._mmap
+        if isinstance(source, _BUFFER_TYPES):
+            self._reader = _BufferReader(source)
+            return self._reader
+        # Any other seekable binary file object
+        return source
+
+    def _read_member(self, name):
+        """
+        Returns the decompressed contents of an archive file.
+
+        The file is decompressed while it is read out of the archive, so the
+        compressed bytes are never held in memory all at once.
+        """
+        if profiling.ENABLED:
+            data = self._read_member_profiled(name)
+        else:
+            with self.file.open(name) as member, gzip.GzipFile(fileobj=member) as stream:
+                data = stream.read()
+        if self._keep_raw:
+            self.filedata.append(data)
+        return data
+
+    def _read_member_profiled(self, name):
+        """
+        Returns the decompressed contents of an archive file, reading and
+        decompressing it in separate steps so each can be timed.
+        """
+        with profiling.stage("zip_read"):
+            with self.file.open(name) as member:
+                compressed = member.read()
+        with profiling.stage("decompress"):
+            data = gzip.decompress(compressed)
+        profiling.count("compressed_bytes", len(compressed))
+        profiling.count("decompressed_bytes", len(data))
+        return data
+
+    def _iter_member_lines(self, name):
+        """Generator over the non-empty lines of an archive file, decompressing as it goes."""
+        if profiling.ENABLED:
+            data = self._read_member_profiled(name)
+            with profiling.stage("line_tokenize"):
+                lines = [line.strip() for line in data.split(b"\n")]
+            yield from (line for line in lines if line)
+            return
+        with self.file.open(name) as member, gzip.GzipFile(fileobj=member) as stream:
+            for line in stream:
+                line = line.strip()
+                if line:
+                    yield line
+
+    def _open_actions(self, name):
+        """
+        Arguments:
+        - name: The name of the a{game_id} file in the archive
+
+        Returns:
+        - The list of RawTurns, or LazyTurns in lazy mode
+        """
+        if self._lazy:
+            # Lazy turns are decoded from the decompressed file later on
+            return LazyTurns(
+                    self._read_member(name),
+                    self._parse_action_line,
+                    cache_size=self._turn_cache_size,
+                    scan_line=self._scan_action_line if self._native else None)
+        if self._keep_raw:
+            return self._parse_actions(self._read_member(name))
+        return [self._parse_action_line(line) for line in self._iter_member_lines(name)]
+
+    def _decode_game(self, data):
+        """
+        Sets the game info from the decompressed contents of the {game_id} gzip file
+        """
+        if self._native:
+            self._game_data = None
+            self._game = decode.loads_php(data)
+        else:
+            self._game_data = self._parse_game(data)
+            self._game, _ = sanitize_phpobject(self._game_data)
+
     def _parse_game(self, data): # pylint: disable=no-self-use
         """
         Arguments:
@@ -114,50 +575,176 @@ class AWBWReplay():
         Arguments:
         - data: The decompressed contents of the a{game_id} gzip file
         """
-        result = []
-        for line in data.decode().strip().split("\n"):
-            parsed = parse.parse(self._ACTION_PARSE_STR, line).named
-            phpobj = phpserialize.loads(
-                    bytes(parsed["phpobj"], encoding="utf-8"),
-                    decode_strings=True)
-            phpactions = phpobj[2]
-            actions = []
-            for jsonstr in phpactions.values():
-                if not "action" in jsonstr:
-                    logging.debug("Skipping invalid action string")
+        with profiling.stage("line_tokenize"):
+            if self._native:
+                lines = data.strip().split(b"\n")
+            else:
+                lines = data.decode().strip().split("\n")
+        return [self._parse_action_line(line) for line in lines]
+
+    def _parse_action_line(self, line):
+        """
+        Arguments:
+        - line: A single line of the a{game_id} gzip file, as str or bytes
+
+        Returns:
+        - The RawTurn for the line
+        """
+        if profiling.ENABLED:
+            with profiling.stage("action_line_decode"):
+                return self._decode_action_line(line)
+        return self._decode_action_line(line)
+
+    def _decode_action_line(self, line):
+        """Helper for _parse_action_line"""
+        if self._native:
+            if isinstance(line, str):
+                line = line.encode()
+            try:
+                player_id, day, actions = decode.decode_action_line(line, raw=self._raw_actions)
+                return RawTurn(playerId=player_id, day=day, actions=actions)
+            except decode.DecodeError as err:
+                logging.debug("Falling back to the template decoder: %s", err)
+        return self._parse_action_line_template(line)
+
+    def _scan_action_line(self, line): # pylint: disable=no-self-use
+        """
+        Arguments:
+        - line: A single line of the a{game_id} gzip file, as bytes
+
+        Returns:
+        - The list of action types in the line, without decoding the actions
+        """
+        try:
+            _, _, actions = decode.decode_action_line(line, raw=True)
+        except decode.DecodeError as err:
+            logging.debug("Falling back to the template decoder: %s", err)
+            actions = self._parse_action_line_template(line).actions
+        return [action["action"] for action in actions]
+
+    @staticmethod
+    def _build_action_index(action_types):
+        """
+        Arguments:
+        - action_types: Iterable over the list of action types in each turn
+
+        Returns:
+        - dict of AWBWGameAction.Type -> list of (turn index, action index in the turn)
+        """
+        index = {}
+        for turn_index, types in enumerate(action_types):
+            for position, action_type in enumerate(types):
+                try:
+                    action_type = AWBWGameAction.Type(action_type)
+                except ValueError:
+                    logging.debug("Not indexing unknown action type %s", action_type)
                     continue
-                actions.append(json.loads(jsonstr))
-            result.append(RawTurn(playerId=parsed["playerId"], day=parsed["day"], actions=actions))
+                index.setdefault(action_type, []).append((turn_index, position))
+        return index
+
+    def _parse_action_line_template(self, line):
+        """
+        Decodes an action line using the generic parse template and phpserialize.
+
+        Arguments:
+        - line: A single line of the a{game_id} gzip file, as str or bytes
 
-        return result
+        Returns:
+        - The RawTurn for the line
+        """
+        if isinstance(line, bytes):
+            line = line.decode()
+        parsed = parse.parse(self._ACTION_PARSE_STR, line).named
+        phpobj = phpserialize.loads(
+                bytes(parsed["phpobj"], encoding="utf-8"),
+                decode_strings=True)
+        phpactions = phpobj[2]
+        actions = []
+        for jsonstr in phpactions.values():
+            if not "action" in jsonstr:
+                logging.debug("Skipping invalid action string")
+                continue
+            if self._raw_actions:
+                actions.append(decode.RawAction(jsonstr))
+            elif profiling.ENABLED:
+                with profiling.stage("json_decode"):
+                    actions.append(json.loads(jsonstr))
+            else:
+                actions.append(json.loads(jsonstr))
+        return RawTurn(playerId=parsed["playerId"], day=parsed["day"], actions=actions)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.file.close()
+        if self.file is not None:
+            self.file.close()
+        if self._reader is not None:
+            self._reader.close()
+        if self._mmap is not None:
+            self._mmap.close()
 
     def path(self):
-        """Returns the filepath of the replay."""
+        """Returns the filepath of the replay, or None if it wasn't opened from a path."""
         return self._path
 
     def game_info(self):
         """Returns the initial game info dictionary."""
         return self._game
 
-    def turns(self) -> Union[List, None]:
-        """Returns the list of turns in the game."""
+    def turns(self) -> Union[List, LazyTurns, None]:
+        """
+        Returns the list of turns in the game.
+
+        When the replay was opened with lazy=True this is a LazyTurns sequence instead.
+        """
         if self._turns is None:
             logging.warning("No actions file for this replay")
         return self._turns
 
-    def actions(self) -> Union[List, None]:
-        """Generator over every action in the game."""
+    def action_index(self):
+        """
+        Returns a dict of AWBWGameAction.Type -> list of (turn index, action index in the turn)
+        for every action in the game.
+
+        The index is built on first use. In lazy mode this doesn't decode the actions.
+        """
+        if self._action_index is None and self._turns is not None:
+            if isinstance(self._turns, list):
+                action_types = ([action["action"] for action in turn.actions]
+                                for turn in self._turns)
+            else:
+                action_types = self._turns.action_types()
+            self._action_index = self._build_action_index(action_types)
+        return self._action_index
+
+    def actions(self, types=None) -> Union[List, None]:
+        """
+        Generator over every action in the game.
+
+        Arguments:
+        - types: Optional collection of AWBWGameAction.Type (or their string values).
+          If given, only the actions of these types are generated, using the action
+          index to skip over every other action.
+        """
         turns = self.turns()
         if turns is None:
             return None
-        for _turn in turns:
-            yield from _turn.actions
+        if types is None:
+            for _turn in turns:
+                yield from _turn.actions
+            return None
+
+        index = self.action_index()
+        types = {AWBWGameAction.Type(_type) for _type in types}
+        positions = [index.get(_type, []) for _type in types]
+        for turn_index, position in heapq.merge(*positions):
+            yield turns[turn_index].actions[position]
+        return None
 
     def action_summaries(self):
-        """Generator over every action type in the game."""
+        """
+        Generator over every action type in the game.
+
+        With raw_actions, this doesn't need to decode any of the actions.
+        """
         for _action in self.actions():
             yield _action["action"]
 
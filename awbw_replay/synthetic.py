@@ -0,0 +1,477 @@
+"""
+Generates synthetic AWBW replays, for benchmarks and stress tests at sizes
+the sample replays don't cover.
+
+The replays use the same archive layout as the ones downloaded from AWBW: a
+gzip'd {game_id} file of the PHP serialized game, and a gzip'd a{game_id} file
+with one line of PHP serialized JSON actions per turn. The generator plays a
+simple game while writing the actions, so they are consistent with each other
+and can be applied with AWBWGameState.apply_action.
+
+Usage:
+
+data = generate_replay(players=8, days=60, max_units=400, fog=True)
+with AWBWReplay(data) as replay:
+    ...
+"""
+
+import gzip
+import io
+import json
+import random
+import zipfile
+
+import phpserialize
+
+# Name -> (cost, symbol, movement type, movement points, vision, fuel, ammo)
+UNIT_TYPES = {
+    "Infantry": (1000, "A", "F", 3, 2, 99, 0),
+    "Mech": (3000, "B", "B", 2, 2, 70, 3),
+    "Recon": (4000, "C", "W", 8, 5, 80, 0),
+    "Tank": (7000, "D", "T", 6, 3, 70, 9),
+    "Artillery": (6000, "F", "T", 5, 1, 50, 9),
+}
+
+DEFAULT_ACTION_MIX = {
+    "Build": 1,
+    "Move": 4,
+    "Fire": 2,
+    "Capt": 1,
+}
+
+# Terrain ids of a neutral city, and of the first country's city. Each
+# following country's city is 5 ids further.
+NEUTRAL_CITY_TERRAIN_ID = 34
+COUNTRY_CITY_TERRAIN_ID = 38
+
+def _yn(value):
+    """Converts a bool to the "Y"/"N" strings of the game file"""
+    return "Y" if value else "N"
+
+def _dumps_json(value):
+    """Serializes an action like AWBW does, without whitespace"""
+    return json.dumps(value, separators=(",", ":"))
+
+class _Simulation():
+    """Plays a simple random game, recording the actions of each turn"""
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, rng, game_id, players, width, height, initial_units,
+                 max_units, buildings, funds_per_property, starting_funds, fog):
+        self.rng = rng
+        self.game_id = game_id
+        self.width = width
+        self.height = height
+        self.max_units = max_units
+        self.funds_per_property = funds_per_property
+        self.fog = fog
+        self.player_ids = [100 + i for i in range(players)]
+        self.players = {
+            p_id: {"funds": starting_funds, "co_power": 0, "country": i + 1}
+            for i, p_id in enumerate(self.player_ids)
+        }
+        self.units = {}
+        # Player id -> unit id -> unit, of the units with hit points left
+        self._alive_units = {p_id: {} for p_id in self.player_ids}
+        self._next_unit_id = 1000
+        self.buildings = {}
+        for b_id in range(10000, 10000 + buildings):
+            self.buildings[b_id] = {
+                "x": rng.randrange(width),
+                "y": rng.randrange(height),
+                "capture": 20,
+                "players_id": 0,
+                "terrain_id": NEUTRAL_CITY_TERRAIN_ID,
+                # The player currently capturing the building
+                "capturer": 0,
+            }
+        for p_id in self.player_ids:
+            for _ in range(initial_units):
+                self._new_unit(p_id, rng.choice(list(UNIT_TYPES)),
+                               rng.randrange(width), rng.randrange(height))
+
+    def _new_unit(self, p_id, name, x, y):
+        """Adds a unit to the simulation, returning it"""
+        u_id = self._next_unit_id
+        self._next_unit_id += 1
+        cost, symbol, movement_type, movement_points, vision, fuel, ammo = UNIT_TYPES[name]
+        unit = {
+            "id": u_id,
+            "players_id": p_id,
+            "name": name,
+            "movement_points": movement_points,
+            "vision": vision,
+            "fuel": fuel,
+            "fuel_per_turn": 0,
+            "ammo": ammo,
+            "symbol": symbol,
+            "cost": cost,
+            "movement_type": movement_type,
+            "x": x,
+            "y": y,
+            "hit_points": 10,
+        }
+        self.units[u_id] = unit
+        self._alive_units[p_id][u_id] = unit
+        return unit
+
+    def _alive(self, p_id=None, enemy_of=None):
+        """Returns the alive units of a player, or of every enemy of a player"""
+        if p_id is not None:
+            return list(self._alive_units[p_id].values())
+        return [unit for other, units in self._alive_units.items() if other != enemy_of
+                for unit in units.values()]
+
+    def _views(self, p_id, full, hidden):
+        """
+        Returns the views of a payload: a single global view, or with fog one
+        view per player where only the acting player and a random subset of
+        the others see the full information.
+        """
+        if not self.fog:
+            return {"global": full}
+        views = {str(p_id): full}
+        for other in self.player_ids:
+            if other != p_id:
+                views[str(other)] = full if self.rng.random() < 0.5 else hidden
+        return views
+
+    def game_file(self):
+        """Returns the serialized {game_id} file of the initial game"""
+        players = {}
+        for i, p_id in enumerate(self.player_ids):
+            players[i] = phpserialize.phpobject("awbwPlayer", {
+                "id": p_id,
+                "users_id": 5000 + i,
+                "games_id": self.game_id,
+                "countries_id": self.players[p_id]["country"],
+                "co_id": 1,
+                "funds": self.players[p_id]["funds"],
+                "eliminated": "N",
+                "co_power": 0,
+                "co_power_on": "N",
+                "order": i + 1,
+                "co_max_power": 270000,
+                "co_max_spower": 540000,
+                "co_image": "andy.png",
+                "team": str(p_id),
+            })
+        units = {}
+        for i, unit in enumerate(self.units.values()):
+            units[i] = phpserialize.phpobject("awbwUnit", {
+                **unit,
+                "games_id": self.game_id,
+                "sub_dive": "N",
+                "moved": 0,
+                "capture": 0,
+                "fired": 0,
+                "hit_points": float(unit["hit_points"]),
+                "cargo1_units_id": 0,
+                "cargo2_units_id": 0,
+                "carried": "N",
+            })
+        buildings = {}
+        for i, (b_id, building) in enumerate(self.buildings.items()):
+            buildings[i] = phpserialize.phpobject("awbwBuilding", {
+                "id": b_id,
+                "games_id": self.game_id,
+                "terrain_id": building["terrain_id"],
+                "x": building["x"],
+                "y": building["y"],
+                "capture": building["capture"],
+                "last_capture": 20,
+            })
+        game = phpserialize.phpobject("awbwGame", {
+            "id": self.game_id,
+            "name": f"Synthetic game {self.game_id}",
+            "maps_id": 1,
+            "weather_type": "Clear",
+            "turn": self.player_ids[0],
+            "day": 1,
+            "active": "Y",
+            "funds": self.funds_per_property,
+            "fog": _yn(self.fog),
+            "type": "N",
+            "starting_funds": self.players[self.player_ids[0]]["funds"],
+            "use_powers": "Y",
+            "players": players,
+            "units": units,
+            "buildings": buildings,
+        })
+        return phpserialize.dumps(game)
+
+    def _unit_payload(self, unit):
+        """The units_ prefixed fields of a unit, as in Move and Build actions"""
+        payload = {"0": unit["id"]}
+        for key, value in unit.items():
+            payload["units_" + key] = value
+        payload.update({
+            "units_games_id": self.game_id,
+            "units_sub_dive": "N",
+            "units_moved": 1,
+            "units_capture": 0,
+            "units_fired": 0,
+            "units_cargo1_units_id": 0,
+            "units_cargo2_units_id": 0,
+            "units_carried": "N",
+        })
+        return payload
+
+    def build(self, p_id):
+        """Returns a Build action, or None if the player can't afford a unit"""
+        if sum(len(units) for units in self._alive_units.values()) >= self.max_units:
+            return None
+        funds = self.players[p_id]["funds"]
+        affordable = [name for name, info in UNIT_TYPES.items() if info[0] <= funds]
+        if not affordable:
+            return None
+        unit = self._new_unit(p_id, self.rng.choice(affordable),
+                              self.rng.randrange(self.width), self.rng.randrange(self.height))
+        self.players[p_id]["funds"] -= unit["cost"]
+        return {
+            "action": "Build",
+            "newUnit": self._views(p_id, self._unit_payload(unit), None),
+            "discovered": {str(p_id): None},
+        }
+
+    def _move(self, unit, x, y):
+        """Moves a unit, returning the Move payload"""
+        path = [{"unit_visible": True, "x": unit["x"], "y": unit["y"]}]
+        while (unit["x"], unit["y"]) != (x, y):
+            unit["x"] += (x > unit["x"]) - (x < unit["x"])
+            unit["y"] += (y > unit["y"]) - (y < unit["y"])
+            path.append({"unit_visible": True, "x": unit["x"], "y": unit["y"]})
+        unit["fuel"] = max(0, unit["fuel"] - (len(path) - 1))
+        p_id = unit["players_id"]
+        return {
+            "action": "Move",
+            "unit": self._views(p_id, self._unit_payload(unit), "?"),
+            "paths": self._views(p_id, path, []),
+            "dist": len(path) - 1,
+            "trapped": False,
+            "discovered": {str(p_id): None},
+        }
+
+    def _step(self, unit):
+        """Returns a random position within movement range of a unit"""
+        reach = unit["movement_points"]
+        x = min(self.width - 1, max(0, unit["x"] + self.rng.randint(-reach, reach)))
+        y = min(self.height - 1, max(0, unit["y"] + self.rng.randint(-reach, reach)))
+        return x, y
+
+    def move(self, p_id):
+        """Returns a Move action, or None if the player has no units"""
+        units = self._alive(p_id)
+        if not units:
+            return None
+        unit = self.rng.choice(units)
+        return self._move(unit, *self._step(unit))
+
+    def fire(self, p_id):
+        """Returns a Fire action (after a Move), or None if there's nothing to attack"""
+        attackers = self._alive(p_id)
+        defenders = self._alive(enemy_of=p_id)
+        if not attackers or not defenders:
+            return None
+        attacker = self.rng.choice(attackers)
+        defender = self.rng.choice(defenders)
+        move = self._move(attacker, *self._step(attacker))
+
+        defender["hit_points"] = max(0, defender["hit_points"] - self.rng.randint(1, 6))
+        if defender["hit_points"] > 0:
+            attacker["hit_points"] = max(1, attacker["hit_points"] - self.rng.randint(0, 2))
+        else:
+            del self._alive_units[defender["players_id"]][defender["id"]]
+        attacker["ammo"] = max(0, attacker["ammo"] - 1)
+        for unit in (attacker, defender):
+            self.players[unit["players_id"]]["co_power"] += unit["cost"] // 10
+
+        def combat_unit(unit):
+            return {
+                "units_ammo": unit["ammo"],
+                "units_hit_points": unit["hit_points"],
+                "units_id": unit["id"],
+                "units_x": unit["x"],
+                "units_y": unit["y"],
+            }
+        combat_info = {"attacker": combat_unit(attacker), "defender": combat_unit(defender)}
+        return {
+            "action": "Fire",
+            "Move": move,
+            "Fire": {
+                "action": "Fire",
+                "combatInfoVision": self._views(
+                        p_id,
+                        {"hasVision": True, "combatInfo": combat_info},
+                        {"hasVision": False, "combatInfo": {**combat_info, "attacker": "?"}}),
+                "copValues": {
+                    role: {
+                        "playerId": unit["players_id"],
+                        # Replays store the power meter multiplied by 10
+                        "copValue": self.players[unit["players_id"]]["co_power"] * 10,
+                        "tagValue": None,
+                    }
+                    for role, unit in (("attacker", attacker), ("defender", defender))
+                },
+            },
+        }
+
+    def capt(self, p_id):
+        """Returns a Capt action (after a Move), or None if there's nothing to capture"""
+        units = self._alive(p_id)
+        targets = [b_id for b_id, building in self.buildings.items()
+                   if building["players_id"] != p_id]
+        if not units or not targets:
+            return None
+        unit = self.rng.choice(units)
+        # Keep going with a capture the player already started, so captures complete
+        started = [b_id for b_id in targets if self.buildings[b_id]["capturer"] == p_id]
+        b_id = self.rng.choice(started or targets)
+        building = self.buildings[b_id]
+        move = self._move(unit, building["x"], building["y"])
+
+        if building["capturer"] != p_id:
+            building["capturer"] = p_id
+            building["capture"] = 20
+        building["capture"] -= max(1, int(unit["hit_points"]))
+        building_info = {
+            "buildings_capture": building["capture"],
+            "buildings_id": b_id,
+            "buildings_x": building["x"],
+            "buildings_y": building["y"],
+            "buildings_team": None,
+        }
+        income = None
+        if building["capture"] <= 0:
+            building["capture"] = 20
+            building["capturer"] = 0
+            building["players_id"] = p_id
+            country = self.players[p_id]["country"]
+            building["terrain_id"] = COUNTRY_CITY_TERRAIN_ID + 5 * (country - 1)
+            building_info.update({
+                "buildings_capture": 20,
+                "terrain_id": building["terrain_id"],
+                "buildings_players_id": p_id,
+                "buildings_team": str(p_id),
+            })
+            income = {str(p_id): {"player": p_id, "income": self.income(p_id)}}
+        return {
+            "action": "Capt",
+            "Move": move,
+            "Capt": {
+                "action": "Capt",
+                "buildingInfo": building_info,
+                "vision": {"global": {"onCapture": {"x": building["x"], "y": building["y"]}}},
+                "income": income,
+            },
+        }
+
+    def income(self, p_id):
+        """Returns the funds the player earns at the start of their turn"""
+        properties = sum(1 for building in self.buildings.values()
+                         if building["players_id"] == p_id)
+        return properties * self.funds_per_property
+
+    def end(self, next_p_id, next_day):
+        """Returns the End action starting the next player's turn"""
+        self.players[next_p_id]["funds"] += self.income(next_p_id)
+        funds = self.players[next_p_id]["funds"]
+        if self.fog:
+            next_funds = {str(p_id): funds if p_id == next_p_id else ""
+                          for p_id in self.player_ids}
+            repaired = {str(p_id): [] for p_id in self.player_ids}
+        else:
+            next_funds = {"global": funds}
+            repaired = {"global": []}
+        return {
+            "action": "End",
+            "updatedInfo": {
+                "event": "NextTurn",
+                "nextPId": next_p_id,
+                "nextFunds": next_funds,
+                "nextTimer": 1036800,
+                "nextWeather": "C",
+                "supplied": {"global": []},
+                "repaired": repaired,
+                "day": next_day,
+            },
+        }
+
+def generate_replay(file=None, players=2, days=10, initial_units=4, max_units=100,
+                    buildings=20, actions_per_turn=10, action_mix=None, fog=False,
+                    width=30, height=30, funds_per_property=1000, starting_funds=5000,
+                    game_id=1, seed=0):
+    """
+    Generates a replay archive of a random but consistent game.
+
+    Arguments:
+    - file: Optional path or binary file object to also write the archive to
+    - players: The number of players
+    - days: The number of days. Every player plays one turn per day.
+    - initial_units: The number of units each player starts with
+    - max_units: Builds stop once this many units are alive
+    - buildings: The number of neutral cities on the map to capture
+    - actions_per_turn: The number of actions (before the End action) per turn
+    - action_mix: dict of action type ("Build", "Move", "Fire" or "Capt") ->
+      relative weight. Actions which aren't possible fall back to a Move.
+    - fog: If True, payloads have one view per player instead of a global view,
+      with some of the views hiding the other players' units
+    - width, height: The size of the map units move around
+    - funds_per_property: The funds each property earns per turn
+    - starting_funds: The funds each player starts with
+    - game_id: The game id, also used for the archive's file names
+    - seed: Seed for the random choices, so the same arguments generate the same replay
+
+    Returns:
+    - The bytes of the replay archive
+    """
+    # pylint: disable=too-many-arguments,too-many-locals
+    rng = random.Random(seed)
+    simulation = _Simulation(rng, game_id, players, width, height, initial_units,
+                             max_units, buildings, funds_per_property, starting_funds, fog)
+    action_mix = action_mix or DEFAULT_ACTION_MIX
+    action_types = list(action_mix)
+    weights = [action_mix[action_type] for action_type in action_types]
+    generators = {
+        "Build": simulation.build,
+        "Move": simulation.move,
+        "Fire": simulation.fire,
+        "Capt": simulation.capt,
+    }
+
+    lines = []
+    player_ids = simulation.player_ids
+    for day in range(1, days + 1):
+        for i, p_id in enumerate(player_ids):
+            actions = []
+            for action_type in rng.choices(action_types, weights, k=actions_per_turn):
+                action = generators[action_type](p_id) or simulation.move(p_id)
+                if action is not None:
+                    actions.append(action)
+            last_turn = day == days and i == len(player_ids) - 1
+            if not last_turn:
+                next_p_id = player_ids[(i + 1) % len(player_ids)]
+                actions.append(simulation.end(next_p_id, day + (i + 1) // len(player_ids)))
+            line = phpserialize.dumps([p_id, day, [_dumps_json(action) for action in actions]])
+            lines.append(f"p:{p_id};d:{day};a:".encode() + line)
+
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, "w") as archive:
+        members = [
+            (str(game_id), simulation.game_file()),
+            (f"a{game_id}", b"\n".join(lines) + b"\n"),
+        ]
+        for name, content in members:
+            # Fixed timestamps, so the same arguments give the same bytes
+            info = zipfile.ZipInfo(name, date_time=(2020, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(info, gzip.compress(content, compresslevel=6, mtime=0))
+    data = output.getvalue()
+
+    if isinstance(file, (str, bytes)) or hasattr(file, "__fspath__"):
+        with open(file, "wb") as stream:
+            stream.write(data)
+    elif file is not None:
+        file.write(data)
+    return data
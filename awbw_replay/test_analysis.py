@@ -0,0 +1,105 @@
+"""
+Basic unit tests for the analysis module on select sample replays.
+
+To run:
+python -m unittest -v
+"""
+
+import copy
+import os
+import unittest
+from unittest import mock
+
+from awbw_replay import analysis
+from awbw_replay.analysis import Analyzer, Needs, run_analyzers
+from awbw_replay.replay import AWBWReplay
+from awbw_replay.awbw import AWBWGameAction, AWBWGameState
+
+# pylint: disable=no-self-use
+
+TEST_REPLAYS_DIR = "replays"
+
+class _Recorder(Analyzer):
+    """Records what it was given for each action"""
+
+    def __init__(self, needs):
+        self.NEEDS = needs # pylint: disable=invalid-name
+        self.started = 0
+        self.finished = 0
+        self.actions = []
+        self.states = []
+        self.deltas = []
+
+    def start(self, game_info):
+        self.started += 1
+
+    def on_action(self, action, state, delta):
+        self.actions.append(action.type)
+        # The state is modified in place, so keep a copy
+        self.states.append(None if state is None else copy.deepcopy((state.players, state.units)))
+        self.deltas.append(delta)
+
+    def finish(self):
+        self.finished += 1
+
+    def merge(self, other):
+        self.actions.extend(other.actions)
+
+class TestAnalysis(unittest.TestCase):
+    """Tests for run_analyzers"""
+
+    def test_actions_only(self):
+        """Test that no game states are built when only actions are needed"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip")
+        recorder = _Recorder(Needs.ACTIONS)
+        with AWBWReplay(example_replay) as replay:
+            with mock.patch.object(analysis, "AWBWReplayCursor") as cursor:
+                num_actions = run_analyzers(replay, [recorder])
+            assert not cursor.called
+            expected = [AWBWGameAction(action).type for action in replay.actions()]
+        assert recorder.actions == expected
+        assert num_actions == len(expected)
+        assert recorder.states == [None] * num_actions
+        assert recorder.deltas == [None] * num_actions
+        assert recorder.started == recorder.finished == 1
+
+    def test_state(self):
+        """Test that analyzers get the same states as applying the actions one by one"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip")
+        actions_only = _Recorder(Needs.ACTIONS)
+        with_state = _Recorder(Needs.STATE)
+        with_deltas = _Recorder(Needs.DELTAS)
+        with AWBWReplay(example_replay) as replay:
+            run_analyzers(replay, [actions_only, with_state, with_deltas])
+
+            state = AWBWGameState(replay_initial=replay.game_info())
+            for i, action in enumerate(replay.actions()):
+                state = state.apply_action(AWBWGameAction(action))
+                assert with_state.states[i] == (state.players, state.units)
+        # Each analyzer only gets what it declared
+        assert actions_only.states == [None] * len(actions_only.actions)
+        assert with_state.deltas == [None] * len(with_state.actions)
+        assert all(delta is not None for delta in with_deltas.deltas)
+        assert with_deltas.actions == actions_only.actions
+
+    def test_deltas(self):
+        """Test that the deltas rebuild the final state"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip")
+        recorder = _Recorder(Needs.DELTAS)
+        with AWBWReplay(example_replay) as replay:
+            run_analyzers(replay, [recorder])
+            initial = AWBWGameState(replay_initial=replay.game_info())
+        final = initial.apply_deltas(recorder.deltas)
+        assert (final.players, final.units) == recorder.states[-1]
+
+    def test_merge(self):
+        """Test that results of separate replays can be merged"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip")
+        first = _Recorder(Needs.ACTIONS)
+        second = _Recorder(Needs.ACTIONS)
+        with AWBWReplay(example_replay) as replay:
+            run_analyzers(replay, [first])
+            run_analyzers(replay, [second])
+        num_actions = len(first.actions)
+        first.merge(second)
+        assert len(first.actions) == 2 * num_actions
@@ -7,14 +7,25 @@ python -m unittest -v
 
 import os
 import unittest
+from unittest import mock
 
 from awbw_replay.replay import AWBWReplay
-from awbw_replay.awbw import AWBWGameAction, AWBWGameState
+from awbw_replay import awbw
+from awbw_replay.awbw import AWBWGameAction, AWBWGameState, AWBWReplayCursor
 
 # pylint: disable=no-self-use
 
 TEST_REPLAYS_DIR = "replays"
 
+def as_dicts(state):
+    """Returns the contents of a state as plain dicts, e.g. to compare states"""
+    return (
+        dict(state.game_info),
+        {p_id: dict(player) for p_id, player in state.players.items()},
+        {u_id: dict(unit) for u_id, unit in state.units.items()},
+        {b_id: dict(building) for b_id, building in state.buildings.items()},
+    )
+
 class TestAWBWGameState(unittest.TestCase):
     """Tests for the AWBWGame* classes"""
 
@@ -54,5 +65,126 @@ class TestAWBWGameState(unittest.TestCase):
             assert len(replay.turns()) == states[-1].game_info["turn"] + 1
             assert all((len(state.players) == 2 for state in states))
 
+    def test_structural_sharing(self):
+        """Test that states only copy the entries an action changes"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            states = [AWBWGameState(replay_initial=replay.game_info())]
+            snapshots = [dict(states[0].units)]
+
+            for action in replay.actions():
+                action = AWBWGameAction(action)
+                states.append(states[-1].apply_action(action))
+                snapshots.append({u_id: dict(unit) for u_id, unit in states[-1].units.items()})
+
+                if action.type == AWBWGameAction.Type.MOVE:
+                    moved = {unit["units_id"] for unit in action.info["unit"].values()
+                             if isinstance(unit, dict)}
+                    for u_id, unit in states[-1].units.items():
+                        assert (unit is states[-2].units.get(u_id)) == (u_id not in moved)
+                    assert states[-1].players is states[-2].players
+                    assert states[-1].buildings is states[-2].buildings
+
+            # Earlier states weren't modified by later actions
+            for state, snapshot in zip(states[1:], snapshots[1:]):
+                assert {u_id: dict(unit) for u_id, unit in state.units.items()} == snapshot
+
+    def test_single_transition(self):
+        """Test that composite actions, e.g. Move + Fire, only build one new state"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            state = AWBWGameState(replay_initial=replay.game_info())
+            with mock.patch.object(awbw, "_Transition", wraps=awbw._Transition) as transition: # pylint: disable=protected-access
+                for action in replay.actions():
+                    transition.reset_mock()
+                    state = state.apply_action(AWBWGameAction(action))
+                    assert transition.call_count <= 1
+
+    def test_player_stats(self):
+        """Test that the running player stats match a full recompute after every action"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip")
+        AWBWGameState.CHECK_PLAYER_STATS = True
+        try:
+            with AWBWReplay(example_replay) as replay:
+                state = AWBWGameState(replay_initial=replay.game_info())
+                cursor = AWBWReplayCursor(replay_initial=replay.game_info())
+                # Each player starts with their HQ and bases
+                for stats in state.player_stats.values():
+                    assert stats["properties"] == 3
+                    assert stats["income"] == 3 * state.game_info["funds_per_property"]
+                for i, action in enumerate(replay.actions()):
+                    action = AWBWGameAction(action)
+                    before = state
+                    state = state.apply_action(action)
+                    cursor.apply_action(action)
+                    assert cursor.state.player_stats == state.player_stats
+                    if i == 250:
+                        # 1342451 captures a city from 1342452
+                        assert (state.player_stats[1342451]["properties"]
+                                == before.player_stats[1342451]["properties"] + 1)
+                        assert (state.player_stats[1342452]["properties"]
+                                == before.player_stats[1342452]["properties"] - 1)
+        finally:
+            AWBWGameState.CHECK_PLAYER_STATS = False
+
+        # Destroyed units are kept in the state, but aren't counted
+        assert sum(1 for unit in state.units.values() if unit["hit_points"] <= 0) == 7
+        for p_id, stats in state.player_stats.items():
+            assert stats["units"] == sum(1 for unit in state.units.values()
+                                         if unit["players_id"] == p_id and unit["hit_points"] > 0)
+        # Each player captured a com tower, which doesn't give funds
+        assert {p_id: (stats["properties"], stats["income"])
+                for p_id, stats in state.player_stats.items()} == {
+                        1342451: (20, 19000), 1342452: (17, 16000)}
+
+    def test_unknown_country(self):
+        """Test that players of countries without known buildings are warned about"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            game_info = replay.game_info()
+        player = next(iter(game_info["players"].values()))
+        player["countries_id"] = 16
+        with self.assertLogs(level="WARNING") as logs:
+            state = AWBWGameState(replay_initial=game_info)
+        assert any("country 16" in line for line in logs.output)
+        assert state.player_stats[int(player["id"])]["properties"] == 0
+
+class TestAWBWReplayCursor(unittest.TestCase):
+    """Tests for the AWBWReplayCursor class"""
+
+    def test_matches_game_states(self):
+        """Test that the cursor state and deltas match the immutable game states"""
+        for name in ["basic_replay.zip", "standard_replay.zip"]:
+            example_replay = os.path.join(TEST_REPLAYS_DIR, name)
+            with AWBWReplay(example_replay) as replay:
+                state = AWBWGameState(replay_initial=replay.game_info())
+                cursor = AWBWReplayCursor(replay_initial=replay.game_info())
+                first_snapshot = cursor.snapshot()
+
+                for action in replay.actions():
+                    action = AWBWGameAction(action)
+                    previous, state = state, state.apply_action(action)
+                    delta = cursor.apply_action(action)
+                    assert as_dicts(cursor.state) == as_dicts(state)
+
+                    new_units = set(state.units) - set(previous.units)
+                    assert set(delta.units_created) == new_units
+                    assert set(delta.units_removed) == set(previous.units) - set(state.units)
+                    for u_id, unit in state.units.items():
+                        if u_id in new_units:
+                            continue
+                        changes = {k: v for k, v in unit.items() if previous.units[u_id][k] != v}
+                        assert delta.units_changed.get(u_id, {}) == changes
+                    for p_id, player in state.players.items():
+                        changes = {k: v for k, v in player.items()
+                                   if previous.players[p_id][k] != v}
+                        assert delta.players_changed.get(p_id, {}) == changes
+                    assert delta.game_info_changed == {
+                            k: v for k, v in state.game_info.items() if previous.game_info[k] != v}
+
+                # Snapshots aren't modified by the cursor
+                assert as_dicts(first_snapshot) == as_dicts(
+                        AWBWGameState(replay_initial=replay.game_info()))
+
 if __name__ == "__main__":
     unittest.main()
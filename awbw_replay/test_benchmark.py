@@ -0,0 +1,83 @@
+"""
+Basic unit tests for the benchmark module on select sample replays.
+
+To run:
+python -m unittest -v
+"""
+
+import contextlib
+import copy
+import io
+import os
+import unittest
+from unittest import mock
+
+from awbw_replay import benchmark
+from awbw_replay.replay import AWBWReplay
+
+# pylint: disable=no-self-use
+
+TEST_REPLAYS_DIR = "replays"
+
+class TestBenchmark(unittest.TestCase):
+    """Tests for the benchmark module"""
+
+    def test_scaled_replay(self):
+        """Test that scaled replays repeat every action"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            game_info = replay.game_info()
+            actions = list(replay.actions())
+        with AWBWReplay(benchmark.scaled_replay(example_replay, 3)) as replay:
+            assert replay.game_info() == game_info
+            assert list(replay.actions()) == actions * 3
+
+    def test_benchmark_replay(self):
+        """Test that every metric is measured"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "short_replay.zip")
+        result = benchmark.benchmark_replay(example_replay, repeat=1)
+        metrics = result["metrics"]
+        assert result["actions"] > 0
+        for metric in ["open_actions_per_s", "open_mb_per_s", "states_actions_per_s",
+                       "peak_memory_bytes"]:
+            assert metrics[metric] > 0
+        assert any(metric.startswith("apply_us.") for metric in metrics)
+
+        scaled = benchmark.benchmark_replay(
+                benchmark.scaled_replay(example_replay, 2), repeat=1, apply_actions=False)
+        assert scaled["actions"] == 2 * result["actions"]
+        assert "states_s" not in scaled["metrics"]
+
+    def test_compare(self):
+        """Test that regressions past the thresholds are reported"""
+        baseline = {"results": {"replay": {"metrics": {
+            "open_actions_per_s": 1000.0,
+            "peak_memory_bytes": 1000,
+        }}}}
+        assert not benchmark.compare(baseline, baseline)
+
+        results = copy.deepcopy(baseline)
+        results["results"]["replay"]["metrics"]["open_actions_per_s"] = 700.0
+        results["results"]["replay"]["metrics"]["peak_memory_bytes"] = 1100
+        regressions = benchmark.compare(results, baseline, threshold=0.2)
+        assert len(regressions) == 1
+        assert "open_actions_per_s" in regressions[0]
+
+        regressions = benchmark.compare(results, baseline, threshold=0.2,
+                                        thresholds={"peak_memory_bytes": 0.05})
+        assert len(regressions) == 2
+
+        results["results"]["replay"]["metrics"]["open_actions_per_s"] = 5000.0
+        assert len(benchmark.compare(results, baseline, threshold=0.2)) == 0
+
+    def test_main_scales(self):
+        """Test that the unscaled replays are always benchmarked"""
+        for argv, scales in [([], [1]), (["--scale", "10"], [1, 10]),
+                             (["--scale", "10", "--scale", "1", "--scale", "10"], [1, 10])]:
+            with mock.patch.object(benchmark, "run_suite", return_value={}) as run_suite:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    assert benchmark.main(benchmark.get_args(argv)) == benchmark.EXIT_SUCCESS
+            assert run_suite.call_args[1]["scales"] == scales
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+"""
+Basic unit tests for the decode module on select sample replays.
+
+To run:
+python -m unittest -v
+"""
+
+import os
+import unittest
+
+from awbw_replay.awbw import AWBWGameAction, AWBWGameState
+from awbw_replay.decode import (DecodeError, RawAction, decode_action_line, loads_php,
+        loads_php_fields)
+from awbw_replay.replay import AWBWReplay
+
+# pylint: disable=no-self-use
+
+TEST_REPLAYS_DIR = "replays"
+
+class TestDecodeActionLine(unittest.TestCase):
+    """Tests for the single pass action line decoder"""
+
+    def test_matches_template_decoder(self):
+        """Test that the native decoder gives the same turns as the template decoder"""
+        for name in ["short_replay.zip", "basic_replay.zip", "standard_replay.zip"]:
+            example_replay = os.path.join(TEST_REPLAYS_DIR, name)
+            with AWBWReplay(example_replay, native=False) as replay:
+                expected_turns = replay.turns()
+            with AWBWReplay(example_replay) as replay:
+                assert replay.turns() == expected_turns
+
+    def test_decode_line(self):
+        """Test decoding a hand written line, including non ASCII and non action strings"""
+        line = ('p:12;d:3;a:a:3:{i:0;i:12;i:1;i:3;i:2;a:3:{'
+                'i:0;s:18:"{"action":"End"}  ";'
+                'i:1;s:5:"hello";'
+                'i:2;s:34:"{"action":"Resign","name":"été"}";}}')
+        player_id, day, actions = decode_action_line(line.encode())
+        assert player_id == 12
+        assert day == 3
+        assert actions == [{"action": "End"}, {"action": "Resign", "name": "été"}]
+
+    def test_bad_lines(self):
+        """Test that lines not following the grammar raise a DecodeError"""
+        with self.assertRaises(DecodeError):
+            decode_action_line(b"")
+        with self.assertRaises(DecodeError):
+            decode_action_line(b"p:1;d:1;a:a:1:{i:0;i:1;}")
+        with self.assertRaises(DecodeError):
+            decode_action_line(b'p:1;d:1;a:a:1:{i:2;a:1:{i:0;s:99:"{"action":"End"}";}}')
+
+class TestRawAction(unittest.TestCase):
+    """Tests for the lazily decoded RawAction handles"""
+
+    def test_action_type(self):
+        """Test that the action type is available without decoding the action"""
+        action = RawAction('{"action":"Fire","Fire":{"copValues":{}}}')
+        assert action["action"] == "Fire"
+        assert AWBWGameAction(action).type == AWBWGameAction.Type.FIRE
+        assert not action.decoded
+        assert action["Fire"] == {"copValues": {}}
+        assert action.decoded
+        assert action == {"action": "Fire", "Fire": {"copValues": {}}}
+
+        # Fall back on decoding when the type isn't the first field
+        action = RawAction(b'{"Fire":{},"action":"Fire"}')
+        assert action["action"] == "Fire"
+        assert action.decoded
+
+    def test_replay_raw_actions(self):
+        """Test that raw actions give the same summaries and states as decoded actions"""
+        for native in [True, False]:
+            example_replay = os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip")
+            with AWBWReplay(example_replay) as replay:
+                expected_actions = list(replay.actions())
+
+            with AWBWReplay(example_replay, raw_actions=True, native=native) as replay:
+                actions = list(replay.actions())
+                assert all(isinstance(action, RawAction) for action in actions)
+                assert list(replay.action_summaries()) == [
+                        action["action"] for action in expected_actions]
+                assert not any(action.decoded for action in actions)
+
+                state = AWBWGameState(replay_initial=replay.game_info())
+                for action in actions:
+                    state = state.apply_action(AWBWGameAction(action))
+                assert actions == expected_actions
+
+class TestLoadsPHP(unittest.TestCase):
+    """Tests for the direct to dict PHP unserializer"""
+
+    def test_matches_phpserialize(self):
+        """Test that the game info matches the phpserialize based decoder"""
+        for name in ["short_replay.zip", "basic_replay.zip", "standard_replay.zip"]:
+            example_replay = os.path.join(TEST_REPLAYS_DIR, name)
+            with AWBWReplay(example_replay, native=False) as replay:
+                expected_game = replay.game_info()
+            with AWBWReplay(example_replay) as replay:
+                assert replay.game_info() == expected_game
+
+    def test_types(self):
+        """Test decoding every PHP type, and collecting the object class names"""
+        data = ('O:4:"Game":3:{s:2:"id";i:-5;s:7:" * name";s:5:"été";'
+                's:4:"list";a:4:{i:0;d:1.5;i:1;b:1;i:2;N;'
+                'i:3;O:6:"Player":1:{s:2:"id";i:2;}}}').encode()
+        value, found_types = loads_php(data, collect_types=True)
+        assert value == {"id": -5, "name": "été",
+                         "list": {0: 1.5, 1: True, 2: None, 3: {"id": 2}}}
+        assert found_types == {"Game", "Player"}
+        assert loads_php(data) == value
+
+        assert loads_php_fields(data, ["list"]) == {"list": value["list"]}
+        assert loads_php_fields(data, ["name", "id"]) == {"id": -5, "name": "été"}
+        # Stop decoding once all the fields have been found
+        assert loads_php_fields(data[:40], ["id"]) == {"id": -5}
+        with self.assertRaises(DecodeError):
+            loads_php_fields(data[:40], ["list"])
+
+        with self.assertRaises(DecodeError):
+            loads_php(b'a:1:{i:0;s:5:"abc";}')
+        with self.assertRaises(DecodeError):
+            loads_php(b"x:1;")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,312 @@
+"""
+Unit tests for the download module, against a local HTTP server.
+
+To run:
+python -m unittest -v
+"""
+
+import http.server
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from awbw_replay.download import Downloader, DownloadError, RateLimiter, PART_SUFFIX
+
+# pylint: disable=no-self-use
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """Serves server.files, with Range support and injectable failures"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """Handles a GET request"""
+        server = self.server
+        range_header = self.headers.get("Range")
+        with server.lock:
+            server.requests.append((self.path, range_header, self.client_address))
+            failures = server.failures.get(self.path, 0)
+            if failures:
+                server.failures[self.path] = failures - 1
+            truncations = server.truncations.get(self.path, 0)
+            if truncations:
+                server.truncations[self.path] = truncations - 1
+
+        if self.path in server.redirects:
+            self.send_response(302)
+            if server.redirects[self.path] is not None:
+                self.send_header("Location", server.redirects[self.path])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if failures:
+            if server.retry_after is not None:
+                self.send_response(503)
+                self.send_header("Retry-After", server.retry_after)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_error(503)
+            return
+        if self.path not in server.files:
+            self.send_error(404)
+            return
+
+        data = server.files[self.path]
+        start = 0
+        if range_header and server.ranges:
+            start = int(range_header[len("bytes="):].rstrip("-"))
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+        else:
+            self.send_response(200)
+        body = data[start:]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if truncations:
+            # Drop the connection half way through the body
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        pass
+
+class _Server(http.server.ThreadingHTTPServer):
+    """Local stand-in of the replay server"""
+    # pylint: disable=too-many-instance-attributes
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.lock = threading.Lock()
+        self.files = {}
+        # Path -> number of requests to fail with a 503
+        self.failures = {}
+        # Retry-After header of the failed requests, if any
+        self.retry_after = None
+        # Path -> number of responses to cut off half way
+        self.truncations = {}
+        # Path -> Location to redirect to, or None to leave it out
+        self.redirects = {}
+        # Whether Range headers are honored
+        self.ranges = True
+        # (path, Range header, client address) of each request
+        self.requests = []
+
+    def url(self, path):
+        """Returns the URL of a path on this server"""
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+class TestDownload(unittest.TestCase):
+    """Tests for the Downloader"""
+
+    def setUp(self):
+        self.server = _Server()
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _downloader(self, **kwargs):
+        kwargs.setdefault("requests_per_second", None)
+        kwargs.setdefault("backoff", 0.01)
+        kwargs.setdefault("timeout", 5)
+        return Downloader(**kwargs)
+
+    def _read(self, filename):
+        with open(os.path.join(self.directory, filename), "rb") as file:
+            return file.read()
+
+    def test_download_all(self):
+        """Test that every file is downloaded, reusing a connection per thread"""
+        urls = []
+        for i in range(20):
+            self.server.files[f"/replays/{i}.zip"] = os.urandom(1000 + i)
+            urls.append(self.server.url(f"/replays/{i}.zip"))
+        with self._downloader(jobs=3) as downloader:
+            results = downloader.download_all(urls, self.directory)
+
+        assert [url for url, _ in results] == urls
+        for i, (_, path) in enumerate(results):
+            assert path == os.path.join(self.directory, f"{i}.zip")
+            assert self._read(f"{i}.zip") == self.server.files[f"/replays/{i}.zip"]
+        assert not [file for file in os.listdir(self.directory) if file.endswith(PART_SUFFIX)]
+        # Keep-alive: each thread opens at most one connection
+        connections = {address for _, _, address in self.server.requests}
+        assert len(connections) <= 3
+
+    def test_already_downloaded(self):
+        """Test that complete files are not downloaded again"""
+        self.server.files["/1.zip"] = b"new"
+        with open(os.path.join(self.directory, "1.zip"), "wb") as file:
+            file.write(b"old")
+        with self._downloader() as downloader:
+            downloader.download(self.server.url("/1.zip"), self.directory)
+        assert self._read("1.zip") == b"old"
+        assert not self.server.requests
+
+    def test_retry(self):
+        """Test that server errors are retried"""
+        self.server.files["/1.zip"] = b"data"
+        self.server.failures["/1.zip"] = 2
+        with self._downloader(retries=2) as downloader:
+            downloader.download(self.server.url("/1.zip"), self.directory)
+        assert self._read("1.zip") == b"data"
+        assert len(self.server.requests) == 3
+
+    def test_retry_after(self):
+        """Test that the Retry-After header is waited out instead of the backoff"""
+        self.server.files["/1.zip"] = b"data"
+        self.server.failures["/1.zip"] = 2
+        self.server.retry_after = "2"
+        with self._downloader(retries=2) as downloader:
+            with mock.patch("time.sleep") as sleep:
+                downloader.download(self.server.url("/1.zip"), self.directory)
+        assert self._read("1.zip") == b"data"
+        assert [call.args for call in sleep.call_args_list] == [(2,), (2,)]
+
+    def test_retries_exhausted(self):
+        """Test that a download fails once it runs out of retries, leaving no file"""
+        self.server.files["/1.zip"] = b"data"
+        self.server.failures["/1.zip"] = 10
+        with self._downloader(retries=2) as downloader:
+            with self.assertRaises(DownloadError):
+                downloader.download(self.server.url("/1.zip"), self.directory)
+            results = downloader.download_all([self.server.url("/1.zip")], self.directory)
+        assert isinstance(results[0][1], DownloadError)
+        assert not os.path.exists(os.path.join(self.directory, "1.zip"))
+
+    def test_not_found(self):
+        """Test that client errors are not retried"""
+        with self._downloader(retries=3) as downloader:
+            with self.assertRaises(DownloadError):
+                downloader.download(self.server.url("/missing.zip"), self.directory)
+        assert len(self.server.requests) == 1
+
+    def test_resume(self):
+        """Test that an interrupted download resumes from its .part file"""
+        data = os.urandom(100000)
+        self.server.files["/1.zip"] = data
+        self.server.truncations["/1.zip"] = 1
+        with self._downloader() as downloader:
+            downloader.download(self.server.url("/1.zip"), self.directory)
+        assert self._read("1.zip") == data
+        assert ([range_header for _, range_header, _ in self.server.requests]
+                == [None, "bytes=50000-"])
+
+    def test_resume_existing_part(self):
+        """Test resuming a .part file left by an earlier run"""
+        data = os.urandom(1000)
+        self.server.files["/1.zip"] = data
+        with open(os.path.join(self.directory, "1.zip" + PART_SUFFIX), "wb") as file:
+            file.write(data[:300])
+        with self._downloader() as downloader:
+            downloader.download(self.server.url("/1.zip"), self.directory)
+        assert self._read("1.zip") == data
+        assert not os.path.exists(os.path.join(self.directory, "1.zip" + PART_SUFFIX))
+
+    def test_complete_part(self):
+        """Test a .part file which already has every byte"""
+        self.server.files["/1.zip"] = b"data"
+        with open(os.path.join(self.directory, "1.zip" + PART_SUFFIX), "wb") as file:
+            file.write(b"data")
+        with self._downloader() as downloader:
+            downloader.download(self.server.url("/1.zip"), self.directory)
+        assert self._read("1.zip") == b"data"
+
+    def test_mismatched_part(self):
+        """Test that a .part file longer than the file on the server is downloaded again"""
+        self.server.files["/1.zip"] = b"data"
+        with open(os.path.join(self.directory, "1.zip" + PART_SUFFIX), "wb") as file:
+            file.write(b"old data")
+        with self.assertLogs(level="WARNING"):
+            with self._downloader(retries=0) as downloader:
+                downloader.download(self.server.url("/1.zip"), self.directory)
+        assert self._read("1.zip") == b"data"
+        assert ([range_header for _, range_header, _ in self.server.requests]
+                == ["bytes=8-", None])
+
+    def test_range_ignored(self):
+        """Test that the .part file is overwritten when the server ignores Range"""
+        self.server.files["/1.zip"] = b"0123456789"
+        self.server.ranges = False
+        with open(os.path.join(self.directory, "1.zip" + PART_SUFFIX), "wb") as file:
+            file.write(b"01234")
+        with self._downloader() as downloader:
+            downloader.download(self.server.url("/1.zip"), self.directory)
+        assert self._read("1.zip") == b"0123456789"
+
+    def test_redirect(self):
+        """Test that redirects are followed, keeping the original file name"""
+        self.server.files["/files/abc"] = b"data"
+        self.server.redirects["/1.zip"] = "/files/abc"
+        with self._downloader() as downloader:
+            downloader.download(self.server.url("/1.zip"), self.directory)
+        assert self._read("1.zip") == b"data"
+
+    def test_redirect_without_location(self):
+        """Test that a redirect without a Location fails without retrying"""
+        self.server.redirects["/1.zip"] = None
+        with self._downloader() as downloader:
+            with self.assertRaises(DownloadError):
+                downloader.download(self.server.url("/1.zip"), self.directory)
+        assert len(self.server.requests) == 1
+
+    def test_download_all_errors(self):
+        """Test that any exception only fails its own URL"""
+        self.server.files["/1.zip"] = b"data"
+        self.server.redirects["/2.zip"] = None
+        self.server.files["/3.zip"] = b"more data"
+        urls = [self.server.url(f"/{i}.zip") for i in range(1, 4)]
+        with self._downloader(jobs=2) as downloader:
+            save = downloader._save # pylint: disable=protected-access
+            def bad_save(url, response, part, offset):
+                if url.endswith("/3.zip"):
+                    raise ValueError("Bad header")
+                save(url, response, part, offset)
+            with mock.patch.object(downloader, "_save", side_effect=bad_save):
+                results = downloader.download_all(urls, self.directory)
+        assert results[0] == (urls[0], os.path.join(self.directory, "1.zip"))
+        assert isinstance(results[1][1], DownloadError)
+        assert isinstance(results[2][1], ValueError)
+        assert self._read("1.zip") == b"data"
+
+    def test_rate_limit(self):
+        """Test that requests are spaced out by the rate limit"""
+        for i in range(5):
+            self.server.files[f"/{i}.zip"] = b"data"
+        start = time.monotonic()
+        with self._downloader(jobs=5, requests_per_second=50) as downloader:
+            urls = [self.server.url(f"/{i}.zip") for i in range(5)]
+            downloader.download_all(urls, self.directory)
+        # The first request is immediate, the next 4 wait 20ms each
+        assert time.monotonic() - start >= 0.08
+
+class TestRateLimiter(unittest.TestCase):
+    """Tests for the RateLimiter"""
+
+    def test_unlimited(self):
+        """Test that no limit never waits"""
+        limiter = RateLimiter(None)
+        start = time.monotonic()
+        for _ in range(1000):
+            limiter.wait()
+        assert time.monotonic() - start < 0.5
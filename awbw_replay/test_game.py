@@ -5,9 +5,11 @@ To run:
 python -m unittest -v
 """
 
+import copy
+import pickle
 import unittest
 
-from .game import DefaultDict
+from .game import DefaultDict, Record
 
 # pylint: disable=no-self-use
 
@@ -60,3 +62,59 @@ class TestDefaultDict(unittest.TestCase):
             TestDefaultDict.ColorDict(pi=3.1415)
         with self.assertRaises(KeyError):
             TestDefaultDict.ColorDict({"pi":3.1415})
+
+class TestRecord(unittest.TestCase):
+    """Tests for the Record class"""
+
+    class ColorRecord(Record):
+        """Example Record"""
+
+        __slots__ = ()
+
+        ALLOWED_DATA = {
+            "r": 0,
+            "g": 0,
+            "b": 0,
+        }
+
+    def test_color_record(self):
+        """Test that we can create and use ColorRecord as a dict"""
+        test_record = TestRecord.ColorRecord(r=100)
+        assert test_record["r"] == 100
+        assert test_record["g"] == 0
+        assert list(test_record) == ["r", "g", "b"]
+        assert dict(test_record) == {"r": 100, "g": 0, "b": 0}
+        assert test_record == {"r": 100, "g": 0, "b": 0}
+        assert test_record.get("pi", 3) == 3
+        assert "pi" not in test_record
+
+        test_record = test_record | { "r": 255, "b": 255 }
+        assert isinstance(test_record, TestRecord.ColorRecord)
+        assert dict(test_record.items()) == {"r": 255, "g": 0, "b": 255}
+
+        test_record = TestRecord.ColorRecord({"r": 15, "b": 22}, g=81)
+        assert list(test_record.values()) == [15, 81, 22]
+        test_record["g"] += 1
+        assert test_record["g"] == 82
+        assert not hasattr(test_record, "__dict__")
+
+    def test_copies(self):
+        """Test that copies don't share values"""
+        test_record = TestRecord.ColorRecord(r=1, g=2, b=3)
+        for copied in [copy.copy(test_record), copy.deepcopy(test_record),
+                pickle.loads(pickle.dumps(test_record))]:
+            assert copied == test_record
+            copied["r"] = 100
+            assert test_record["r"] == 1
+
+    def test_bad_keys(self):
+        """Test that an exception is raised when an invalid key is used"""
+        with self.assertRaises(KeyError):
+            TestRecord.ColorRecord(pi=3.1415)
+        test_record = TestRecord.ColorRecord()
+        with self.assertRaises(KeyError):
+            test_record["pi"] = 3.1415
+        with self.assertRaises(KeyError):
+            test_record.update({"pi": 3.1415})
+        with self.assertRaises(TypeError):
+            del test_record["r"]
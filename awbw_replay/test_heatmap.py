@@ -0,0 +1,116 @@
+"""
+Basic unit tests for the heatmap module on select sample replays.
+
+To run:
+python -m unittest -v
+"""
+
+import collections
+import io
+import json
+import os
+import pickle
+import re
+import unittest
+
+from awbw_replay.replay import AWBWReplay
+from awbw_replay.awbw import AWBWGameAction
+from awbw_replay.heatmap import Heatmap, HeatmapSet, np
+
+# pylint: disable=no-self-use
+
+TEST_REPLAYS_DIR = "replays"
+
+def _move_coords(replay):
+    """Counts the move path coordinates of each unit type with dicts"""
+    coords = collections.defaultdict(collections.Counter)
+    heatmaps = HeatmapSet()
+    for action in replay.actions():
+        action = AWBWGameAction(action)
+        if action.type == AWBWGameAction.Type.MOVE:
+            key = "global" if "global" in action.info["unit"] else next(iter(action.info["paths"]))
+            unit_type = action.info["unit"][key]["units_name"]
+            path = action.info["paths"][key]
+            for coord in path:
+                coords[unit_type][(coord["x"], coord["y"])] += 1
+            heatmaps[unit_type].add([coord["x"] for coord in path], [coord["y"] for coord in path])
+    return coords, heatmaps
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestHeatmap(unittest.TestCase):
+    """Tests for Heatmap and HeatmapSet"""
+
+    def test_add(self):
+        """Test counting coordinates, growing the array to fit them"""
+        heatmap = Heatmap()
+        heatmap.add([1, 1, 2], [15, 14, 14])
+        heatmap.add_point(1, 14)
+        heatmap.add([], [])
+        assert heatmap.counts.shape == (3, 16)
+        assert heatmap.counts[1, 14] == 2
+        assert heatmap.items() == [((1, 14), 2), ((1, 15), 1), ((2, 14), 1)]
+        assert heatmap.to_text() == "(1, 14) 2;(1, 15) 1;(2, 14) 1;"
+        assert Heatmap(30, 20).counts.shape == (30, 20)
+        assert Heatmap().to_text() == ""
+        with self.assertRaises(ValueError):
+            heatmap.add_point(-1, 0)
+            heatmap.items()
+
+    def test_replay(self):
+        """Test that the heatmaps of a replay match counting with dicts"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            coords, heatmaps = _move_coords(replay)
+        assert list(heatmaps) == list(coords)
+        for unit_type, counter in coords.items():
+            assert dict(heatmaps[unit_type].items()) == dict(counter)
+            # The text format read by the userscript
+            text = heatmaps[unit_type].to_text()
+            parsed = {(int(x), int(y)): int(count)
+                      for x, y, count in re.findall(r"\((\d+), (\d+)\) (\d+)", text)}
+            assert parsed == dict(counter)
+
+    def test_merge(self):
+        """Test merging heatmaps of different sizes"""
+        first = HeatmapSet()
+        first["Infantry"].add([0, 5], [0, 5])
+        second = HeatmapSet()
+        second["Infantry"].add([9, 0], [1, 0])
+        second["Tank"].add_point(3, 3)
+        first.merge(second)
+        assert list(first) == ["Infantry", "Tank"]
+        assert first["Infantry"].items() == [((0, 0), 2), ((5, 5), 1), ((9, 1), 1)]
+        assert first["Tank"].items() == [((3, 3), 1)]
+
+    def test_reserve(self):
+        """Test sizing heatmaps up front, without changing the counts"""
+        heatmaps = HeatmapSet()
+        heatmaps["Infantry"].add_point(3, 4)
+        heatmaps.reserve(20, 10)
+        heatmaps["Tank"].add_point(25, 1)
+        assert heatmaps["Infantry"].counts.shape == (20, 10)
+        assert heatmaps["Tank"].counts.shape == (26, 10)
+        assert heatmaps["Infantry"].items() == [((3, 4), 1)]
+        heatmaps["Infantry"].reserve(5, 5)
+        assert heatmaps["Infantry"].counts.shape == (20, 10)
+
+    def test_export(self):
+        """Test the JSON, .npy, .npz and pickle round trips"""
+        heatmaps = HeatmapSet()
+        heatmaps["Infantry"].add([0, 5, 5], [0, 5, 5])
+        heatmaps["Md.Tank"].add_point(3, 7)
+
+        assert HeatmapSet.from_json(json.loads(json.dumps(heatmaps.to_json()))) == heatmaps
+        assert pickle.loads(pickle.dumps(heatmaps)) == heatmaps
+
+        stream = io.BytesIO()
+        heatmaps.save(stream)
+        stream.seek(0)
+        assert HeatmapSet.load(stream) == heatmaps
+
+        stream = io.BytesIO()
+        heatmaps["Infantry"].save(stream)
+        stream.seek(0)
+        loaded = Heatmap.load(stream)
+        assert loaded == heatmaps["Infantry"]
+        assert np.array_equal(loaded.counts, heatmaps["Infantry"].counts)
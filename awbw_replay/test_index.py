@@ -0,0 +1,171 @@
+"""
+Basic unit tests for the index module on select sample replays.
+
+To run:
+python -m unittest -v
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from awbw_replay.index import INDEX_VERSION, CorpusIndex, co_name
+from awbw_replay.replay import AWBWReplay
+from awbw_replay.awbw import AWBWGameAction, AWBWGameState
+from awbw_replay.synthetic import generate_replay
+
+# pylint: disable=no-self-use
+
+TEST_REPLAYS_DIR = "replays"
+
+class TestCorpusIndex(unittest.TestCase):
+    """Tests for the CorpusIndex"""
+
+    def setUp(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        self.replays = os.path.join(temp_dir, "replays")
+        os.makedirs(self.replays)
+        for filename in ["basic_replay.zip", "short_replay.zip", "standard_replay.zip"]:
+            shutil.copy(os.path.join(TEST_REPLAYS_DIR, filename), self.replays)
+        self.db = os.path.join(temp_dir, "corpus.sqlite")
+
+    def _path(self, filename):
+        return os.path.join(os.path.abspath(self.replays), filename)
+
+    def test_build(self):
+        """Test that replays are indexed once, and reindexed when changed"""
+        with CorpusIndex(self.db) as index:
+            assert index.add_directory(self.replays) == 3
+            assert index.add_directory(self.replays) == 0
+        os.utime(self._path("basic_replay.zip"), ns=(0, 0))
+        with CorpusIndex(self.db) as index:
+            # Same contents, so only the time is updated
+            assert index.add_directory(self.replays) == 0
+            shutil.copy(self._path("short_replay.zip"), self._path("basic_replay.zip"))
+            assert index.add_directory(self.replays) == 1
+            os.remove(self._path("short_replay.zip"))
+            index.add_directory(self.replays)
+            assert sorted(index.find_replays()) == [self._path("basic_replay.zip"),
+                                                    self._path("standard_replay.zip")]
+
+    def test_game(self):
+        """Test the indexed game, compared to applying every action"""
+        with CorpusIndex(self.db) as index:
+            index.add_directory(self.replays)
+            with AWBWReplay(self._path("standard_replay.zip")) as replay:
+                game_info = replay.game_info()
+                state = AWBWGameState(replay_initial=game_info)
+                num_actions = 0
+                end_of_day_funds = {}
+                for action in replay.actions():
+                    state = state.apply_action(AWBWGameAction(action))
+                    num_actions += 1
+                    for p_id, player in state.players.items():
+                        day = state.game_info["day"]
+                        end_of_day_funds.setdefault(p_id, {})[day] = player["funds"]
+
+            game = index.game(game_info["id"])
+            assert game["maps_id"] == game_info["maps_id"]
+            assert game["actions"] == num_actions
+            assert game["days"] == state.game_info["day"]
+            assert ({player["players_id"] for player in game["players"]}
+                    == {player["id"] for player in game_info["players"].values()})
+            assert index.day_series(game_info["id"], "funds") == {
+                    p_id: sorted(days.items()) for p_id, days in end_of_day_funds.items()}
+            assert index.game(-1) is None
+            with self.assertRaises(ValueError):
+                index.day_series(game_info["id"], "games_id")
+
+    def test_day_stats(self):
+        """Test that dead units aren't counted and properties owned from the start are"""
+        with CorpusIndex(self.db) as index:
+            index.add_replay(self._path("standard_replay.zip"))
+            game_id = index.find_games()[0]
+            last_day = index.game(game_id)["days"]
+            # 7 units were destroyed, and each player starts with 3 properties and captured a
+            # com tower, which doesn't give funds
+            for field, expected in [("units", {1342451: 18, 1342452: 21}),
+                                    ("properties", {1342451: 20, 1342452: 17}),
+                                    ("income", {1342451: 19000, 1342452: 16000})]:
+                series = index.day_series(game_id, field)
+                assert {p_id: days[-1] for p_id, days in series.items()} == {
+                        p_id: (last_day, value) for p_id, value in expected.items()}
+            for days in index.day_series(game_id, "properties").values():
+                assert days[0][1] >= 3
+
+    def test_version(self):
+        """Test that an index of an older version is rebuilt"""
+        with CorpusIndex(self.db) as index:
+            index.add_directory(self.replays)
+            index.connection.execute(f"PRAGMA user_version = {INDEX_VERSION - 1}")
+        with CorpusIndex(self.db) as index:
+            assert not index.find_games()
+            assert index.add_directory(self.replays) == 3
+
+    def test_find(self):
+        """Test finding games by map, COs, days and winner"""
+        with CorpusIndex(self.db) as index:
+            index.add_directory(self.replays)
+            short = index.game(index.find_games(cos=["Koal"])[0])
+            assert index.find_replays(cos=["koal", "ANDY"]) == [self._path("short_replay.zip")]
+            assert not index.find_replays(cos=["Koal", "Koal"])
+            assert index.find_games(maps_id=short["maps_id"]) == [short["games_id"]]
+            assert short["games_id"] not in index.find_games(min_days=short["days"] + 1)
+            assert short["games_id"] in index.find_games(max_days=short["days"])
+            winner = [player for player in short["players"]
+                      if player["players_id"] == short["winner_id"]]
+            assert index.find_games(winner_co=winner[0]["co_name"], maps_id=short["maps_id"]) == [
+                    short["games_id"]]
+
+    def test_game_over_winner(self):
+        """Test the winner of a game ended by a GameOver End action, e.g. an HQ capture"""
+        actions = AWBWReplay.actions
+        def hq_capture(replay, types=None):
+            for action in actions(replay, types):
+                if action["action"] == "Resign":
+                    # End the game the way capturing the loser's HQ does
+                    action = {"action": "End",
+                              "updatedInfo": {"event": "GameOver", **action["GameOver"]}}
+                yield action
+
+        with patch.object(AWBWReplay, "actions", hq_capture):
+            with CorpusIndex(self.db) as index:
+                index.add_replay(self._path("short_replay.zip"))
+                game = index.game(index.find_games()[0])
+        assert game["winner_id"] == 1345088
+        assert {player["players_id"]: player["eliminated"] for player in game["players"]} == {
+                1345087: True, 1345088: False}
+
+    def test_synthetic(self):
+        """Test the per day statistics of a longer generated replay"""
+        generate_replay(os.path.join(self.replays, "synthetic.zip"), players=3, days=12, game_id=7)
+        with CorpusIndex(self.db) as index:
+            index.add_replay(os.path.join(self.replays, "synthetic.zip"))
+            game = index.game(7)
+            assert game["days"] == 12
+            units = index.day_series(7, "units")
+            assert len(units) == 3
+            assert all([day for day, _ in series] == list(range(1, 13))
+                       for series in units.values())
+
+    def test_bad_replay(self):
+        """Test that replays which fail are recorded without a game"""
+        with open(os.path.join(self.replays, "garbage.zip"), "wb") as garbage:
+            garbage.write(b"not a zip")
+        with CorpusIndex(self.db) as index:
+            with self.assertLogs(level="ERROR"):
+                assert index.add_directory(self.replays) == 4
+            assert len(index.find_games()) == 3
+            error = index.connection.execute(
+                    "SELECT error FROM files WHERE path = ?",
+                    (self._path("garbage.zip"),)).fetchone()[0]
+            assert "BadZipFile" in error
+
+    def test_co_name(self):
+        """Test deriving CO names from their images"""
+        assert co_name("sensei.png") == "Sensei"
+        assert co_name("vonbolt.png") == "Von Bolt"
+        assert co_name(None) is None
@@ -0,0 +1,105 @@
+"""
+Basic unit tests for the manifest module on select sample replays.
+
+To run:
+python -m unittest -v
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from awbw_replay import manifest as manifest_module
+from awbw_replay.manifest import ResultsManifest
+
+# pylint: disable=no-self-use
+
+TEST_REPLAYS_DIR = "replays"
+
+class TestResultsManifest(unittest.TestCase):
+    """Tests for the ResultsManifest"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        self.replay = os.path.join(self.temp_dir, "basic_replay.zip")
+        shutil.copy(os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip"), self.replay)
+        self.path = os.path.join(self.temp_dir, "manifest.jsonl")
+
+    def test_record(self):
+        """Test that recorded results are found by later runs"""
+        with ResultsManifest(self.path, version=1) as manifest:
+            assert manifest.lookup(self.replay) is None
+            manifest.record(self.replay, {"count": 3})
+            assert manifest.lookup(self.replay) == {"count": 3}
+        with ResultsManifest(self.path, version=1) as manifest:
+            assert manifest.lookup(self.replay) == {"count": 3}
+        with ResultsManifest(self.path, version=2) as manifest:
+            assert manifest.lookup(self.replay) is None
+
+    def test_unchanged_not_hashed(self):
+        """Test that unchanged files are looked up without hashing them again"""
+        with ResultsManifest(self.path) as manifest:
+            manifest.record(self.replay, 1)
+        with ResultsManifest(self.path) as manifest:
+            with mock.patch.object(manifest_module.ReplayCache, "key") as key:
+                assert manifest.lookup(self.replay) == 1
+            assert not key.called
+
+    def test_changed(self):
+        """Test that results are invalidated by changes to the replay, but not its time"""
+        with ResultsManifest(self.path) as manifest:
+            manifest.record(self.replay, 1)
+        os.utime(self.replay, ns=(0, 0))
+        with ResultsManifest(self.path) as manifest:
+            assert manifest.lookup(self.replay) == 1
+        with open(self.replay, "ab") as replay:
+            replay.write(b"\0")
+        with ResultsManifest(self.path) as manifest:
+            assert manifest.lookup(self.replay) is None
+
+    def test_renamed(self):
+        """Test that results are found by the replay contents"""
+        with ResultsManifest(self.path) as manifest:
+            manifest.record(self.replay, 1)
+        renamed = os.path.join(self.temp_dir, "renamed.zip")
+        os.rename(self.replay, renamed)
+        with ResultsManifest(self.path) as manifest:
+            assert manifest.lookup(renamed) == 1
+
+    def test_interrupted(self):
+        """Test that a partially written last line is ignored"""
+        other = os.path.join(self.temp_dir, "other.zip")
+        shutil.copy(os.path.join(TEST_REPLAYS_DIR, "short_replay.zip"), other)
+        with ResultsManifest(self.path) as manifest:
+            manifest.record(self.replay, 1)
+            manifest.record(other, 2)
+        with open(self.path, "r+", encoding="utf-8") as stream:
+            stream.truncate(os.path.getsize(self.path) - 10)
+        with self.assertLogs(level="WARNING"):
+            manifest = ResultsManifest(self.path)
+        with manifest:
+            assert manifest.lookup(self.replay) == 1
+            assert manifest.lookup(other) is None
+            manifest.record(other, 2)
+        with ResultsManifest(self.path) as manifest:
+            assert manifest.lookup(other) == 2
+
+    def test_compact(self):
+        """Test that compacting keeps only the latest entry of the kept files"""
+        other = os.path.join(self.temp_dir, "other.zip")
+        shutil.copy(os.path.join(TEST_REPLAYS_DIR, "short_replay.zip"), other)
+        with ResultsManifest(self.path) as manifest:
+            manifest.record(self.replay, 1)
+            manifest.record(self.replay, 2)
+            manifest.record(other, 3)
+            manifest.compact(keep=[self.replay])
+            assert len(manifest) == 1
+            manifest.record(other, 4)
+        with open(self.path, "r", encoding="utf-8") as stream:
+            assert len(stream.readlines()) == 2
+        with ResultsManifest(self.path) as manifest:
+            assert manifest.lookup(self.replay) == 2
+            assert manifest.lookup(other) == 4
@@ -0,0 +1,85 @@
+"""
+Basic unit tests for the profiling module on select sample replays.
+
+To run:
+python -m unittest -v
+"""
+
+import io
+import json
+import os
+import unittest
+
+from awbw_replay import profiling
+from awbw_replay.replay import AWBWReplay
+from awbw_replay.awbw import AWBWGameAction, AWBWGameState
+
+# pylint: disable=no-self-use
+
+TEST_REPLAYS_DIR = "replays"
+
+def _apply_all(replay):
+    """Applies every action of the replay, returning the number of actions"""
+    state = AWBWGameState(replay_initial=replay.game_info())
+    num_actions = 0
+    for action in replay.actions():
+        state = state.apply_action(AWBWGameAction(action))
+        num_actions += 1
+    return num_actions
+
+class TestProfiling(unittest.TestCase):
+    """Tests for the profiling module"""
+
+    def tearDown(self):
+        profiling.disable()
+        profiling.reset()
+
+    def test_disabled(self):
+        """Test that nothing is recorded unless profiling is enabled"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            _apply_all(replay)
+        assert profiling.report() == {"stages": {}, "counters": {}}
+
+    def test_stages(self):
+        """Test that each stage is recorded and dumped as JSON"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip")
+        profiling.enable(track_memory=True)
+        with AWBWReplay(example_replay) as replay:
+            num_actions = _apply_all(replay)
+            num_turns = len(replay.turns())
+        profiling.disable()
+
+        stages = profiling.report()["stages"]
+        for name in ["zip_read", "decompress", "line_tokenize", "php_decode"]:
+            assert stages[name]["count"] >= 1
+        assert stages["action_line_decode"]["count"] == num_turns
+        assert stages["json_decode"]["count"] >= num_actions
+        assert sum(stats["count"] for name, stats in stages.items()
+                   if name.startswith("apply.")) == num_actions
+        assert sum(stages["apply.Fire"]["histogram_us"].values()) == stages["apply.Fire"]["count"]
+        assert stages["php_decode"]["net_traced_bytes"] > 0
+        assert profiling.report()["counters"]["decompressed_bytes"] > 0
+
+        output = io.StringIO()
+        profiling.dump(output)
+        assert json.loads(output.getvalue()) == profiling.report()
+        assert "apply.Fire" in profiling.format_report()
+
+    def test_merge(self):
+        """Test adding up the measurements of other processes"""
+        profiling.enable()
+        with AWBWReplay(os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip")) as replay:
+            _apply_all(replay)
+        profiling.disable()
+        once = profiling.report()
+        measurements = profiling.snapshot()
+        profiling.merge(measurements)
+        twice = profiling.report()
+        for name, stats in once["stages"].items():
+            assert twice["stages"][name]["count"] == 2 * stats["count"]
+            assert twice["stages"][name]["max_us"] == stats["max_us"]
+        assert twice["counters"] == {name: 2 * value for name, value in once["counters"].items()}
+
+if __name__ == "__main__":
+    unittest.main()
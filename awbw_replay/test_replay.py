@@ -8,8 +8,11 @@ python -m unittest -v
 import os
 import unittest
 import tempfile
+from unittest import mock
 
-from awbw_replay.replay import AWBWReplay
+from awbw_replay import decode
+from awbw_replay.awbw import AWBWGameAction
+from awbw_replay.replay import AWBWReplay, LazyTurns, ReplayCache
 
 # pylint: disable=no-self-use
 
@@ -27,6 +30,148 @@ class TestAWBWReplay(unittest.TestCase):
             assert isinstance(replay.turns(), list)
             assert isinstance(replay.game_info(), dict)
 
+    def test_lazy_open(self):
+        """Test that lazily decoded turns match the eagerly parsed ones"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            expected_turns = replay.turns()
+
+        with AWBWReplay(example_replay, lazy=True, turn_cache_size=4) as replay:
+            turns = replay.turns()
+            assert isinstance(turns, LazyTurns)
+            assert len(turns) == len(expected_turns)
+            assert turns[-1] == expected_turns[-1]
+            assert turns[1:3] == expected_turns[1:3]
+            assert list(turns) == expected_turns
+            assert len(turns._cache) <= 4 # pylint: disable=protected-access
+            assert list(replay.actions()) == [
+                    action for turn in expected_turns for action in turn.actions]
+            assert replay.game_info()["id"] == 526988
+
+    def test_keep_raw(self):
+        """Test that the decompressed archive files are only kept when asked for"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "short_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            expected_turns = replay.turns()
+            assert not replay.filedata
+
+        with AWBWReplay(example_replay, keep_raw=True) as replay:
+            assert replay.turns() == expected_turns
+            assert len(replay.filedata) == 2
+            assert all(isinstance(data, bytes) for data in replay.filedata)
+
+    def test_cache(self):
+        """Test that a cached replay is returned without decoding the archive again"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip")
+        with tempfile.TemporaryDirectory() as tempdir:
+            cache = ReplayCache(tempdir)
+            with AWBWReplay(example_replay, cache=cache) as replay:
+                expected_turns = replay.turns()
+                expected_game = replay.game_info()
+            assert len(os.listdir(tempdir)) == 1
+
+            with mock.patch.object(decode, "loads_php", side_effect=AssertionError), \
+                    mock.patch.object(decode, "decode_action_line", side_effect=AssertionError):
+                with AWBWReplay(example_replay, cache=cache) as replay:
+                    assert replay.turns() == expected_turns
+                    assert replay.game_info() == expected_game
+                    assert replay.path() == example_replay
+
+    def test_cache_eviction(self):
+        """Test that the least recently used entries are removed past max_bytes"""
+        with tempfile.TemporaryDirectory() as tempdir:
+            cache = ReplayCache(tempdir, max_bytes=1)
+            for name in ["short_replay.zip", "standard_replay.zip"]:
+                with AWBWReplay(os.path.join(TEST_REPLAYS_DIR, name), cache=cache):
+                    pass
+            assert os.listdir(tempdir) == []
+
+            cache.max_bytes = 1024 * 1024 * 1024
+            for name in ["short_replay.zip", "standard_replay.zip"]:
+                with AWBWReplay(os.path.join(TEST_REPLAYS_DIR, name), cache=cache):
+                    pass
+            short_key = cache.key(os.path.join(TEST_REPLAYS_DIR, "short_replay.zip"))
+            # Only keep room for the most recently used entry
+            cache.max_bytes = os.path.getsize(os.path.join(tempdir, short_key + ".pickle"))
+            os.utime(os.path.join(tempdir, short_key + ".pickle"), (0, 0))
+            assert cache.load(short_key) is not None
+            cache.evict()
+            assert os.listdir(tempdir) == [short_key + ".pickle"]
+
+    def test_cache_scans_once(self):
+        """Test that storing entries under max_bytes doesn't rescan the cache directory"""
+        with tempfile.TemporaryDirectory() as tempdir:
+            cache = ReplayCache(tempdir)
+            with mock.patch.object(os, "scandir", wraps=os.scandir) as scan:
+                for name in ["short_replay.zip", "standard_replay.zip", "basic_replay.zip"]:
+                    with AWBWReplay(os.path.join(TEST_REPLAYS_DIR, name), cache=cache):
+                        pass
+            assert scan.call_count == 1
+            assert len(os.listdir(tempdir)) == 3
+
+    def test_actions_by_type(self):
+        """Test that actions can be filtered by type with the action index"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip")
+        types = {AWBWGameAction.Type.FIRE, "Capt"}
+        with AWBWReplay(example_replay) as replay:
+            all_actions = list(replay.actions())
+            expected_actions = [
+                    action for action in all_actions if action["action"] in ("Fire", "Capt")]
+            assert list(replay.actions(types=types)) == expected_actions
+            assert sum(len(positions) for positions in replay.action_index().values()) == \
+                    len(all_actions)
+
+        with AWBWReplay(example_replay, lazy=True, turn_cache_size=2, raw_actions=True) as replay:
+            actions = list(replay.actions(types=types))
+            # Indexing the lazy turns doesn't decode any actions
+            assert not any(action.decoded for action in actions)
+            assert actions == expected_actions
+            assert list(replay.actions(types=[AWBWGameAction.Type.POWER])) == [
+                    action for action in all_actions if action["action"] == "Power"]
+
+    def test_open_sources(self):
+        """Test opening a replay from buffers, file objects and memory maps"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            expected_turns = replay.turns()
+            expected_game = replay.game_info()
+
+        with open(example_replay, "rb") as stream:
+            data = stream.read()
+        with open(example_replay, "rb") as stream:
+            sources = [data, bytearray(data), memoryview(data), stream]
+            for source in sources:
+                with AWBWReplay(source) as replay:
+                    assert replay.path() is None
+                    assert replay.turns() == expected_turns
+                    assert replay.game_info() == expected_game
+
+        with AWBWReplay(example_replay, use_mmap=True, lazy=True) as replay:
+            assert replay.path() == example_replay
+            assert replay.game_info() == expected_game
+        # Lazy turns are still available once the archive is closed
+        assert list(replay.turns()) == expected_turns
+
+        with tempfile.TemporaryDirectory() as tempdir:
+            cache = ReplayCache(tempdir)
+            with AWBWReplay(memoryview(data), cache=cache):
+                pass
+            with mock.patch.object(decode, "loads_php", side_effect=AssertionError):
+                with AWBWReplay(example_replay, cache=cache) as replay:
+                    assert replay.game_info() == expected_game
+
+    def test_peek(self):
+        """Test reading the game info without opening the actions"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            expected_game = replay.game_info()
+
+        with mock.patch.object(decode, "decode_action_line", side_effect=AssertionError):
+            assert AWBWReplay.peek(example_replay) == expected_game
+            game = AWBWReplay.peek(example_replay, fields=["maps_id", "id", "players"])
+            assert game == {key: expected_game[key] for key in ["id", "maps_id", "players"]}
+            assert AWBWReplay.peek(example_replay, fields=["not_a_field"]) == {}
+
     @unittest.expectedFailure
     def test_open_nonexistent(self):
         """Test that an error is raised when a nonexistent file is opened"""
@@ -0,0 +1,70 @@
+"""
+Basic unit tests for the synthetic module.
+
+To run:
+python -m unittest -v
+"""
+
+import collections
+import io
+import unittest
+
+from awbw_replay.replay import AWBWReplay
+from awbw_replay.awbw import AWBWGameAction, AWBWGameState
+from awbw_replay.synthetic import generate_replay
+
+# pylint: disable=no-self-use
+
+def _apply_all(data):
+    """Applies every action of a replay, returning the last state and the action type counts"""
+    counts = collections.Counter()
+    with AWBWReplay(data) as replay:
+        state = AWBWGameState(replay_initial=replay.game_info())
+        for action in replay.actions():
+            state = state.apply_action(AWBWGameAction(action))
+            counts[action["action"]] += 1
+    return state, counts
+
+class TestGenerateReplay(unittest.TestCase):
+    """Tests for the generate_replay function"""
+
+    def test_consistent_game(self):
+        """Test that every generated action applies cleanly"""
+        AWBWGameState.CHECK_PLAYER_STATS = True
+        try:
+            state, counts = _apply_all(generate_replay(players=3, days=8, seed=1))
+        finally:
+            AWBWGameState.CHECK_PLAYER_STATS = False
+
+        assert len(state.players) == 3
+        assert state.game_info["day"] == 8
+        assert counts["End"] == 3 * 8 - 1
+        for action_type in ["Build", "Move", "Fire", "Capt"]:
+            assert counts[action_type] > 0
+        # Some captures were completed
+        assert sum(stats["properties"] for stats in state.player_stats.values()) > 0
+
+    def test_fog(self):
+        """Test that fog replays have one view per player"""
+        data = generate_replay(players=2, days=5, fog=True)
+        _apply_all(data)
+        with AWBWReplay(data) as replay:
+            player_ids = {str(player["id"]) for player in replay.game_info()["players"].values()}
+            for action in replay.actions(types=["Move"]):
+                assert set(action["unit"]) == player_ids
+
+    def test_options(self):
+        """Test the deterministic output, action mix and file output"""
+        data = generate_replay(days=3, seed=5)
+        assert data == generate_replay(days=3, seed=5)
+        assert data != generate_replay(days=3, seed=6)
+
+        output = io.BytesIO()
+        generate_replay(output, days=3, seed=5)
+        assert output.getvalue() == data
+
+        _, counts = _apply_all(generate_replay(days=3, action_mix={"Move": 1}))
+        assert set(counts) == {"Move", "End"}
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+Basic unit tests for the timeline module on select sample replays.
+
+To run:
+python -m unittest -v
+"""
+
+import os
+import unittest
+
+from awbw_replay.replay import AWBWReplay
+from awbw_replay.awbw import AWBWGameAction, AWBWGameState
+from awbw_replay.timeline import ReplayTimeline
+from awbw_replay.test_awbw import as_dicts
+
+# pylint: disable=no-self-use
+
+TEST_REPLAYS_DIR = "replays"
+
+class TestReplayTimeline(unittest.TestCase):
+    """Tests for the ReplayTimeline class"""
+
+    def test_state_at(self):
+        """Test that every state of the timeline matches the game states"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            states = [AWBWGameState(replay_initial=replay.game_info())]
+            for action in replay.actions():
+                states.append(states[-1].apply_action(AWBWGameAction(action)))
+
+            for keyframe_interval in [1, 7, 1000]:
+                timeline = ReplayTimeline(replay, keyframe_interval=keyframe_interval)
+                assert len(timeline) == len(states)
+                for i, state in enumerate(states):
+                    assert as_dicts(timeline.state_at(i)) == as_dicts(state)
+                assert as_dicts(timeline.state_at(-1)) == as_dicts(states[-1])
+
+        with self.assertRaises(IndexError):
+            timeline.state_at(len(states))
+
+    def test_days_and_turns(self):
+        """Test looking up states by day and turn"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            timeline = ReplayTimeline(replay, keyframe_interval=16)
+
+        state = timeline.state_at_end_of(3)
+        assert state.game_info["day"] == 3
+        next_turn = timeline.state_at_turn(state.game_info["turn"] + 1)
+        assert next_turn.game_info["day"] == 4
+
+        turn = timeline.state_at_turn(5)
+        assert turn.game_info["turn"] == 5
+
+        with self.assertRaises(KeyError):
+            timeline.state_at_end_of(1000)
+        with self.assertRaises(KeyError):
+            timeline.state_at_turn(-1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+"""
+Basic unit tests for the unit_table module on select sample replays.
+
+To run:
+python -m unittest -v
+"""
+
+import os
+import unittest
+
+from awbw_replay.replay import AWBWReplay
+from awbw_replay.awbw import AWBWGameAction, AWBWGameState, AWBWReplayCursor
+from awbw_replay.unit_table import UnitTable, np
+
+# pylint: disable=no-self-use
+
+TEST_REPLAYS_DIR = "replays"
+
+def _expected_aggregates(state):
+    """Computes the UnitTable aggregates by looping over the alive units"""
+    counts, values, hp_values = {}, {}, {}
+    for unit in state.units.values():
+        if unit["hit_points"] <= 0:
+            continue
+        p_id = unit["players_id"]
+        counts[p_id] = counts.get(p_id, 0) + 1
+        values[p_id] = values.get(p_id, 0) + unit["cost"]
+        hp_values[p_id] = hp_values.get(p_id, 0) + unit["cost"] * unit["hit_points"] / 10
+    return counts, values, hp_values
+
+@unittest.skipIf(np is None, "numpy is not installed")
+class TestUnitTable(unittest.TestCase):
+    """Tests for the UnitTable class"""
+
+    def test_tracks_replay(self):
+        """Test that the table follows the units of a replay through its deltas"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            cursor = AWBWReplayCursor(replay_initial=replay.game_info())
+            table = UnitTable.from_units(cursor.state.units)
+            for action in replay.actions():
+                table.apply_delta(cursor.apply_action(AWBWGameAction(action)))
+
+                state = cursor.state
+                assert len(table) == len(state.units)
+                for u_id, unit in state.units.items():
+                    row = table.row(u_id)
+                    for name in ["players_id", "hit_points", "cost", "x", "y", "fuel", "ammo"]:
+                        assert table.column(name)[row] == unit[name]
+
+                counts, values, hp_values = _expected_aggregates(state)
+                for p_id, count in counts.items():
+                    assert table.unit_counts()[p_id] == count
+                    assert table.unit_values()[p_id] == values[p_id]
+                    self.assertAlmostEqual(table.hp_weighted_values()[p_id], hp_values[p_id])
+                    assert count == state.player_stats[p_id]["units"]
+            # Destroyed units are still in the table, but not in the aggregates
+            assert np.count_nonzero(table.column("hit_points") <= 0) == 7
+            assert sum(table.unit_counts().values()) == len(table) - 7
+
+    def test_hp_change(self):
+        """Test that apply_hp_change matches the game state power handler"""
+        example_replay = os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip")
+        with AWBWReplay(example_replay) as replay:
+            state = AWBWGameState(replay_initial=replay.game_info())
+        p_id = next(iter(state.players))
+        for unit in state.units.values():
+            unit["players_id"] = p_id
+            unit["hit_points"] = 9
+        hp_change = {"hpGain": {"hp": 2, p_id: True}, "hpLoss": ""}
+
+        table = UnitTable.from_units(state.units)
+        txn = state._transition() # pylint: disable=protected-access
+        state._apply_power_action_hp_change({"hpChange": hp_change}, txn) # pylint: disable=protected-access
+        state = txn.commit()
+
+        changed = table.apply_hp_change(hp_change)
+        assert sorted(changed.tolist()) == sorted(state.units)
+        for u_id, unit in state.units.items():
+            # The hit points are set to the new value, capped at 10
+            assert unit["hit_points"] == 10
+            assert table.column("hit_points")[table.row(u_id)] == unit["hit_points"]
+
+        # Losses leave every unit with at least 1 hit point, but don't revive destroyed units
+        destroyed = next(iter(state.units))
+        table.update(destroyed, {"hit_points": 0})
+        changed = table.apply_hp_change({"hpLoss": {"hp": -20, p_id: True}})
+        assert destroyed not in changed.tolist()
+        assert table.column("hit_points")[table.row(destroyed)] == 0
+        assert sorted(table.column("hit_points").tolist()) == [0] + [1] * (len(table) - 1)
+
+    def test_remove(self):
+        """Test that removing units keeps the rows consistent"""
+        table = UnitTable(capacity=1)
+        for u_id in range(10):
+            table.add({"id": u_id, "players_id": u_id % 2, "hit_points": 10, "cost": 1000,
+                       "moved": True})
+        table.remove(0)
+        table.remove(5)
+        table.update(9, {"cost": 500, "moved": False})
+        assert len(table) == 8
+        assert 5 not in table
+        assert table.column("cost")[table.row(9)] == 500
+        assert table.column("flags")[table.row(9)] == 0
+        assert table.unit_counts() == {0: 4, 1: 4}
+        assert table.unit_values() == {0: 4000, 1: 3500}
+        with self.assertRaises(KeyError):
+            table.add({"id": 1})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+"""Random access to the game states of a replay."""
+
+import bisect
+
+from awbw_replay.awbw import AWBWGameAction, AWBWReplayCursor
+
+class ReplayTimeline():
+    """
+    Stores every game state of a replay compactly, as full keyframe states every
+    keyframe_interval actions and the StateDeltas of the actions in between.
+
+    Any state is rebuilt from the closest earlier keyframe by applying at most
+    keyframe_interval - 1 deltas. A smaller interval makes seeking faster, a
+    larger one uses less memory.
+
+    Usage:
+
+    with AWBWReplay("52963.zip") as replay:
+        timeline = ReplayTimeline(replay, keyframe_interval=64)
+    state = timeline.state_at(4312)
+    """
+
+    def __init__(self, replay, keyframe_interval=64):
+        """
+        Arguments:
+        - replay: An open AWBWReplay
+        - keyframe_interval: The number of actions between keyframes
+        """
+        if keyframe_interval < 1:
+            raise ValueError("keyframe_interval must be at least 1")
+        self.keyframe_interval = keyframe_interval
+
+        cursor = AWBWReplayCursor(replay_initial=replay.game_info())
+        # keyframes[k] is the state after k * keyframe_interval actions
+        self._keyframes = [cursor.snapshot()]
+        # deltas[i] is the change made by action i
+        self._deltas = []
+        # The day and turn of the state after i actions, for the bisect lookups
+        self._days = [cursor.state.game_info["day"]]
+        self._turns = [cursor.state.game_info["turn"]]
+
+        for action in replay.actions():
+            self._deltas.append(cursor.apply_action(AWBWGameAction(action)))
+            self._days.append(cursor.state.game_info["day"])
+            self._turns.append(cursor.state.game_info["turn"])
+            if len(self._deltas) % keyframe_interval == 0:
+                # Build keyframes from the previous one, so they share unchanged entries
+                self._keyframes.append(self._keyframes[-1].apply_deltas(
+                        self._deltas[-keyframe_interval:]))
+
+    def __len__(self):
+        """The number of states, i.e. the number of actions + 1 for the initial state"""
+        return len(self._deltas) + 1
+
+    def state_at(self, action_index):
+        """
+        Returns the AWBWGameState after the first action_index actions have been
+        applied. state_at(0) is the initial state.
+        """
+        if action_index < 0:
+            action_index += len(self)
+        if not 0 <= action_index < len(self):
+            raise IndexError(f"Action index {action_index} out of range")
+        keyframe, offset = divmod(action_index, self.keyframe_interval)
+        state = self._keyframes[keyframe]
+        if offset == 0:
+            return state
+        start = keyframe * self.keyframe_interval
+        return state.apply_deltas(self._deltas[start:start + offset])
+
+    def state_at_end_of(self, day):
+        """Returns the AWBWGameState after the last action of the given day."""
+        index = bisect.bisect_right(self._days, day) - 1
+        if index < 0 or self._days[index] != day:
+            raise KeyError(f"Day {day} is not in the replay")
+        return self.state_at(index)
+
+    def state_at_turn(self, turn):
+        """
+        Returns the AWBWGameState at the start of the given turn, before any of its
+        actions. Turn 0 is the first player's first turn.
+        """
+        index = bisect.bisect_left(self._turns, turn)
+        if index >= len(self._turns) or self._turns[index] != turn:
+            raise KeyError(f"Turn {turn} is not in the replay")
+        return self.state_at(index)
@@ -0,0 +1,238 @@
+"""
+Columnar (struct of arrays) storage of the units in a game state.
+
+Requires numpy, which is an optional dependency of this package.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Bits of the flags column
+MOVED = 1
+CAPTURE = 2
+FIRED = 4
+CARRIED = 8
+SUB_DIVE = 16
+
+_FLAG_FIELDS = {
+    "moved": MOVED,
+    "capture": CAPTURE,
+    "fired": FIRED,
+    "carried": CARRIED,
+    "sub_dive": SUB_DIVE,
+}
+
+# Unit field -> numpy dtype of its column
+_COLUMNS = {
+    "id": "int64",
+    "players_id": "int64",
+    "hit_points": "float64",
+    "cost": "int64",
+    "x": "int32",
+    "y": "int32",
+    "fuel": "int32",
+    "ammo": "int32",
+}
+
+class UnitTable():
+    """
+    Stores the units of a game state as parallel numpy arrays, one per field,
+    so per player aggregates are computed with array operations instead of
+    looping over unit dicts.
+
+    The live units always occupy the first len(table) rows. Removing a unit
+    moves the last row into its place, so row order is not stable.
+
+    Usage, alongside an AWBWReplayCursor:
+
+    cursor = AWBWReplayCursor(replay_initial=replay.game_info())
+    table = UnitTable.from_units(cursor.state.units)
+    for action in replay.actions():
+        table.apply_delta(cursor.apply_action(AWBWGameAction(action)))
+        army_values = table.hp_weighted_values()
+    """
+
+    def __init__(self, capacity=64):
+        """
+        Arguments:
+        - capacity: The initial number of rows to allocate
+        """
+        if np is None:
+            raise ImportError("UnitTable requires numpy")
+        capacity = max(1, capacity)
+        self._columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in _COLUMNS.items()}
+        self._columns["flags"] = np.zeros(capacity, dtype="uint8")
+        # Index of the unit's player in self._player_ids, for bincount
+        self._columns["player_index"] = np.zeros(capacity, dtype="intp")
+        self._player_ids = []
+        self._player_index = {}
+        self._rows = {}
+        self._size = 0
+
+    @classmethod
+    def from_units(cls, units):
+        """
+        Arguments:
+        - units: dict of unit id -> awbw.Unit, such as AWBWGameState.units
+
+        Returns:
+        - A UnitTable holding all the units
+        """
+        table = cls(capacity=2 * len(units))
+        for unit in units.values():
+            table.add(unit)
+        return table
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, u_id):
+        return u_id in self._rows
+
+    def column(self, name):
+        """
+        Returns a read-only view of a column for the live units, in row order.
+        name is one of the unit fields, "flags" or "player_index".
+        """
+        view = self._columns[name][:self._size]
+        view.flags.writeable = False
+        return view
+
+    def row(self, u_id):
+        """Returns the row of the given unit"""
+        return self._rows[u_id]
+
+    @property
+    def player_ids(self):
+        """The player ids seen so far, indexed by the player_index column"""
+        return tuple(self._player_ids)
+
+    def _grow(self):
+        """Doubles the capacity of every column"""
+        for name, column in self._columns.items():
+            grown = np.zeros(2 * len(column), dtype=column.dtype)
+            grown[:len(column)] = column
+            self._columns[name] = grown
+
+    def _set_fields(self, row, fields):
+        """Writes the tracked fields of a unit dict into a row"""
+        columns = self._columns
+        for name, value in fields.items():
+            if name in _COLUMNS:
+                columns[name][row] = value
+                if name == "players_id":
+                    index = self._player_index.get(value)
+                    if index is None:
+                        index = self._player_index[value] = len(self._player_ids)
+                        self._player_ids.append(value)
+                    columns["player_index"][row] = index
+            elif name in _FLAG_FIELDS:
+                if value:
+                    columns["flags"][row] |= _FLAG_FIELDS[name]
+                else:
+                    columns["flags"][row] &= ~_FLAG_FIELDS[name] & 0xFF
+
+    def add(self, unit):
+        """
+        Adds a unit.
+
+        Arguments:
+        - unit: An awbw.Unit, or a dict with at least the "id" field
+        """
+        u_id = unit["id"]
+        if u_id in self._rows:
+            raise KeyError(f"Unit {u_id} is already in the table")
+        if self._size == len(self._columns["id"]):
+            self._grow()
+        row = self._size
+        self._size += 1
+        self._rows[u_id] = row
+        for column in self._columns.values():
+            column[row] = 0
+        self._set_fields(row, unit)
+
+    def update(self, u_id, fields):
+        """Updates the tracked fields of the given unit. Other fields are ignored."""
+        self._set_fields(self._rows[u_id], fields)
+
+    def remove(self, u_id):
+        """Removes the given unit, moving the last row into its place"""
+        row = self._rows.pop(u_id)
+        last = self._size - 1
+        if row != last:
+            for column in self._columns.values():
+                column[row] = column[last]
+            self._rows[int(self._columns["id"][row])] = row
+        self._size = last
+
+    def apply_delta(self, delta):
+        """
+        Applies the unit changes of an awbw.StateDelta, such as the ones
+        returned by AWBWReplayCursor.apply_action.
+        """
+        for u_id in delta.units_removed:
+            self.remove(u_id)
+        for unit in delta.units_created.values():
+            self.add(unit)
+        for u_id, fields in delta.units_changed.items():
+            self.update(u_id, fields)
+
+    def _per_player(self, weights=None):
+        """
+        Sums weights (or counts units) per player, as a dict of player id -> total.
+
+        Destroyed and joined units are kept with 0 hit points, and are left out.
+        """
+        alive = self._columns["hit_points"][:self._size] > 0
+        index = self._columns["player_index"][:self._size][alive]
+        if weights is not None:
+            weights = weights[alive]
+        totals = np.bincount(index, weights=weights, minlength=len(self._player_ids))
+        return {p_id: totals[i].item() for i, p_id in enumerate(self._player_ids)}
+
+    def unit_counts(self):
+        """Returns a dict of player id -> number of units"""
+        return self._per_player()
+
+    def unit_values(self):
+        """Returns a dict of player id -> total cost of their units"""
+        return self._per_player(self._columns["cost"][:self._size])
+
+    def hp_weighted_values(self):
+        """
+        Returns a dict of player id -> total cost of their units scaled by
+        hit points, so a unit at 5/10 hit points counts for half its cost.
+        """
+        size = self._size
+        costs = self._columns["cost"][:size]
+        return self._per_player(costs * self._columns["hit_points"][:size] / 10)
+
+    def apply_hp_change(self, hp_change):
+        """
+        Vectorized equivalent of AWBWGameState._apply_power_action_hp_change.
+
+        Tables which follow an AWBWReplayCursor don't need this, as the hit
+        point changes are already in the deltas. It's for tables updated
+        straight from the actions, without building game states.
+
+        Arguments:
+        - hp_change: The "hpChange" info of a Power action
+
+        Returns:
+        - Array of the ids of the changed units
+        """
+        size = self._size
+        hit_points = self._columns["hit_points"][:size]
+        changed = np.zeros(size, dtype=bool)
+        for hp_type in ["hpGain", "hpLoss"]:
+            if hp_type in hp_change and isinstance(hp_change[hp_type], dict):
+                hp_info = hp_change[hp_type]
+                player_indexes = [i for i, p_id in enumerate(self._player_ids) if p_id in hp_info]
+                # Destroyed units are still in the table, but aren't healed back
+                mask = (np.isin(self._columns["player_index"][:size], player_indexes)
+                        & (hit_points > 0))
+                hit_points[mask] = np.clip(hit_points[mask] + hp_info["hp"], 1, 10)
+                changed |= mask
+        return self._columns["id"][:size][changed].copy()
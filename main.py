@@ -1,17 +1,23 @@
 """Main CLI tool to use the AWBW Replay Parser libraries"""
 
 import argparse
+import concurrent.futures
 import logging
 import os
 import re
 import sys
+import traceback
 import urllib.parse
 import urllib.request
-from collections import defaultdict
-from typing import List
+from typing import List, NamedTuple, Optional
 
 from pathvalidate import sanitize_filepath
 
+from awbw_replay import profiling
+from awbw_replay.analysis import Analyzer, Needs, run_analyzers
+from awbw_replay.heatmap import Heatmap, HeatmapSet
+from awbw_replay.manifest import ResultsManifest
+from awbw_replay.download import Downloader, filename_for
 from awbw_replay.awbw import AWBWGameAction, AWBWGameState
 from awbw_replay.replay import AWBWReplay
 
@@ -21,6 +27,9 @@ EXIT_FAILURE = 1
 # These are just random names for cleaner viewing.
 PLAYER_NAMES = ["Alice", "Bob", "Colin", "Drake", "Eagle", "Flak", "Grit", "Hawke"]
 
+# Bump whenever the analyzers change, to invalidate the results stored in manifests
+ANALYSIS_VERSION = 1
+
 LOGGING_LEVELS = ["CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG", "NOTSET"]
 
 logger = logging.getLogger(__name__)
@@ -47,6 +56,39 @@ def get_args(argv=None):
             type=str,
             default="WARNING",
             choices=LOGGING_LEVELS)
+    parser.add_argument(
+            "--jobs",
+            "-j",
+            help="The number of processes analyzing replays in parallel",
+            type=int,
+            default=1)
+    parser.add_argument(
+            "--manifest",
+            help="The file storing each replay's results, so only new replays are analyzed"
+                 " (default: manifest.jsonl in the download directory)",
+            type=str)
+    parser.add_argument(
+            "--no-manifest",
+            help="Analyze every replay, without reading or writing the manifest",
+            action="store_true")
+    parser.add_argument(
+            "--download-jobs",
+            help="The number of replays downloaded in parallel",
+            type=int,
+            default=4)
+    parser.add_argument(
+            "--requests-per-second",
+            help="The maximum download requests per second to the replay server",
+            type=float,
+            default=2.0)
+    parser.add_argument(
+            "--profile",
+            help="Print where the time was spent parsing the replays",
+            action="store_true")
+    parser.add_argument(
+            "--profile-json",
+            help="Write where the time was spent parsing the replays to this JSON file",
+            metavar="PATH")
 
     return parser.parse_args(argv)
 
@@ -75,14 +117,13 @@ def _get_game_replay_urls_from_url(url: str):
     return ["http://awbw.mooo.com/" + relative_url for relative_url in relative_urls]
 
 def check_if_already_downloaded(url: str, directory: str):
-    filename = os.path.basename(urllib.parse.urlparse(url).path)
-    return os.path.exists(os.path.join(directory, filename))
+    # Downloads are written to a .part file and renamed once complete, so an
+    # interrupted download never exists under the final name
+    return os.path.exists(os.path.join(directory, filename_for(url)))
 
 def download_file_to_dir(url: str, directory: str):
-    filename = os.path.basename(urllib.parse.urlparse(url).path)
-    os.makedirs(directory, exist_ok=True)
-    dest = os.path.join(directory, filename)
-    urllib.request.urlretrieve(url, dest)
+    with Downloader(jobs=1) as downloader:
+        downloader.download(url, directory)
 
 def dump_end_of_day_funds(replay):
     """Parses a replay to generate plots of data"""
@@ -93,12 +134,13 @@ def dump_end_of_day_funds(replay):
     for action in replay.actions():
         # Get the action
         action = AWBWGameAction(replay_action=action)
-        message = [
-            f"turn: {states[-1].game_info['turn']}",
-            f"action_number: {len(states)}",
-            f"action_type: {action.type}",
-        ]
-        logging.debug(" ".join(message))
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            message = [
+                f"turn: {states[-1].game_info['turn']}",
+                f"action_number: {len(states)}",
+                f"action_type: {action.type}",
+            ]
+            logging.debug(" ".join(message))
         # Apply the action to the latest game state
         states.append(states[-1].apply_action(action))
 
@@ -118,26 +160,28 @@ def dump_end_of_day_funds(replay):
         logging.info(player['name'] + " " + str(player['funds']))
 
 
-def calc_firing_coords(action: AWBWGameAction, attackers_coords: defaultdict, defenders_coords: defaultdict):
+def calc_firing_coords(action: AWBWGameAction, attackers_coords: Heatmap,
+                       defenders_coords: Heatmap):
     """Generates coordinates where firing happens"""
     if action.type == AWBWGameAction.Type.FIRE:
         action_infos = action.info[AWBWGameAction.Type.FIRE.value]['combatInfoVision']
         # Each fire action seems to have 2 entries (1 for each player?)
         # Take the one that has visibility into both the attacker and the defender
         for action_info in action_infos.values():
-            if isinstance(action_info['combatInfo']['attacker'], dict) and isinstance(action_info['combatInfo']['defender'], dict):
-                attackers_coords[
-                    (action_info['combatInfo']['attacker']['units_x'],
-                     action_info['combatInfo']['attacker']['units_y'])] += 1
-                defenders_coords[
-                    (action_info['combatInfo']['defender']['units_x'],
-                     action_info['combatInfo']['defender']['units_y'])] += 1
+            if (isinstance(action_info['combatInfo']['attacker'], dict)
+                    and isinstance(action_info['combatInfo']['defender'], dict)):
+                attackers_coords.add_point(
+                    action_info['combatInfo']['attacker']['units_x'],
+                    action_info['combatInfo']['attacker']['units_y'])
+                defenders_coords.add_point(
+                    action_info['combatInfo']['defender']['units_x'],
+                    action_info['combatInfo']['defender']['units_y'])
                 break
             else:
                 continue
 
 
-def calc_move_coords(action: AWBWGameAction, move_coords: defaultdict):
+def calc_move_coords(action: AWBWGameAction, move_coords: HeatmapSet):
     """Generates coordinates where units move"""
     if action.type == AWBWGameAction.Type.MOVE:
         key = 'global'
@@ -145,8 +189,8 @@ def calc_move_coords(action: AWBWGameAction, move_coords: defaultdict):
         if key not in action.info['unit']:
             key = next(iter(action.info['paths'].keys()))
         unit_type = action.info['unit'][key]['units_name']
-        for coord in action.info['paths'][key]:
-            move_coords[unit_type][(coord['x'], coord['y'])] += 1
+        path = action.info['paths'][key]
+        move_coords[unit_type].add([coord['x'] for coord in path], [coord['y'] for coord in path])
 
 
 def add_attacking_days(action: AWBWGameAction, day: int, attacking_turn_counts: List[int]):
@@ -159,53 +203,33 @@ def add_attacking_days(action: AWBWGameAction, day: int, attacking_turn_counts:
             attacking_turn_counts[day] = 1
 
 
-def print_human_readable_coord_frequencies(coords_frequencies):
-    if len(coords_frequencies) == 0:
+def print_human_readable_coord_frequencies(coords_frequencies: Heatmap):
+    counts = coords_frequencies.counts
+    if not counts.any():
         logging.warning("Skipping due to no coordinates")
         return
-    max_value = max(coords_frequencies.values())
-    max_value_digit_length = len(str(max_value))
-    max_x_coord = max(map(lambda k: k[0], list(coords_frequencies.keys())))
-    max_y_coord = max(map(lambda k: k[1], list(coords_frequencies.keys())))
-    out = ""
-    for x in range(max_x_coord):
-        out += "|"
-        for y in range(max_y_coord):
-            value = coords_frequencies[(x, y)]
-            out += str(value).rjust(max_value_digit_length, ' ')
-            out += ", "
-        out += "|\n"
-    print(out)
-
-
-def print_attackers_defenders_coords(attackers_coords: defaultdict, defenders_coords: defaultdict):
-    sorted_attackers_coords = sorted(attackers_coords.items(), key=lambda kv: kv[1], reverse=True)
-    sorted_defenders_coords = sorted(defenders_coords.items(), key=lambda kv: kv[1], reverse=True)
+    max_value_digit_length = len(str(counts.max()))
+    rows = []
+    for row in counts:
+        rows.append("|" + "".join(str(value).rjust(max_value_digit_length, ' ') + ", "
+                                  for value in row) + "|")
+    print("\n".join(rows))
+
 
+def print_attackers_defenders_coords(attackers_coords: Heatmap, defenders_coords: Heatmap):
     print("Attacking coords:")
-    coords_str = ""
-    for coord, count in sorted_attackers_coords:
-        coords_str += str(coord) + " " + str(count) + ";"
-    print(coords_str)
+    print(attackers_coords.to_text())
     print("Defending coords:")
-    coords_str = ""
-    for coord, count in sorted_defenders_coords:
-        coords_str += str(coord) + " " + str(count) + ";"
-    print(coords_str)
+    print(defenders_coords.to_text())
 
     # print_human_readable_coord_frequencies(attackers_coords)
     # print_human_readable_coord_frequencies(defenders_coords)
 
 
-def print_unit_move_coords(unit_to_coord_to_freq: defaultdict):
-    for unit_name in unit_to_coord_to_freq.keys():
-        sorted_unit_to_coord_to_freq = sorted(unit_to_coord_to_freq[unit_name].items(), key=lambda kv: kv[1], reverse=True)
-
+def print_unit_move_coords(unit_to_coord_to_freq: HeatmapSet):
+    for unit_name, heatmap in unit_to_coord_to_freq.items():
         print(unit_name + " coords:")
-        coords_str = ""
-        for coord, count in sorted_unit_to_coord_to_freq:
-            coords_str += str(coord) + " " + str(count) + ";"
-        print(coords_str)
+        print(heatmap.to_text())
 
         # print_human_readable_coord_frequencies(unit_to_coord_to_freq[unit_name])
 
@@ -215,8 +239,9 @@ def print_attacking_day_averages(attacking_day_counts: List[int], num_of_replays
         print("No replays processed")
         return
     for day, attack_count in enumerate(attacking_day_counts):
-        print(format_day(day) + " had on average " + str(round(attack_count / num_of_replays_processed, 2)) + " attacks."
-            " (" + str(attack_count) + " attacks / " + str(num_of_replays_processed) + " games)")
+        print(format_day(day) + " had on average "
+              + str(round(attack_count / num_of_replays_processed, 2)) + " attacks."
+              " (" + str(attack_count) + " attacks / " + str(num_of_replays_processed) + " games)")
     print(str(sum(attacking_day_counts)) + " total attacks")
 
 
@@ -225,6 +250,363 @@ def format_day(day: int):
     return "Day " + str(round(day / 2) + 1) + "." + str(day % 2)
 
 
+def map_bounds(game_info):
+    """
+    Returns the (width, height) covering every building and unit of a replay's
+    game_info(). The game info doesn't have the map size, so this is a lower bound.
+    """
+    width, height = 0, 0
+    for entries in [game_info["buildings"], game_info["units"]]:
+        for entry in entries.values():
+            width = max(width, int(entry["x"]) + 1)
+            height = max(height, int(entry["y"]) + 1)
+    return width, height
+
+
+class MoveCoordsAnalyzer(Analyzer):
+    """Counts how often each unit type moved across each coordinate"""
+
+    NEEDS = Needs.ACTIONS
+
+    def __init__(self):
+        # Unit name -> heatmap of the frequency that unit moved across each coordinate
+        self.unit_to_coord_to_freq = HeatmapSet()
+
+    def start(self, game_info):
+        self.unit_to_coord_to_freq.reserve(*map_bounds(game_info))
+
+    def on_action(self, action, state, delta):
+        calc_move_coords(action, self.unit_to_coord_to_freq)
+
+    def merge(self, other):
+        self.unit_to_coord_to_freq.merge(other.unit_to_coord_to_freq)
+
+    def to_json(self):
+        """Returns the results as JSON serializable data, see from_json"""
+        return self.unit_to_coord_to_freq.to_json()
+
+    @classmethod
+    def from_json(cls, data):
+        """Returns an analyzer with the results of to_json"""
+        analyzer = cls()
+        analyzer.unit_to_coord_to_freq = HeatmapSet.from_json(data)
+        return analyzer
+
+
+class FiringCoordsAnalyzer(Analyzer):
+    """Counts the coordinates of attackers and defenders"""
+
+    NEEDS = Needs.ACTIONS
+
+    def __init__(self):
+        self.attackers_coords = Heatmap()
+        self.defenders_coords = Heatmap()
+
+    def start(self, game_info):
+        width, height = map_bounds(game_info)
+        self.attackers_coords.reserve(width, height)
+        self.defenders_coords.reserve(width, height)
+
+    def on_action(self, action, state, delta):
+        calc_firing_coords(action, self.attackers_coords, self.defenders_coords)
+
+    def merge(self, other):
+        self.attackers_coords.merge(other.attackers_coords)
+        self.defenders_coords.merge(other.defenders_coords)
+
+    def to_json(self):
+        """Returns the results as JSON serializable data, see from_json"""
+        return {
+            "attackers_coords": self.attackers_coords.to_json(),
+            "defenders_coords": self.defenders_coords.to_json(),
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        """Returns an analyzer with the results of to_json"""
+        analyzer = cls()
+        analyzer.attackers_coords = Heatmap.from_json(data["attackers_coords"])
+        analyzer.defenders_coords = Heatmap.from_json(data["defenders_coords"])
+        return analyzer
+
+
+class AttackingDaysAnalyzer(Analyzer):
+    """Counts the attacks on each day"""
+
+    NEEDS = Needs.ACTIONS
+
+    def __init__(self):
+        # turn (day) -> # of attacks on that day
+        self.attacking_day_counts = []
+        self.day = 0
+
+    def start(self, game_info):
+        self.day = 0
+
+    def on_action(self, action, state, delta):
+        add_attacking_days(action, self.day, self.attacking_day_counts)
+        # progress the day
+        if action.type == AWBWGameAction.Type.END:
+            self.day += 1
+
+    def merge(self, other):
+        counts = self.attacking_day_counts
+        counts.extend([0] * (len(other.attacking_day_counts) - len(counts)))
+        for day, count in enumerate(other.attacking_day_counts):
+            counts[day] += count
+
+    def to_json(self):
+        """Returns the results as JSON serializable data, see from_json"""
+        return self.attacking_day_counts
+
+    @classmethod
+    def from_json(cls, data):
+        """Returns an analyzer with the results of to_json"""
+        analyzer = cls()
+        analyzer.attacking_day_counts = list(data)
+        return analyzer
+
+
+class Aggregates():
+    """
+    The analysis results of one or more replays. Results of separate replays
+    are combined with merge(), so replays can be analyzed in any process.
+    """
+
+    def __init__(self):
+        self.move_coords = MoveCoordsAnalyzer()
+        self.firing_coords = FiringCoordsAnalyzer()
+        self.attacking_days = AttackingDaysAnalyzer()
+        self.num_of_replays_processed_successfully = 0
+
+    @property
+    def analyzers(self):
+        """The analyzers to run over each replay"""
+        return [self.move_coords, self.firing_coords, self.attacking_days]
+
+    def merge(self, other):
+        """
+        Adds the results of other into these results.
+
+        Merging results in the order the replays were listed gives the same
+        results (and key order) as analyzing the replays one after another.
+        """
+        for analyzer, other_analyzer in zip(self.analyzers, other.analyzers):
+            analyzer.merge(other_analyzer)
+        self.num_of_replays_processed_successfully += other.num_of_replays_processed_successfully
+
+    def to_json(self):
+        """Returns the results as JSON serializable data, see from_json"""
+        return {
+            "move_coords": self.move_coords.to_json(),
+            "firing_coords": self.firing_coords.to_json(),
+            "attacking_days": self.attacking_days.to_json(),
+            "num_of_replays_processed_successfully": self.num_of_replays_processed_successfully,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        """Returns Aggregates with the results of to_json"""
+        aggregates = cls()
+        aggregates.move_coords = MoveCoordsAnalyzer.from_json(data["move_coords"])
+        aggregates.firing_coords = FiringCoordsAnalyzer.from_json(data["firing_coords"])
+        aggregates.attacking_days = AttackingDaysAnalyzer.from_json(data["attacking_days"])
+        aggregates.num_of_replays_processed_successfully = (
+                data["num_of_replays_processed_successfully"])
+        return aggregates
+
+
+def print_aggregates(aggregates: Aggregates):
+    """Prints the move coords, firing coords and attacking days of the analyzed replays"""
+    print_unit_move_coords(aggregates.move_coords.unit_to_coord_to_freq)
+    print_attackers_defenders_coords(aggregates.firing_coords.attackers_coords,
+                                     aggregates.firing_coords.defenders_coords)
+    print_attacking_day_averages(aggregates.attacking_days.attacking_day_counts,
+                                 aggregates.num_of_replays_processed_successfully)
+
+
+class ReplayResult(NamedTuple):
+    """The outcome of analyze_replay_file"""
+    # None if the replay was skipped before being analyzed
+    aggregates: Optional[Aggregates]
+    # The replay's maps_id, or None if it couldn't be read
+    maps_id: Optional[int]
+    # The formatted traceback if the replay failed
+    error: Optional[str]
+
+    def to_json(self):
+        """Returns the result as JSON serializable data, for the manifest"""
+        return {
+            "aggregates": None if self.aggregates is None else self.aggregates.to_json(),
+            "maps_id": self.maps_id,
+            "error": self.error,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        """Returns the ReplayResult stored by to_json"""
+        aggregates = data["aggregates"]
+        return cls(None if aggregates is None else Aggregates.from_json(aggregates),
+                   data["maps_id"], data["error"])
+
+
+def analyze_replay_file(path: str, map_id: int):
+    """
+    Analyzes a single replay. Runs in worker processes with --jobs, so errors
+    are returned instead of raised or logged.
+
+    Arguments:
+    - path: The replay archive
+    - map_id: The maps_id the replay must have to be analyzed
+
+    Returns:
+    - A ReplayResult. If the replay fails part way through, its aggregates hold
+      the results of the actions before the failure.
+    """
+    aggregates = None
+    maps_id = None
+    try:
+        # Only read the game info header to filter out replays of other maps
+        maps_id = AWBWReplay.peek(path, fields=["maps_id"]).get("maps_id")
+        if maps_id != map_id:
+            return ReplayResult(None, maps_id, None)
+        aggregates = Aggregates()
+        with AWBWReplay(path) as replay:
+            # The analyses only read the actions, so no game states are built
+            run_analyzers(replay, aggregates.analyzers)
+            aggregates.num_of_replays_processed_successfully += 1
+    except Exception: # pylint: disable=broad-except
+        return ReplayResult(aggregates, maps_id, traceback.format_exc())
+    return ReplayResult(aggregates, maps_id, None)
+
+
+def _lookup_result(manifest: ResultsManifest, path: str, map_id: int):
+    """Returns the ReplayResult of a replay stored in the manifest, or None to analyze it"""
+    data = manifest.lookup(path)
+    if data is None:
+        return None
+    result = ReplayResult.from_json(data)
+    if result.error is not None:
+        # Failed in an earlier run, so try it again
+        return None
+    if result.maps_id is not None and result.maps_id != map_id:
+        # Analyzed by an earlier run for another map, so skip it for this one
+        return ReplayResult(None, result.maps_id, None)
+    if result.aggregates is None:
+        # Skipped by an earlier run for another map
+        return None
+    return result
+
+
+def _analyze_serially(paths: List[str], map_id: int):
+    """Yields the ReplayResult of each replay, in order"""
+    for path in paths:
+        yield analyze_replay_file(path, map_id)
+
+
+def _analyze_replay_file_profiled(path: str, map_id: int):
+    """
+    analyze_replay_file for worker processes with profiling enabled.
+
+    Returns:
+    - (ReplayResult, profiling.snapshot() of only this replay)
+    """
+    profiling.reset()
+    result = analyze_replay_file(path, map_id)
+    return result, profiling.snapshot()
+
+
+def _analyze_in_processes(paths: List[str], map_id: int, jobs: int):
+    """
+    Yields the ReplayResult of each replay, in order, analyzing them in jobs
+    processes. If profiling is enabled, it's enabled in the worker processes
+    too, and their measurements are merged into this process's.
+    """
+    profile = profiling.ENABLED
+    if profile:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs,
+                                                          initializer=profiling.enable)
+        analyze = _analyze_replay_file_profiled
+    else:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+        analyze = analyze_replay_file
+    futures = [executor.submit(analyze, path, map_id) for path in paths]
+    try:
+        for future in futures:
+            if profile:
+                result, measurements = future.result()
+                profiling.merge(measurements)
+                yield result
+            else:
+                yield future.result()
+    finally:
+        # Don't start the replays left over if the caller stopped early
+        for future in futures:
+            future.cancel()
+        executor.shutdown()
+
+
+def _merge_result(aggregates: Aggregates, filename: str, result: ReplayResult, map_id: int):
+    """Merges the result of a replay into aggregates, logging skipped and failed replays"""
+    if result.error is None and result.aggregates is None:
+        logger.warning("Replay %s has maps_id %s, expected %s; skipping",
+                       filename, result.maps_id, map_id)
+        return
+    if result.error is not None:
+        logger.error("Bad replay: %s\n%s", filename, result.error.rstrip("\n"))
+    if result.aggregates is not None:
+        aggregates.merge(result.aggregates)
+
+
+def analyze_replays(directory: str, map_id: int, jobs: int = 1,
+                    manifest: Optional[ResultsManifest] = None):
+    """
+    Analyzes every replay in a directory.
+
+    Arguments:
+    - directory: The directory of replay archives
+    - map_id: Replays of other maps are skipped
+    - jobs: The number of processes to analyze replays in. The results are the
+      same whatever the number.
+    - manifest: Optional ResultsManifest. Replays with a stored result aren't
+      analyzed again, and the result of every other replay is stored as soon
+      as it's done, so an interrupted run resumes where it stopped.
+
+    Returns:
+    - The merged Aggregates of every replay
+    """
+    filenames = [file for file in os.listdir(directory) if file.lower().endswith('.zip')]
+    paths = [os.path.join(directory, filename) for filename in filenames]
+    stored = {}
+    if manifest is not None:
+        for path in paths:
+            result = _lookup_result(manifest, path, map_id)
+            if result is not None:
+                stored[path] = result
+        logger.info("%s of %s replays already analyzed", len(stored), len(paths))
+    new_paths = [path for path in paths if path not in stored]
+    if jobs > 1:
+        new_results = _analyze_in_processes(new_paths, map_id, jobs)
+    else:
+        new_results = _analyze_serially(new_paths, map_id)
+
+    aggregates = Aggregates()
+    try:
+        for filename, path in zip(filenames, paths):
+            result = stored.get(path)
+            if result is None:
+                logger.info("Opening %s", filename)
+                result = next(new_results)
+                if manifest is not None:
+                    manifest.record(path, result.to_json())
+            _merge_result(aggregates, filename, result, map_id)
+    finally:
+        new_results.close()
+    if manifest is not None:
+        manifest.compact(keep=paths)
+    return aggregates
+
+
 def main(args):
     """Handles the CLI args to call analyze one or more replays"""
     # Set up root logger for library modules; named logger for this module
@@ -238,59 +620,41 @@ def main(args):
         return EXIT_FAILURE
     logger.info("Map Name: %s", map_name)
 
-    download_directory = sanitize_filepath(f"{args.download_directory if args.download_directory is not None else 'maps'}/{args.map_id}")
+    download_root = args.download_directory if args.download_directory is not None else 'maps'
+    download_directory = sanitize_filepath(f"{download_root}/{args.map_id}")
     logger.info("Download directory: %s", download_directory)
     map_replay_urls = get_game_replay_urls(map_name)
     logger.info("%s replay urls", len(map_replay_urls))
+    new_urls = []
     for url in map_replay_urls:
         if not check_if_already_downloaded(url, download_directory):
-            logger.info("Downloading %s to %s/", url, download_directory)
-            download_file_to_dir(url, download_directory)
+            new_urls.append(url)
         else:
             logger.info("Already downloaded %s to %s/", url, download_directory)
-
-
-    # Unit name -> coordinate -> frequency that unit moved across that coordinate
-    unit_to_coord_to_freq = defaultdict(lambda: defaultdict(int))
-    attackers_coords = defaultdict(int)
-    defenders_coords = defaultdict(int)
-    # turn (day) -> # of attacks on that day
-    attacking_day_counts = []
-    num_of_replays_processed_successfully = 0
-    for filename in [file for file in os.listdir(download_directory) if file.lower().endswith('.zip')]:
-        logger.info("Opening %s", filename)
-        try:
-            with AWBWReplay(os.path.join(download_directory, filename)) as replay:
-                #dump_end_of_day_funds(replay)
-                if replay.game_info()["maps_id"] != args.map_id:
-                    logger.warning("Replay %s has maps_id %s, expected %s; skipping",
-                                   filename, replay.game_info()["maps_id"], args.map_id)
-                    continue
-                states = [AWBWGameState(replay_initial=replay.game_info())]
-                day = 0
-
-                # Generate all the states
-                # States are the way the game looked as the turn ended
-                for action in replay.actions():
-                    # Get the action
-                    action = AWBWGameAction(replay_action=action)
-                    # calculate things for this action
-                    calc_move_coords(action, unit_to_coord_to_freq)
-                    calc_firing_coords(action, attackers_coords, defenders_coords)
-                    add_attacking_days(action, day, attacking_day_counts)
-
-                    # progress the day
-                    if action.type == AWBWGameAction.Type.END:
-                        day += 1
-
-                    # Apply the action to the latest game state
-                    states.append(states[-1].apply_action(action))
-                num_of_replays_processed_successfully += 1
-        except Exception as e:
-            logger.exception("Bad replay: %s", filename)
-    print_unit_move_coords(unit_to_coord_to_freq)
-    print_attackers_defenders_coords(attackers_coords, defenders_coords)
-    print_attacking_day_averages(attacking_day_counts, num_of_replays_processed_successfully)
+    logger.info("Downloading %s replays to %s/", len(new_urls), download_directory)
+    with Downloader(jobs=args.download_jobs,
+                    requests_per_second=args.requests_per_second) as downloader:
+        for url, result in downloader.download_all(new_urls, download_directory):
+            if isinstance(result, Exception):
+                logger.error("Failed to download %s: %s", url, result)
+
+    if args.profile or args.profile_json:
+        profiling.enable()
+    if args.no_manifest:
+        aggregates = analyze_replays(download_directory, args.map_id, jobs=args.jobs)
+    else:
+        manifest_path = args.manifest or os.path.join(download_directory, "manifest.jsonl")
+        with ResultsManifest(manifest_path, version=ANALYSIS_VERSION) as manifest:
+            aggregates = analyze_replays(download_directory, args.map_id, jobs=args.jobs,
+                                         manifest=manifest)
+    print_aggregates(aggregates)
+    if args.profile or args.profile_json:
+        profiling.disable()
+    if args.profile:
+        print(profiling.format_report())
+    if args.profile_json:
+        with open(args.profile_json, "w", encoding="utf-8") as file:
+            profiling.dump(file)
 
     return EXIT_SUCCESS
 
@@ -15,6 +15,8 @@ setup(
     packages=['awbw_replay'],
     # Needed for dependencies
     install_requires=['parse', 'phpserialize'],
+    # For the heatmap and unit_table modules, and main.py
+    extras_require={'numpy': ['numpy>=1.21']},
     # *strongly* suggested for sharing
     version='0.1',
     # The license can be anything you like
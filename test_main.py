@@ -0,0 +1,125 @@
+"""
+Basic unit tests for the main CLI tool on select sample replays.
+
+To run:
+python -m unittest -v
+"""
+
+import contextlib
+import io
+import os
+import re
+import tempfile
+import unittest
+
+import main
+from awbw_replay import profiling
+from awbw_replay.manifest import ResultsManifest
+from awbw_replay.replay import AWBWReplay
+
+# pylint: disable=no-self-use
+
+TEST_REPLAYS_DIR = "replays"
+
+def _output(aggregates):
+    """Returns what main prints for the aggregates"""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        main.print_aggregates(aggregates)
+    return output.getvalue()
+
+def _maps_id(filename):
+    """Returns the maps_id of a sample replay"""
+    return AWBWReplay.peek(os.path.join(TEST_REPLAYS_DIR, filename), fields=["maps_id"])["maps_id"]
+
+class TestAnalyzeReplays(unittest.TestCase):
+    """Tests for analyze_replays"""
+
+    def test_jobs(self):
+        """Test that analyzing replays in processes prints the same as analyzing them serially"""
+        map_id = _maps_id("basic_replay.zip")
+        with self.assertLogs(main.logger, level="WARNING"):
+            serial = main.analyze_replays(TEST_REPLAYS_DIR, map_id)
+        with self.assertLogs(main.logger, level="WARNING"):
+            pooled = main.analyze_replays(TEST_REPLAYS_DIR, map_id, jobs=2)
+        # basic_replay.zip and test_open.zip are of the same map
+        assert serial.num_of_replays_processed_successfully == 2
+        assert _output(pooled) == _output(serial)
+        assert pooled.to_json() == serial.to_json()
+
+    def _profile(self, map_id, jobs):
+        """Returns the profiling report of analyzing the replays of a map"""
+        profiling.enable()
+        try:
+            with self.assertLogs(main.logger, level="WARNING"):
+                main.analyze_replays(TEST_REPLAYS_DIR, map_id, jobs=jobs)
+        finally:
+            profiling.disable()
+        report = profiling.report()
+        profiling.reset()
+        return report
+
+    def test_jobs_profile(self):
+        """Test that the worker processes' profiling measurements are merged"""
+        map_id = _maps_id("basic_replay.zip")
+        serial = self._profile(map_id, jobs=1)
+        pooled = self._profile(map_id, jobs=3)
+        assert pooled["stages"]
+        assert ({name: stats["count"] for name, stats in pooled["stages"].items()}
+                == {name: stats["count"] for name, stats in serial["stages"].items()})
+        assert pooled["counters"] == serial["counters"]
+
+    def test_coords_order(self):
+        """Test that the coords are printed most frequent first, then ordered by x and y"""
+        map_id = _maps_id("standard_replay.zip")
+        with self.assertLogs(main.logger, level="WARNING"):
+            aggregates = main.analyze_replays(TEST_REPLAYS_DIR, map_id)
+        lines = _output(aggregates).split("\n")
+        coords_lines = [lines[i + 1] for i, line in enumerate(lines) if line.endswith("coords:")]
+        assert len(coords_lines) == len(aggregates.move_coords.unit_to_coord_to_freq) + 2
+        for text in coords_lines:
+            coords = [(-int(count), int(x), int(y))
+                      for x, y, count in re.findall(r"\((\d+), (\d+)\) (\d+);", text)]
+            assert coords
+            assert coords == sorted(coords)
+        # The heatmaps are sized from the map up front
+        with AWBWReplay(os.path.join(TEST_REPLAYS_DIR, "standard_replay.zip")) as replay:
+            width, height = main.map_bounds(replay.game_info())
+        shape = aggregates.firing_coords.attackers_coords.counts.shape
+        assert shape[0] >= width and shape[1] >= height
+
+    def test_manifest_other_map(self):
+        """Test that results stored by a run for another map aren't reused"""
+        basic_map_id = _maps_id("basic_replay.zip")
+        standard_map_id = _maps_id("standard_replay.zip")
+        with self.assertLogs(main.logger, level="WARNING"):
+            expected = main.analyze_replays(TEST_REPLAYS_DIR, standard_map_id)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            manifest_path = os.path.join(temp_dir, "manifest.jsonl")
+            with ResultsManifest(manifest_path, version=main.ANALYSIS_VERSION) as manifest:
+                with self.assertLogs(main.logger, level="WARNING"):
+                    main.analyze_replays(TEST_REPLAYS_DIR, basic_map_id, manifest=manifest)
+                with self.assertLogs(main.logger, level="WARNING"):
+                    aggregates = main.analyze_replays(TEST_REPLAYS_DIR, standard_map_id,
+                                                      manifest=manifest)
+        assert aggregates.num_of_replays_processed_successfully == 1
+        assert _output(aggregates) == _output(expected)
+
+    def test_manifest_failed_replay(self):
+        """Test that replays which failed in an earlier run are analyzed again"""
+        map_id = _maps_id("basic_replay.zip")
+        with self.assertLogs(main.logger, level="WARNING"):
+            expected = main.analyze_replays(TEST_REPLAYS_DIR, map_id)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            manifest_path = os.path.join(temp_dir, "manifest.jsonl")
+            with ResultsManifest(manifest_path, version=main.ANALYSIS_VERSION) as manifest:
+                failed = main.ReplayResult(None, map_id, "Traceback ...")
+                manifest.record(os.path.join(TEST_REPLAYS_DIR, "basic_replay.zip"),
+                                failed.to_json())
+                with self.assertLogs(main.logger, level="WARNING"):
+                    aggregates = main.analyze_replays(TEST_REPLAYS_DIR, map_id, manifest=manifest)
+        assert aggregates.num_of_replays_processed_successfully == 2
+        assert _output(aggregates) == _output(expected)
+
+if __name__ == "__main__":
+    unittest.main()